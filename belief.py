@@ -0,0 +1,159 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from game_state import GameState
+from sampler import get_identities, get_identity_to_index, get_remaining_counts
+
+
+class BeliefState:
+    """Probability of every identity for each card in one player's hand, one
+    numpy row per card (oldest first), alongside the boolean candidate sets.
+
+    Each row starts as the card's candidates weighted by the copies that player
+    cannot see; a few rounds of proportional fitting then account for the other
+    cards in the same hand competing for the same copies (a known card holding
+    the last copy rules it out everywhere else).
+
+    The belief is kept up to date action by action: the handle_* methods are
+    called alongside the state's own and adjust the unseen counts by the cards
+    the action revealed. Candidate sets are always replaced rather than
+    mutated, so refresh() only rebuilds the mask row of a card whose set object
+    changed, and refits starting from the previous probabilities.
+    """
+
+    def __init__(
+        self,
+        state: GameState,
+        player_index: Optional[int] = None,
+        use_candidates: bool = True,
+        num_iterations: int = 3,
+    ):
+        self.state = state
+        self.player_index = state.our_player_index if player_index is None else player_index
+        self.use_candidates = use_candidates
+        self.num_iterations = num_iterations
+        self.identities: List[Tuple[int, int]] = get_identities(state.variant_name)
+        self.identity_to_index = get_identity_to_index(state.variant_name)
+
+        # order -> (candidate set the row was built from, mask row)
+        self.mask_cache: Dict[int, Tuple[Set[Tuple[int, int]], np.ndarray]] = {}
+        self.orders: List[int] = []
+        self.counts = get_remaining_counts(state, self.player_index).astype(float)
+        # cards the counts already leave out, since the player can see them
+        self.visible_orders: Set[int] = {
+            card.order
+            for hand_player_index, hand in state.hands.items()
+            if hand_player_index != self.player_index
+            for card in hand
+            if card.suit_index != -1
+        }
+        self.counts_changed = True
+        self.probabilities = np.zeros((0, len(self.identities)))
+
+    def get_constraints(self) -> List[Set[Tuple[int, int]]]:
+        if self.use_candidates:
+            return self.state.all_candidates_list[self.player_index]
+        return self.state.all_possibilities_list[self.player_index]
+
+    def get_indicator(self, identities: Set[Tuple[int, int]]) -> np.ndarray:
+        indicator = np.zeros(len(self.identities))
+        for identity in identities:
+            if identity in self.identity_to_index:
+                indicator[self.identity_to_index[identity]] = 1.0
+        return indicator
+
+    def handle_draw(self, player_index: int, order: int, suit_index: int, rank: int):
+        if player_index != self.player_index and suit_index != -1:
+            self.counts[self.identity_to_index[(suit_index, rank)]] -= 1
+            self.visible_orders.add(order)
+            self.counts_changed = True
+
+    def handle_play(self, player_index: int, order: int, suit_index: int, rank: int):
+        self.handle_reveal(order, suit_index, rank)
+
+    def handle_discard(self, player_index: int, order: int, suit_index: int, rank: int):
+        self.handle_reveal(order, suit_index, rank)
+
+    def handle_reveal(self, order: int, suit_index: int, rank: int):
+        # a card leaving a hand only uses up a copy the player couldn't see yet
+        # if it was one they couldn't see
+        if order in self.visible_orders:
+            self.visible_orders.remove(order)
+        else:
+            self.counts[self.identity_to_index[(suit_index, rank)]] -= 1
+            self.counts_changed = True
+
+    def refresh(self) -> np.ndarray:
+        hand = self.state.hands[self.player_index]
+        constraints = self.get_constraints()
+        orders = [card.order for card in hand]
+
+        changed = orders != self.orders or self.counts_changed
+        mask_cache = {}
+        for order, constraint in zip(orders, constraints):
+            cached = self.mask_cache.get(order)
+            if cached is None or cached[0] is not constraint:
+                cached = (constraint, self.get_indicator(constraint))
+                changed = True
+            mask_cache[order] = cached
+
+        if changed:
+            masks = np.array([mask_cache[order][1] for order in orders]).reshape(
+                len(orders), len(self.identities)
+            )
+            # cards still in hand start from where they were
+            order_to_row = dict(zip(self.orders, self.probabilities))
+            previous = np.array(
+                [order_to_row.get(order, np.zeros(len(self.identities))) for order in orders]
+            ).reshape(masks.shape)
+            self.probabilities = self.fit(masks, np.maximum(self.counts, 0), previous)
+        self.mask_cache = mask_cache
+        self.orders = orders
+        self.counts_changed = False
+        return self.probabilities
+
+    def fit(
+        self, masks: np.ndarray, counts: np.ndarray, previous: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        probabilities = self.normalize(masks * counts, masks)
+        if previous is not None:
+            # rows the previous fit still fits (its identities are all still
+            # allowed and available) are a better start than the counts
+            warm = self.normalize(previous * masks * (counts > 0), masks)
+            keep = np.isclose((previous * masks * (counts > 0)).sum(axis=1), 1)
+            probabilities[keep] = warm[keep]
+        for _ in range(self.num_iterations):
+            # copies left for each card once the rest of the hand takes its share
+            expected_use = probabilities.sum(axis=0)
+            available = np.maximum(counts[None, :] - (expected_use[None, :] - probabilities), 0)
+            probabilities = self.normalize(masks * available, masks)
+        return probabilities
+
+    def normalize(self, weights: np.ndarray, masks: np.ndarray) -> np.ndarray:
+        totals = weights.sum(axis=1, keepdims=True)
+        # a card whose candidates are all accounted for elsewhere falls back to
+        # being uniform over them
+        empty = totals[:, 0] == 0
+        if empty.any():
+            weights = weights.copy()
+            weights[empty] = masks[empty]
+            totals[empty] = np.maximum(masks[empty].sum(axis=1, keepdims=True), 1)
+        return weights / totals
+
+    def get_probability_of(self, identities: Set[Tuple[int, int]]) -> np.ndarray:
+        """P(card is one of identities) for each card in hand, oldest first."""
+        return self.refresh() @ self.get_indicator(identities)
+
+    def get_playable_probabilities(self) -> np.ndarray:
+        return self.get_probability_of(self.state.playables)
+
+    def get_trash_probabilities(self) -> np.ndarray:
+        return self.get_probability_of(self.state.trash)
+
+    def get_critical_probabilities(self) -> np.ndarray:
+        return self.get_probability_of(self.state.criticals)
+
+    def get_card_distribution(self, order: int) -> Dict[Tuple[int, int], float]:
+        row = self.refresh()[self.orders.index(order)]
+        return {self.identities[i]: p for i, p in enumerate(row) if p > 0}
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+import contextlib
+import copy
+import io
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from conventions.encoder import EncoderV1GameState, EncoderV2GameState
+from conventions.h_group import HGroupGameState
+from conventions.reactor import ReactorGameState
+from conventions.ref_sieve import BadRefSieveClue, RefSieveGameState
+from game_state import (
+    COLOR_CLUE,
+    RANK_CLUE,
+    get_all_touched_cards,
+    get_available_color_clues,
+    get_available_rank_clues,
+)
+from test_game_state import create_game_states, give_clue
+
+GAME_STATE_CLASSES = [
+    HGroupGameState,
+    RefSieveGameState,
+    ReactorGameState,
+    EncoderV1GameState,
+    EncoderV2GameState,
+]
+
+
+def time_per_call(fn: Callable, num_reps: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(num_reps):
+        fn()
+    return (time.perf_counter() - t0) / num_reps
+
+
+def get_allocated_bytes(fn: Callable) -> int:
+    # memory still held by whatever fn returns
+    tracemalloc.start()
+    result = fn()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def benchmark_fork(num_players: int = 5, variant_name: str = "Rainbow (6 Suits)", num_reps: int = 200):
+    print(f"GameState.fork() vs copy.deepcopy, {num_players} players, {variant_name}")
+    print(f"{'class':<24}{'deepcopy (us)':>16}{'fork (us)':>12}{'speedup':>10}")
+    for cls in GAME_STATE_CLASSES:
+        with contextlib.redirect_stdout(io.StringIO()):
+            states = create_game_states(num_players, variant_name, cls)
+            give_clue(states, 0, RANK_CLUE, 1, 1)
+        state = states[0]
+        t_deepcopy = time_per_call(lambda: copy.deepcopy(state), num_reps)
+        t_fork = time_per_call(state.fork, num_reps)
+        print(
+            f"{cls.__name__:<24}{t_deepcopy * 1e6:>16.1f}{t_fork * 1e6:>12.1f}"
+            f"{t_deepcopy / t_fork:>9.1f}x"
+        )
+
+
+def copy_reaction_inputs(state: ReactorGameState, target_index: int):
+    # what handle_reactive_clue used to deepcopy for every reactive clue
+    return [
+        copy.deepcopy(x)
+        for x in [
+            state.all_play_orders,
+            state.clued_card_orders,
+            state.all_discard_orders,
+            state.all_candidates_list,
+            state.hands[target_index],
+            state.playables,
+            state.trash,
+        ]
+    ]
+
+
+def benchmark_reaction_view(variant_name: str = "Rainbow (6 Suits)", num_reps: int = 2000):
+    print(f"Reactor reaction snapshot: deepcopy vs ReactionView, 3 players, {variant_name}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        state = create_game_states(3, variant_name, ReactorGameState)[1]
+    print(f"{'snapshot':<16}{'time (us)':>12}{'memory (B)':>12}")
+    for name, fn in [
+        ("deepcopy", lambda: copy_reaction_inputs(state, 2)),
+        ("ReactionView", lambda: state.get_reaction_view(2)),
+    ]:
+        t = time_per_call(fn, num_reps)
+        print(f"{name:<16}{t * 1e6:>12.1f}{get_allocated_bytes(fn):>12}")
+
+
+# The pre-rewrite clue enumeration and ref target lookups, copied verbatim from
+# the baseline RefSieveGameState (with self renamed to state) so that the
+# benchmark measures against the algorithm the shared masks replaced
+def get_index_of_ref_discard_target_baseline(
+    state: RefSieveGameState,
+    target_index: int,
+    clue_type: int,
+    clue_value: int,
+    touched_orders: Optional[List[int]] = None
+) -> Optional[int]:
+    all_touched_cards = get_all_touched_cards(clue_type, clue_value, state.variant_name)
+    if touched_orders is not None:
+        _touched_orders = touched_orders
+    else:
+        _touched_orders = [
+            card.order for card in state.hands[target_index]
+            if card.to_tuple() in all_touched_cards
+        ]
+
+    num_cards_in_hand = len(state.hands[target_index])
+    leftmost_newly_touched = None
+
+    for i, card in enumerate(state.hands[target_index]):
+        if card.order in _touched_orders and card.order not in state.clued_card_orders:
+            leftmost_newly_touched = i
+        
+    if leftmost_newly_touched is None:
+        raise BadRefSieveClue(
+            f"Invalid Ref Discard clue: {target_index} {clue_type} {clue_value}"
+        )
+
+    for j in range(num_cards_in_hand):
+        i = num_cards_in_hand - j - 1
+        if i > leftmost_newly_touched:
+            continue
+
+        card = state.hands[target_index][i]
+        if card.order in state.clued_card_orders:
+            continue
+
+        if card.order in _touched_orders:
+            continue
+
+        return i
+
+    return None
+
+
+def get_index_of_ref_play_target_baseline(
+    state: RefSieveGameState,
+    target_index: int,
+    clue_type: int,
+    clue_value: int,
+    touched_orders: Optional[List[int]] = None
+) -> int:
+    all_touched_cards = get_all_touched_cards(clue_type, clue_value, state.variant_name)
+    if touched_orders is not None:
+        _touched_orders = touched_orders
+    else:
+        _touched_orders = [
+            card.order for card in state.hands[target_index]
+            if card.to_tuple() in all_touched_cards
+        ]
+
+    num_cards_in_hand = len(state.hands[target_index])
+    leftmost_newly_touched = None
+    for i, card in enumerate(state.hands[target_index]):
+        if card.order in _touched_orders and card.order not in state.clued_card_orders:
+            leftmost_newly_touched = i
+        
+    if leftmost_newly_touched is None:
+        raise BadRefSieveClue(
+            f"Invalid Ref Play clue: {target_index} {clue_type} {clue_value}"
+        )
+
+    unclued_indices = [
+        i for i in range(num_cards_in_hand)
+        if state.hands[target_index][i].order not in state.clued_card_orders
+    ]
+    x_to_unclued_indices = dict(enumerate(unclued_indices))
+    unclued_indices_to_x = {idx: x for x, idx in x_to_unclued_indices.items()}
+    newly_clued_indices = [
+        i for i in unclued_indices
+        if state.hands[target_index][i].order in _touched_orders
+    ]
+    shifted_indices = [
+        x_to_unclued_indices[(unclued_indices_to_x[i] + 1) % len(unclued_indices)]
+        for i in newly_clued_indices
+    ]
+    return max(shifted_indices)
+
+
+def get_ref_sieve_clues_baseline(state: RefSieveGameState) -> Dict[Tuple[int, int, int], str]:
+    # (clue_value, clue_type, target_index) -> clue_type
+    result = {}
+    for target_index in range(state.num_players):
+        if target_index == state.our_player_index:
+            continue
+        
+        target_hand = state.hands[target_index]
+        for clue_type in [RANK_CLUE, COLOR_CLUE]:
+            if clue_type == RANK_CLUE:
+                all_clue_values = get_available_rank_clues(state.variant_name)
+            else:
+                color_clues = get_available_color_clues(state.variant_name)
+                all_clue_values = list(range(len(color_clues)))
+
+            for clue_value in all_clue_values:
+                all_touched_cards = get_all_touched_cards(clue_type, clue_value, state.variant_name)
+                touched_cards = state.get_touched_cards(clue_type, clue_value, target_index)
+                if not len(touched_cards):
+                    continue
+
+                touched_card_orders = [card.order for card in touched_cards]
+                newly_touched_cards = [card for card in touched_cards if card.order not in state.clued_card_orders]
+
+                reveals_safe_action = False
+                for c in target_hand:
+                    if c.order in state.all_play_orders:
+                        continue
+
+                    if c.order not in state.clued_card_orders:
+                        continue
+
+                    if c.order not in touched_card_orders:
+                        continue
+
+                    candidates = state.get_candidates(c.order)
+                    new_cands = candidates.intersection(all_touched_cards)
+                    
+                    if state.is_playable(new_cands) or state.is_trash(new_cands):
+                        reveals_safe_action = True
+
+                if reveals_safe_action:
+                    result[(clue_type, clue_value, target_index)] = "SAFE_ACTION"
+                elif len(newly_touched_cards):
+                    if clue_type == RANK_CLUE:
+                        nothing_is_trash = True
+                        for card in newly_touched_cards:
+                            if state.is_weak_trash_card(card):
+                                nothing_is_trash = False
+
+                        if state.every_good_card_of_rank_is_playable(clue_value) and nothing_is_trash:
+                            result[(clue_type, clue_value, target_index)] = "DIRECT_PLAY"
+                        elif state.every_card_of_rank_is_trash(clue_value):
+                            ref_play_index = get_index_of_ref_play_target_baseline(state, target_index, clue_type, clue_value)
+                            playable_card = target_hand[ref_play_index]
+                            if state.is_playable_card(playable_card) and playable_card.to_tuple() not in state.all_play_tuples:
+                                result[(clue_type, clue_value, target_index)] = "REF_PLAY"
+                        else:
+                            ref_discard_index = get_index_of_ref_discard_target_baseline(state, target_index, clue_type, clue_value)
+                            if ref_discard_index is None:
+                                result[(clue_type, clue_value, target_index)] = "LOCK"
+                            else:
+                                result[(clue_type, clue_value, target_index)] = "REF_DISCARD"
+                    else:
+                        ref_play_index = get_index_of_ref_play_target_baseline(state, target_index, clue_type, clue_value)
+                        playable_card = target_hand[ref_play_index]
+                        if state.is_playable_card(playable_card) and playable_card.to_tuple() not in state.all_play_tuples:
+                            result[(clue_type, clue_value, target_index)] = "REF_PLAY"
+
+    return result
+
+
+def benchmark_ref_sieve_clues(num_players: int = 4, num_reps: int = 200):
+    print(f"Ref Sieve clue enumeration: baseline vs shared masks, {num_players} players")
+    print(f"{'variant':<24}{'baseline (us)':>16}{'masks (us)':>12}{'speedup':>10}")
+    for variant_name in ["No Variant", "Rainbow (6 Suits)", "Black (6 Suits)", "Brown (6 Suits)"]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            states = create_game_states(num_players, variant_name, RefSieveGameState)
+            give_clue(states, 0, RANK_CLUE, 1, 1)
+        state = states[0]
+        assert get_ref_sieve_clues_baseline(state) == state.get_ref_sieve_clues()
+        t_baseline = time_per_call(lambda: get_ref_sieve_clues_baseline(state), num_reps)
+        t_masks = time_per_call(state.get_ref_sieve_clues, num_reps)
+        print(
+            f"{variant_name:<24}{t_baseline * 1e6:>16.1f}{t_masks * 1e6:>12.1f}"
+            f"{t_baseline / t_masks:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    benchmark_fork()
+    benchmark_reaction_view()
+    benchmark_ref_sieve_clues()
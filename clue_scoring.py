@@ -0,0 +1,102 @@
+import functools
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from clue_table import ClueTable, get_touched_card_tuples_list
+from game_state import GameState
+from sampler import get_identity_to_index, get_mask, get_remaining_counts
+
+
+@dataclass(frozen=True)
+class ClueWeights:
+    # how much a bit of information about a card is worth, by what the card is
+    critical: float = 3.0
+    playable: float = 2.0
+    trash: float = 0.0
+    other: float = 1.0
+    # bits lost for every trash card a clue newly touches
+    bad_touch: float = 100.0
+
+
+DEFAULT_CLUE_WEIGHTS = ClueWeights()
+# every hat clue is read for its residue, so touching trash costs nothing
+HAT_CLUE_WEIGHTS = ClueWeights(bad_touch=0.0)
+
+
+@functools.lru_cache(maxsize=None)
+def get_touch_matrix(variant_name: str) -> np.ndarray:
+    """(clue x identity) mask of the identities each clue of
+    get_clue_type_values touches."""
+    identity_to_index = get_identity_to_index(variant_name)
+    return get_mask(list(get_touched_card_tuples_list(variant_name)), identity_to_index)
+
+
+def get_entropies(weights: np.ndarray) -> np.ndarray:
+    """Entropy in bits of each distribution along the last axis, given
+    unnormalized weights. Rows that are all zero have no entropy."""
+    totals = weights.sum(axis=-1, keepdims=True)
+    probs = np.divide(weights, totals, out=np.zeros(weights.shape), where=totals > 0)
+    logs = np.log2(probs, out=np.zeros(probs.shape), where=probs > 0)
+    return -(probs * logs).sum(axis=-1)
+
+
+class ClueScores:
+    """Information gain of every clue in a ClueTable. A card's identity is
+    distributed over its candidates in proportion to the copies its holder
+    cannot see, and a clue is worth the drop in entropy it causes, summed over
+    the target's cards and weighted by what each card actually is, minus a
+    penalty for newly touching trash. All clues and cards of a target are
+    evaluated at once on the (clue x card x identity) array.
+
+    Higher is better.
+    """
+
+    def __init__(
+        self,
+        state: GameState,
+        clue_table: Optional[ClueTable] = None,
+        weights: ClueWeights = DEFAULT_CLUE_WEIGHTS,
+    ):
+        self.clue_table = ClueTable(state) if clue_table is None else clue_table
+        self.weights = weights
+        identity_to_index = get_identity_to_index(state.variant_name)
+        touch_matrix = get_touch_matrix(state.variant_name)
+        playables, trash, criticals = state.playables, state.trash, state.criticals
+
+        self.gains: Dict[int, np.ndarray] = {}
+        for target_index in self.clue_table.target_indices:
+            hand = self.clue_table.hands[target_index]
+            counts = get_remaining_counts(state, target_index)
+            # (card x identity)
+            before = get_mask(state.all_candidates_list[target_index], identity_to_index) * counts
+            # (clue x card x identity): a touched card keeps the identities the
+            # clue touches, an untouched one the rest
+            touched_mask = self.clue_table.touched_masks[target_index]
+            after = before[None, :, :] * (
+                touch_matrix[:, None, :] == touched_mask[:, :, None]
+            )
+            card_weights = np.array(
+                [self.get_card_weight(card.to_tuple(), playables, trash, criticals) for card in hand]
+            )
+            gains = (get_entropies(before)[None, :] - get_entropies(after)) @ card_weights
+
+            newly_touched = touched_mask & ~np.array(
+                [state.is_clued(card.order) for card in hand], dtype=bool
+            )
+            trash_touched = newly_touched & self.clue_table.trash_card_masks[target_index]
+            self.gains[target_index] = gains - weights.bad_touch * trash_touched.sum(axis=1)
+
+    def get_card_weight(self, identity: Tuple[int, int], playables, trash, criticals) -> float:
+        if identity in trash:
+            return self.weights.trash
+        weight = self.weights.other
+        if identity in criticals:
+            weight = max(weight, self.weights.critical)
+        if identity in playables:
+            weight = max(weight, self.weights.playable)
+        return weight
+
+    def get_gain(self, clue_type: int, clue_value: int, target_index: int) -> float:
+        return float(self.gains[target_index][self.clue_table.get_index(clue_type, clue_value)])
@@ -0,0 +1,146 @@
+import functools
+import math
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from constants import COLOR_CLUE, RANK_CLUE
+from decision_context import DecisionContext
+from game_state import (
+    Card,
+    GameState,
+    get_all_touched_cards,
+    get_available_color_clues,
+    get_available_rank_clues,
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_clue_type_values(variant_name: str) -> Tuple[Tuple[int, int], ...]:
+    """Every (clue_type, clue_value) of the variant, rank clues first."""
+    return tuple(
+        [(RANK_CLUE, rank) for rank in get_available_rank_clues(variant_name)]
+        + [(COLOR_CLUE, i) for i in range(len(get_available_color_clues(variant_name)))]
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_touched_card_tuples_list(variant_name: str) -> Tuple[FrozenSet[Tuple[int, int]], ...]:
+    """The identities each clue of get_clue_type_values touches."""
+    return tuple(
+        frozenset(get_all_touched_cards(clue_type, clue_value, variant_name))
+        for clue_type, clue_value in get_clue_type_values(variant_name)
+    )
+
+
+class ClueTable:
+    """Every clue that can be given to some teammates, worked out in one pass.
+    For each target there is a (clue x card) touched mask, the candidates each
+    card would be left with after each clue, and whether those are playable or
+    trash. trash and playables are derived once per table (or taken from a
+    DecisionContext), and only candidate sets a clue narrows get new flags.
+
+    Clues are indexed as in get_clue_type_values. The table reflects the state
+    it was built from and must be rebuilt once that state changes.
+    """
+
+    def __init__(
+        self,
+        state: GameState,
+        target_indices: Optional[Iterable[int]] = None,
+        ctx: Optional[DecisionContext] = None,
+    ):
+        self.variant_name = state.variant_name
+        self.clue_type_values = get_clue_type_values(state.variant_name)
+        self.clue_to_index = {x: i for i, x in enumerate(self.clue_type_values)}
+        self.touched_card_tuples_list = get_touched_card_tuples_list(state.variant_name)
+        if target_indices is None:
+            target_indices = [i for i in range(state.num_players) if i != state.our_player_index]
+        self.target_indices = list(target_indices)
+        self.hands = {i: list(state.hands[i]) for i in self.target_indices}
+
+        playables = state.playables if ctx is None else ctx.playables
+        trash = state.trash if ctx is None else ctx.trash
+
+        def get_flags(candidates: Set[Tuple[int, int]]) -> Tuple[bool, bool]:
+            if not len(candidates):
+                return False, False
+            return candidates.issubset(playables), candidates.issubset(trash)
+
+        self.touched_masks: Dict[int, np.ndarray] = {}
+        self.trash_card_masks: Dict[int, np.ndarray] = {}
+        self.new_candidates: Dict[int, List[List[Set[Tuple[int, int]]]]] = {}
+        self.playable_masks: Dict[int, np.ndarray] = {}
+        self.trash_masks: Dict[int, np.ndarray] = {}
+        for target_index in self.target_indices:
+            hand = self.hands[target_index]
+            identities = [card.to_tuple() for card in hand]
+            candidates_list = state.all_candidates_list[target_index]
+            flags_list = [get_flags(candidates) for candidates in candidates_list]
+            touched_rows, flag_rows, new_candidates = [], [], []
+            for touched_card_tuples in self.touched_card_tuples_list:
+                touched_row = [identity in touched_card_tuples for identity in identities]
+                row, flag_row = [], []
+                for touched, candidates, flags in zip(touched_row, candidates_list, flags_list):
+                    if touched:
+                        new = candidates.intersection(touched_card_tuples)
+                    else:
+                        new = candidates.difference(touched_card_tuples)
+                    # candidates the clue doesn't narrow keep their set, and its flags
+                    if len(new) == len(candidates):
+                        row.append(candidates)
+                        flag_row.append(flags)
+                    else:
+                        row.append(new)
+                        flag_row.append(get_flags(new))
+                touched_rows.append(touched_row)
+                flag_rows.append(flag_row)
+                new_candidates.append(row)
+
+            shape = (len(self.clue_type_values), len(hand))
+            flag_array = np.array(flag_rows, dtype=bool).reshape(shape + (2,))
+            self.touched_masks[target_index] = np.array(touched_rows, dtype=bool).reshape(shape)
+            self.trash_card_masks[target_index] = np.array(
+                [identity in trash for identity in identities], dtype=bool
+            )
+            self.new_candidates[target_index] = new_candidates
+            self.playable_masks[target_index] = flag_array[:, :, 0]
+            self.trash_masks[target_index] = flag_array[:, :, 1]
+
+    def get_index(self, clue_type: int, clue_value: int) -> int:
+        return self.clue_to_index[(clue_type, clue_value)]
+
+    def get_clues(self, target_index: int) -> List[Tuple[int, int]]:
+        """(clue_type, clue_value) of every clue that touches something."""
+        touches_any = self.touched_masks[target_index].any(axis=1)
+        return [x for x, touches in zip(self.clue_type_values, touches_any) if touches]
+
+    def get_touched_cards(self, clue_type: int, clue_value: int, target_index: int) -> List[Card]:
+        """Ordering is oldest to newest."""
+        mask = self.touched_masks[target_index][self.get_index(clue_type, clue_value)]
+        return [card for card, touched in zip(self.hands[target_index], mask) if touched]
+
+    def get_touched_orders(self, clue_type: int, clue_value: int, target_index: int) -> List[int]:
+        """Ordering is oldest to newest."""
+        return [card.order for card in self.get_touched_cards(clue_type, clue_value, target_index)]
+
+    def get_new_candidates(
+        self, clue_type: int, clue_value: int, target_index: int
+    ) -> List[Set[Tuple[int, int]]]:
+        return self.new_candidates[target_index][self.get_index(clue_type, clue_value)]
+
+    def get_candidates_product(self, clue_type: int, clue_value: int, target_index: int) -> int:
+        """Product of the number of candidates each non-trash card of the target
+        is left with, i.e. how ambiguous their hand still is after the clue."""
+        i = self.get_index(clue_type, clue_value)
+        return math.prod(
+            len(candidates)
+            for candidates, is_trash in zip(
+                self.new_candidates[target_index][i], self.trash_card_masks[target_index]
+            )
+            if not is_trash
+        )
+
+    def touches_trash(self, clue_type: int, clue_value: int, target_index: int) -> bool:
+        i = self.get_index(clue_type, clue_value)
+        return bool((self.touched_masks[target_index][i] & self.trash_card_masks[target_index]).any())
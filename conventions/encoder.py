@@ -1,3 +1,4 @@
+from clue_table import ClueTable
 from game_state import (
     Card,
     GameState,
@@ -14,14 +15,20 @@ from game_state import (
     get_starting_efficiency,
 )
 
+from mod_table import ModTable, ModTableKey, get_mod_table, get_suit_shape
+from sampler import get_identities, get_identity_to_index
+
 from typing import Callable, Dict, List, Set, Optional, Tuple
 from copy import deepcopy
+import functools
+import numpy as np
 
 
-def get_v1_mod_table(variant_name: str, preferred_modulus=None):
+def get_v1_mod_table(variant_name: str, preferred_modulus=None) -> Optional[ModTable]:
     # trash is marked as (0, 0)
     # playable is marked as (-1, 0)
     # stack x + n is marked as (x, -n)
+    mod_table = None
     num_suits = len(SUITS[variant_name])
     if num_suits == 6:
         if preferred_modulus == 12:
@@ -154,10 +161,11 @@ def get_v1_mod_table(variant_name: str, preferred_modulus=None):
     return mod_table
 
 
-def get_v2_mod_table(variant_name: str, preferred_modulus=None):
+def get_v2_mod_table(variant_name: str, preferred_modulus=None) -> Optional[ModTable]:
     # trash is marked as (0, 0)
     # playable is marked as (-1, 0)
     # stack x + n is marked as (x, -n)
+    mod_table = None
     num_suits = len(SUITS[variant_name])
     dark_suits = [x for x in SUITS[variant_name] if x in DARK_SUIT_NAMES]
     if num_suits == 6:
@@ -328,6 +336,19 @@ def get_v2_mod_table(variant_name: str, preferred_modulus=None):
     return mod_table
 
 
+def get_hand_written_mod_table(key: ModTableKey) -> Optional[ModTable]:
+    """The table above for the suit shape and modulus of key, if there is one.
+    These are what the convention has always been played with, so
+    compile_mod_tables keeps them."""
+    style, num_suits, dark_suit_indices, modulus = key
+    variant_name = next(
+        x for x in SUITS if get_suit_shape(x) == (num_suits, dark_suit_indices)
+    )
+    mod_table_func = {"v1": get_v1_mod_table, "v2": get_v2_mod_table}[style]
+    return mod_table_func(variant_name, preferred_modulus=modulus)
+
+
+@functools.lru_cache(maxsize=None)
 def get_special_hat_clues_dict(variant_name: str):
     all_3color_wr_vars = [
         var
@@ -496,6 +517,101 @@ def get_special_hat_clues_dict(variant_name: str):
     return base_dct.get(variant_name, {})
 
 
+@functools.lru_cache(maxsize=None)
+def get_fillin_residues(variant_name: str, mod_base: int) -> np.ndarray:
+    """Residue of every identity (in get_identities order) used for cards that
+    are already ambiguous: identities are numbered 1, 2, ... suit by suit within
+    each rank, modulo mod_base."""
+    suit_indices, ranks = np.array(get_identities(variant_name)).T
+    residues = (1 + suit_indices + (ranks - 1) * len(SUITS[variant_name])) % mod_base
+    residues.flags.writeable = False
+    return residues
+
+
+def get_residue_masks(residues: np.ndarray, mod_base: int) -> np.ndarray:
+    """(mod_base x identity) table whose row r marks the identities that have
+    residue r. Identities with a negative residue are in no row."""
+    return np.arange(mod_base)[:, None] == residues[None, :]
+
+
+@functools.lru_cache(maxsize=None)
+def get_fillin_residue_masks(variant_name: str, mod_base: int) -> np.ndarray:
+    masks = get_residue_masks(get_fillin_residues(variant_name, mod_base), mod_base)
+    masks.flags.writeable = False
+    return masks
+
+
+def get_masked_identities(variant_name: str, mask: np.ndarray) -> Set[Tuple[int, int]]:
+    identities = get_identities(variant_name)
+    return {identities[i] for i in np.flatnonzero(mask)}
+
+
+def split_hat_clues(
+    clues: Dict[Tuple[int, int, int], List[Card]], rightmost_card: Optional[Card]
+) -> Tuple[Dict[Tuple[int, int, int], List[Card]], Dict[Tuple[int, int, int], List[Card]]]:
+    """Splits rank (or color) clues into those encoding the lower and the higher
+    raw residue of their pair: touching the rightmost card not yet clued that
+    way or not, and when every card has been, the lowest or highest value."""
+    if rightmost_card is None:
+        if not len(clues):
+            return {}, {}
+        lowest = min(clue_value for clue_value, _, _ in clues)
+        highest = max(clue_value for clue_value, _, _ in clues)
+        return (
+            {k: v for k, v in clues.items() if k[0] == lowest},
+            {k: v for k, v in clues.items() if k[0] == highest},
+        )
+    return (
+        {k: v for k, v in clues.items() if rightmost_card in v},
+        {k: v for k, v in clues.items() if rightmost_card not in v},
+    )
+
+
+class HatClueTable:
+    """Every legal hat clue to some teammates, worked out once per target hand:
+    the raw residue each clue encodes, the cards it touches and its
+    evaluate_clue_score. Picking the clues for a residue, or the best of them,
+    is then a dictionary lookup.
+
+    The table reflects the state it was built from and must be rebuilt once
+    that state changes.
+    """
+
+    def __init__(
+        self,
+        state: "BaseEncoderGameState",
+        target_indices: Optional[List[int]] = None,
+        clue_table: Optional[ClueTable] = None,
+    ):
+        if clue_table is None:
+            clue_table = ClueTable(state, target_indices)
+        self.clue_table = clue_table
+        self.target_indices = clue_table.target_indices
+        # target_index -> raw_residue -> (clue_value, clue_type, target_index) -> cards_touched
+        self.residue_to_clues: Dict[int, Dict[int, Dict[Tuple[int, int, int], List[Card]]]] = {
+            target_index: state.get_residue_to_clues(target_index, clue_table)
+            for target_index in self.target_indices
+        }
+        self.scores: Dict[Tuple[int, int, int], int] = {
+            clue: state.evaluate_clue_score(*clue, clue_table)
+            for residue_to_clues in self.residue_to_clues.values()
+            for clues in residue_to_clues.values()
+            for clue in clues
+        }
+
+    def get_clues(
+        self, target_index: int, raw_residue: int
+    ) -> Dict[Tuple[int, int, int], List[Card]]:
+        return dict(self.residue_to_clues[target_index].get(raw_residue, {}))
+
+    def get_best_clue(
+        self, target_index: int, raw_residue: int
+    ) -> Optional[Tuple[int, int, int]]:
+        """The clue for raw_residue with the lowest score, if there is one."""
+        clues = self.residue_to_clues[target_index].get(raw_residue, {})
+        return min(clues, key=self.scores.__getitem__, default=None)
+
+
 class SuperPosition:
     def __init__(
         self,
@@ -530,8 +646,10 @@ class SuperPosition:
 
 
 class BaseEncoderGameState(GameState):
+    journaled_attrs = ("other_info_clued_card_orders",)
+
     def __init__(self, variant_name, player_names, our_player_index, mod_table_func):
-        self.mod_table_func: Callable[[str, int], Dict] = mod_table_func
+        self.mod_table_func: Callable[[str, int], ModTable] = mod_table_func
         super().__init__(variant_name, player_names, our_player_index)
         self.other_info_clued_card_orders["hat_clued_card_orders"] = set()
         self.other_info_clued_card_orders["trashy_orders"] = []
@@ -581,14 +699,10 @@ class BaseEncoderGameState(GameState):
 
     def set_variant_name(self, variant_name: str, num_players: int):
         super().set_variant_name(variant_name, num_players)
-        if num_players == 4:
-            self.mod_table = self.mod_table_func(variant_name, preferred_modulus=12)
-        elif num_players == 5:
-            self.mod_table = self.mod_table_func(variant_name, preferred_modulus=16)
-        elif num_players == 6:
-            self.mod_table = self.mod_table_func(variant_name, preferred_modulus=20)
-        else:
+        if not 2 <= num_players <= 6:
             raise NotImplementedError
+        # 4 residues for each other player
+        self.mod_table = self.mod_table_func(variant_name, 4 * (num_players - 1))
 
     def get_rightmost_unnumbered_card(self, player_index) -> Optional[Card]:
         for card in self.hands[player_index]:  # iterating oldest to newest
@@ -678,6 +792,14 @@ class BaseEncoderGameState(GameState):
 
         return result
 
+    def get_residues(self) -> np.ndarray:
+        """identity_to_residue as an array in get_identities order, with -1 for
+        identities that have no residue."""
+        identity_to_residue = self.identity_to_residue
+        return np.array(
+            [identity_to_residue.get(x, -1) for x in get_identities(self.variant_name)]
+        )
+
     @property
     def residue_to_identities(self) -> Dict[int, Set[Tuple[int, int]]]:
         result = {}
@@ -720,15 +842,65 @@ class BaseEncoderGameState(GameState):
             )
         return all_possible_clues_dict
 
+    def get_residue_to_clues(
+        self, target_index: int, clue_table: ClueTable
+    ) -> Dict[int, Dict[Tuple[int, int, int], List[Card]]]:
+        """raw_residue -> {(clue_value, clue_type, target_index): cards_touched}
+        of every clue to target_index that touches something. The inverse of
+        get_hat_residue."""
+        touched = {
+            (clue_value, clue_type, target_index): clue_table.get_touched_cards(
+                clue_type, clue_value, target_index
+            )
+            for clue_type, clue_value in clue_table.get_clues(target_index)
+        }
+        clue_mappings = self.get_special_hat_clues(target_index, clue_mapping_only=True)
+        if clue_mappings is not None:
+            return {
+                raw_residue: {
+                    (clue_value, clue_type, target_index): touched[
+                        (clue_value, clue_type, target_index)
+                    ]
+                    for clue_type, clue_value in clue_type_values
+                    if (clue_value, clue_type, target_index) in touched
+                }
+                for raw_residue, clue_type_values in clue_mappings.items()
+            }
+
+        if self.num_residues_per_player != 4:
+            raise NotImplementedError
+
+        rank_clues = {k: v for k, v in touched.items() if k[1] == RANK_CLUE}
+        color_clues = {k: v for k, v in touched.items() if k[1] == COLOR_CLUE}
+        result = {}
+        if is_brownish_pinkish(self.variant_name):
+            result[0] = {k: v for k, v in rank_clues.items() if k[0] in {1, 3, 5}}
+            result[1] = {k: v for k, v in rank_clues.items() if k[0] in {2, 4}}
+        else:
+            result[0], result[1] = split_hat_clues(
+                rank_clues, self.get_rightmost_unnumbered_card(target_index)
+            )
+
+        if is_whiteish_rainbowy(self.variant_name):
+            num_colors = len(get_available_color_clues(self.variant_name))
+            if num_colors not in {2, 4, 5, 6}:
+                raise NotImplementedError
+            result[2] = {k: v for k, v in color_clues.items() if k[0] % 2 == 0}
+            result[3] = {k: v for k, v in color_clues.items() if k[0] % 2 == 1}
+        else:
+            result[2], result[3] = split_hat_clues(
+                color_clues, self.get_rightmost_uncolored_card(target_index)
+            )
+        return result
+
     def get_legal_clues_helper(
-        self, sum_of_residues: int
+        self, sum_of_residues: int, hat_clue_table: Optional[HatClueTable] = None
     ) -> Dict[Tuple[int, int, int], Set[Tuple[int, int]]]:
         num_residues = self.num_residues_per_player
         target_index = (
             self.our_player_index + 1 + (sum_of_residues // num_residues)
         ) % self.num_players
         raw_residue = sum_of_residues % num_residues
-        target_hand = self.hands[target_index]
 
         assert target_index != self.our_player_index
         print(
@@ -737,175 +909,20 @@ class BaseEncoderGameState(GameState):
             "target_index",
             target_index,
         )
-        maybe_special_hat_clues = self.get_special_hat_clues(target_index)
-        if maybe_special_hat_clues is not None:
-            return maybe_special_hat_clues[raw_residue]
-
-        if num_residues == 4:
-            if raw_residue in {0, 1}:
-                if is_brownish_pinkish(self.variant_name):
-                    if raw_residue == 0:
-                        return self.get_cards_touched_dict(
-                            target_index,
-                            [(RANK_CLUE, 1), (RANK_CLUE, 3), (RANK_CLUE, 5)],
-                        )
-                    else:
-                        return self.get_cards_touched_dict(
-                            target_index,
-                            [(RANK_CLUE, 2), (RANK_CLUE, 4)],
-                        )
-                else:
-                    rightmost_unnumbered = self.get_rightmost_unnumbered_card(
-                        target_index
-                    )
-                    rank_to_cards_touched = {}
-                    for clue_value in get_available_rank_clues(self.variant_name):
-                        cards_touched = get_all_touched_cards(
-                            RANK_CLUE, clue_value, self.variant_name
-                        )
-                        cards_touched_in_target_hand = [
-                            card
-                            for card in target_hand
-                            if (card.suit_index, card.rank) in cards_touched
-                        ]
-                        if len(cards_touched_in_target_hand):
-                            rank_to_cards_touched[
-                                clue_value
-                            ] = cards_touched_in_target_hand
-
-                    if rightmost_unnumbered is None:
-                        clue_rank = (
-                            min(rank_to_cards_touched)
-                            if raw_residue == 0
-                            else max(rank_to_cards_touched)
-                        )
-                        return {
-                            (clue_value, RANK_CLUE, target_index): cards_touched
-                            for clue_value, cards_touched in rank_to_cards_touched.items()
-                            if clue_value == clue_rank
-                        }
-                    else:
-                        if raw_residue == 0:
-                            return {
-                                (clue_value, RANK_CLUE, target_index): cards_touched
-                                for clue_value, cards_touched in rank_to_cards_touched.items()
-                                if rightmost_unnumbered in cards_touched
-                            }
-                        else:
-                            return {
-                                (clue_value, RANK_CLUE, target_index): cards_touched
-                                for clue_value, cards_touched in rank_to_cards_touched.items()
-                                if rightmost_unnumbered not in cards_touched
-                            }
-
-            elif raw_residue in {2, 3}:
-                if is_whiteish_rainbowy(self.variant_name):
-                    num_colors = len(get_available_color_clues(self.variant_name))
-                    if num_colors in {2, 4, 5, 6}:
-                        color_to_cards_touched = {}
-                        clue_values = [
-                            x for x in range(num_colors) if (x - raw_residue) % 2 == 0
-                        ]
-                        for clue_value in clue_values:
-                            cards_touched = get_all_touched_cards(
-                                COLOR_CLUE, clue_value, self.variant_name
-                            )
-                            cards_touched_in_target_hand = [
-                                card
-                                for card in target_hand
-                                if (card.suit_index, card.rank) in cards_touched
-                            ]
-                            if len(cards_touched_in_target_hand):
-                                color_to_cards_touched[
-                                    clue_value
-                                ] = cards_touched_in_target_hand
-
-                        return {
-                            (clue_value, COLOR_CLUE, target_index): cards_touched
-                            for clue_value, cards_touched in color_to_cards_touched.items()
-                        }
-                    else:
-                        raise NotImplementedError
-                else:
-                    rightmost_uncolored = self.get_rightmost_uncolored_card(
-                        target_index
-                    )
-                    # iterate over color clues
-                    color_to_cards_touched = {}
-                    for clue_value, _ in enumerate(
-                        get_available_color_clues(self.variant_name)
-                    ):
-                        cards_touched = get_all_touched_cards(
-                            COLOR_CLUE, clue_value, self.variant_name
-                        )
-                        cards_touched_in_target_hand = [
-                            card
-                            for card in target_hand
-                            if (card.suit_index, card.rank) in cards_touched
-                        ]
-                        if len(cards_touched_in_target_hand):
-                            color_to_cards_touched[
-                                clue_value
-                            ] = cards_touched_in_target_hand
-
-                    if rightmost_uncolored is None:
-                        clue_color = (
-                            min(color_to_cards_touched)
-                            if raw_residue == 2
-                            else max(color_to_cards_touched)
-                        )
-                        return {
-                            (clue_value, COLOR_CLUE, target_index): cards_touched
-                            for clue_value, cards_touched in color_to_cards_touched.items()
-                            if clue_value == clue_color
-                        }
-                    else:
-                        if raw_residue == 2:
-                            return {
-                                (clue_value, COLOR_CLUE, target_index): cards_touched
-                                for clue_value, cards_touched in color_to_cards_touched.items()
-                                if rightmost_uncolored in cards_touched
-                            }
-                        else:
-                            return {
-                                (clue_value, COLOR_CLUE, target_index): cards_touched
-                                for clue_value, cards_touched in color_to_cards_touched.items()
-                                if rightmost_uncolored not in cards_touched
-                            }
-
-        elif num_residues == 3:
-            raise NotImplementedError
-        else:
-            raise NotImplementedError
+        if hat_clue_table is None:
+            hat_clue_table = HatClueTable(self, [target_index])
+        return hat_clue_table.get_clues(target_index, raw_residue)
 
     def get_legal_clues(self) -> Dict[Tuple[int, int, int], Set[Tuple[int, int]]]:
         # (clue_value, clue_type, target_index) -> cards_touched
         raise NotImplementedError
 
-    def evaluate_clue_score(self, clue_value, clue_type, target_index) -> int:
-        all_cards_touched_by_clue = get_all_touched_cards(
-            clue_type, clue_value, self.variant_name
-        )
-        good_card_indices = [
-            i
-            for i in range(len(self.hands[target_index]))
-            if not self.is_trash_card(self.hands[target_index][i])
-        ]
-        candidates_list = self.all_candidates_list[target_index]
-        score = 1
-
-        for i in good_card_indices:
-            if self.hands[target_index][i].to_tuple() in all_cards_touched_by_clue:
-                new_candidates = candidates_list[i].intersection(
-                    all_cards_touched_by_clue
-                )
-            else:
-                new_candidates = candidates_list[i].difference(
-                    all_cards_touched_by_clue
-                )
-            score *= len(new_candidates)
-
-        return score
+    def evaluate_clue_score(
+        self, clue_value, clue_type, target_index, clue_table: Optional[ClueTable] = None
+    ) -> int:
+        if clue_table is None:
+            clue_table = ClueTable(self, [target_index])
+        return clue_table.get_candidates_product(clue_type, clue_value, target_index)
 
     def get_hat_residue(
         self,
@@ -999,8 +1016,18 @@ class BaseEncoderGameState(GameState):
 
 
 class EncoderV2GameState(BaseEncoderGameState):
+    journaled_attrs = BaseEncoderGameState.journaled_attrs + (
+        "ambiguous_residue_orders",
+        "last_hat_clue_notes",
+    )
+
     def __init__(self, variant_name, player_names, our_player_index):
-        super().__init__(variant_name, player_names, our_player_index, get_v2_mod_table)
+        super().__init__(
+            variant_name,
+            player_names,
+            our_player_index,
+            functools.partial(get_mod_table, "v2"),
+        )
         self.ambiguous_residue_orders: Set[int] = set()
         self.last_hat_clue_notes: Dict[int, Set[Tuple[int, int]]] = {}
         self.all_encoder_filtrations_list: Dict[int, List[Set[Tuple[int, int]]]] = {}
@@ -1013,9 +1040,7 @@ class EncoderV2GameState(BaseEncoderGameState):
         if self.clue_tokens == 8 and starting_eff < 1.36:
             return False
 
-        good_cards_remaining = {
-            x for x in get_all_cards(self.variant_name) if x not in self.trash
-        }
+        good_cards_remaining = get_all_cards(self.variant_name).difference(self.trash)
         all_fully_known_card_orders = self.get_all_fully_known_card_orders()
         for suit_index, rank in good_cards_remaining:
             if (suit_index, rank) not in all_fully_known_card_orders:
@@ -1047,6 +1072,35 @@ class EncoderV2GameState(BaseEncoderGameState):
 
         return None, False
 
+    def get_hat_targets(
+        self, player_indices: List[int], residues: Optional[np.ndarray] = None
+    ) -> Tuple[List[Tuple[int, Card, bool]], np.ndarray]:
+        """Hat clue target (player_index, card, is_ambig) of each of player_indices
+        that has one, and an array of their residues. Ambiguous targets take
+        their fill-in residue, the rest the one in residues (by default
+        get_residues)."""
+        if residues is None:
+            residues = self.get_residues()
+
+        targets = []
+        for player_index in player_indices:
+            card, is_ambig = self.get_hat_clue_target(player_index)
+            if card is not None:
+                targets.append((player_index, card, is_ambig))
+
+        identity_to_index = get_identity_to_index(self.variant_name)
+        indices = np.array(
+            [identity_to_index[card.to_tuple()] for _, card, _ in targets], dtype=int
+        )
+        is_ambig = np.array([is_ambig for _, _, is_ambig in targets], dtype=bool)
+        target_residues = np.where(
+            is_ambig,
+            get_fillin_residues(self.variant_name, self.mod_base)[indices],
+            residues[indices],
+        )
+        assert (target_residues >= 0).all()
+        return targets, target_residues
+
     def get_nonglobal_candidates(
         self, player_index, identities, new_candidates
     ) -> Set[Tuple[int, int]]:
@@ -1063,14 +1117,15 @@ class EncoderV2GameState(BaseEncoderGameState):
             if len(self.all_candidates_list[pindex][i]) == 1 and pindex != player_index
         ]
 
+        all_max_num_cards = self.max_num_cards
         for suit_index, rank in identities:
-            if (suit_index, rank) not in self.max_num_cards:
+            if (suit_index, rank) not in all_max_num_cards:
                 continue
             num_singletons_held = player_singletons.count(
                 (suit_index, rank)
             ) + other_singletons.count((suit_index, rank))
             num_discarded = self.discards.get((suit_index, rank), 0)
-            max_num_cards = self.max_num_cards[(suit_index, rank)]
+            max_num_cards = all_max_num_cards[(suit_index, rank)]
             if (
                 (suit_index, rank) not in new_candidates
                 and num_discarded + num_singletons_held < max_num_cards
@@ -1095,60 +1150,36 @@ class EncoderV2GameState(BaseEncoderGameState):
             return touched_cards
 
         order_to_index = self.order_to_index
-        identity_to_residue = self.identity_to_residue
-        residue_to_identities = self.residue_to_identities
+        residues = self.get_residues()
+        residue_masks = get_residue_masks(residues, self.mod_base)
+        fillin_residue_masks = get_fillin_residue_masks(self.variant_name, self.mod_base)
         hat_residue = self.get_hat_residue(
             clue_giver, target_index, clue_type, clue_value, card_orders
         )
 
-        sum_of_others_residues = 0
-        for player_index, hand in self.hands.items():
-            if player_index in {self.our_player_index, clue_giver}:
-                continue
-
-            hat_clue_target, is_ambig = self.get_hat_clue_target(player_index)
-            if hat_clue_target is None:
-                continue
-
+        targets, other_residues = self.get_hat_targets(
+            [x for x in self.hands if x not in {self.our_player_index, clue_giver}],
+            residues,
+        )
+        implied_masks = np.where(
+            np.array([is_ambig for _, _, is_ambig in targets], dtype=bool)[:, None],
+            fillin_residue_masks[other_residues],
+            residue_masks[other_residues],
+        )
+        sum_of_others_residues = int(other_residues.sum())
+        for (player_index, hat_clue_target, is_ambig), other_res, implied_mask in zip(
+            targets, other_residues.tolist(), implied_masks
+        ):
             _, i = order_to_index[hat_clue_target.order]
-            candidates = self.all_candidates_list[player_index][i]
+            implied_ids = get_masked_identities(self.variant_name, implied_mask)
+            new_candidates = self.all_candidates_list[player_index][i].intersection(
+                implied_ids
+            )
+            in_base_filtration = implied_ids.intersection(
+                self.all_base_filtrations[player_index][i]
+            )
             if is_ambig:
-                other_res = 0
-                card_res = (
-                    1
-                    + hat_clue_target.suit_index
-                    + (hat_clue_target.rank - 1) * len(SUITS[self.variant_name])
-                )
-                other_res = card_res % self.mod_base
-                fillin_candidates = {
-                    (suit_index, rank)
-                    for (suit_index, rank) in get_all_cards(self.variant_name)
-                    if (
-                        1
-                        + suit_index
-                        + (rank - 1) * len(SUITS[self.variant_name])
-                        - other_res
-                    )
-                    % self.mod_base
-                    == 0
-                }
-                new_candidates = candidates.intersection(fillin_candidates)
-                in_base_filtration = {
-                    x
-                    for x in fillin_candidates
-                    if x in self.all_base_filtrations[player_index][i]
-                }
                 self.ambiguous_residue_orders.remove(hat_clue_target.order)
-            else:
-                other_res = identity_to_residue[hat_clue_target.to_tuple()]
-                new_candidates = candidates.intersection(
-                    residue_to_identities[other_res]
-                )
-                in_base_filtration = {
-                    x
-                    for x in residue_to_identities[other_res]
-                    if x in self.all_base_filtrations[player_index][i]
-                }
 
             nonglobal_candidates = self.get_nonglobal_candidates(
                 player_index, in_base_filtration, new_candidates
@@ -1164,7 +1195,7 @@ class EncoderV2GameState(BaseEncoderGameState):
                 self.ambiguous_residue_orders.add(hat_clue_target.order)
 
             if len(new_candidates):
-                self.all_candidates_list[player_index][i] = new_candidates
+                self.set_candidates(player_index, i, new_candidates)
                 note = f" ({other_res})"
                 if hat_clue_target.order in self.ambiguous_residue_orders:
                     note += " [?]"
@@ -1179,7 +1210,6 @@ class EncoderV2GameState(BaseEncoderGameState):
 
             player_name = self.player_names[player_index]
             print(f"{player_name} {hat_clue_target} has residue {other_res}")
-            sum_of_others_residues += other_res
 
         if self.our_player_index != clue_giver:
             my_residue = (hat_residue - sum_of_others_residues) % self.mod_base
@@ -1191,36 +1221,21 @@ class EncoderV2GameState(BaseEncoderGameState):
                 )
 
             _, my_i = order_to_index[my_hat_target.order]
-            my_candidates = self.our_candidates[my_i]
             if my_is_ambig:
-                fillin_candidates = {
-                    (suit_index, rank)
-                    for (suit_index, rank) in get_all_cards(self.variant_name)
-                    if (
-                        1
-                        + suit_index
-                        + (rank - 1) * len(SUITS[self.variant_name])
-                        - my_residue
-                    )
-                    % self.mod_base
-                    == 0
-                }
-                print(f"Fill-in candidates: {fillin_candidates}")
-                new_candidates = my_candidates.intersection(fillin_candidates)
-                my_in_base_filtration = {
-                    x for x in fillin_candidates if x in self.our_base_filtrations[my_i]
-                }
+                my_implied_ids = get_masked_identities(
+                    self.variant_name, fillin_residue_masks[my_residue]
+                )
+                print(f"Fill-in candidates: {my_implied_ids}")
                 self.ambiguous_residue_orders.remove(my_hat_target.order)
             else:
-                print(f"Hat candidates: {residue_to_identities[my_residue]}")
-                new_candidates = my_candidates.intersection(
-                    residue_to_identities[my_residue]
+                my_implied_ids = get_masked_identities(
+                    self.variant_name, residue_masks[my_residue]
                 )
-                my_in_base_filtration = {
-                    x
-                    for x in residue_to_identities[my_residue]
-                    if x in self.our_base_filtrations[my_i]
-                }
+                print(f"Hat candidates: {my_implied_ids}")
+            new_candidates = self.our_candidates[my_i].intersection(my_implied_ids)
+            my_in_base_filtration = my_implied_ids.intersection(
+                self.our_base_filtrations[my_i]
+            )
 
             my_nonglobal_candidates = self.get_nonglobal_candidates(
                 self.our_player_index, my_in_base_filtration, new_candidates
@@ -1233,7 +1248,7 @@ class EncoderV2GameState(BaseEncoderGameState):
                 self.ambiguous_residue_orders.add(my_hat_target.order)
 
             if len(new_candidates):
-                self.all_candidates_list[self.our_player_index][my_i] = new_candidates
+                self.set_candidates(self.our_player_index, my_i, new_candidates)
                 note = f" ({my_residue})"
                 if my_hat_target.order in self.ambiguous_residue_orders:
                     note += " [?]"
@@ -1279,26 +1294,10 @@ class EncoderV2GameState(BaseEncoderGameState):
         if not self.should_interpret_hat_clue:
             return self.get_all_possible_clues_dict()
 
-        sum_of_residues = 0
-        identity_to_residue = self.identity_to_residue
-        for player_index, hand in self.hands.items():
-            if player_index == self.our_player_index:
-                continue
-
-            hat_target, is_ambig = self.get_hat_clue_target(player_index)
-            if hat_target is None:
-                continue
-
-            if is_ambig:
-                card_res = (
-                    1
-                    + hat_target.suit_index
-                    + (hat_target.rank - 1) * len(SUITS[self.variant_name])
-                )
-                sum_of_residues += card_res % self.mod_base
-            else:
-                sum_of_residues += identity_to_residue[hat_target.to_tuple()]
-
+        _, residues = self.get_hat_targets(
+            [x for x in self.hands if x != self.our_player_index]
+        )
+        sum_of_residues = int(residues.sum())
         sum_of_residues = sum_of_residues % self.mod_base
         return self.get_legal_clues_helper(sum_of_residues)
 
@@ -1364,8 +1363,19 @@ class EncoderV2GameState(BaseEncoderGameState):
 
 
 class EncoderV1GameState(BaseEncoderGameState):
+    journaled_attrs = BaseEncoderGameState.journaled_attrs + (
+        "superpositions",
+        "identities_called_to_play",
+        "play_order_queue",
+    )
+
     def __init__(self, variant_name, player_names, our_player_index):
-        super().__init__(variant_name, player_names, our_player_index, get_v1_mod_table)
+        super().__init__(
+            variant_name,
+            player_names,
+            our_player_index,
+            functools.partial(get_mod_table, "v1"),
+        )
         self.superpositions: Dict[int, SuperPosition] = {}  # order -> SuperPosition
         self.identities_called_to_play: Set[Tuple[int, int]] = set()
         self.play_order_queue: List[int] = []
@@ -1410,8 +1420,8 @@ class EncoderV1GameState(BaseEncoderGameState):
                 print(
                     self.our_player_name, i, sp_order, "New candidates", new_candidates
                 )
-                self.our_candidates[i] = self.our_possibilities[i].intersection(
-                    new_candidates
+                self.set_candidates(
+                    self.our_player_index, i, self.our_possibilities[i].intersection(new_candidates)
                 )
                 if superposition.get_updated_residue(self.mod_base) == 0:
                     self.trashy_orders.append(sp_order)
@@ -1456,8 +1466,8 @@ class EncoderV1GameState(BaseEncoderGameState):
                     rewrite_note = True
                 superposition.triggering_orders.remove(order)
                 new_candidates = superposition.get_sp_identities()
-                self.our_candidates[i] = self.our_possibilities[i].intersection(
-                    new_candidates
+                self.set_candidates(
+                    self.our_player_index, i, self.our_possibilities[i].intersection(new_candidates)
                 )
                 if superposition.get_updated_residue(self.mod_base) == 0:
                     self.trashy_orders.append(sp_order)
@@ -1483,6 +1493,41 @@ class EncoderV1GameState(BaseEncoderGameState):
 
         return super().handle_discard(player_index, order, suit_index, rank)
 
+    def get_hat_targets(
+        self,
+        player_indices: List[int],
+        identities_called_to_play: Set[Tuple[int, int]],
+        residues: Optional[np.ndarray] = None,
+    ) -> Tuple[List[Card], np.ndarray]:
+        """Leftmost non-hat-clued card of each of player_indices that has one, and
+        an array of their residues (by default from get_residues). A playable
+        card whose identity was already called to play has residue 0 unless
+        dupes can be clued as plays; other playables are added to
+        identities_called_to_play."""
+        if residues is None:
+            residues = self.get_residues()
+
+        cards = []
+        for player_index in player_indices:
+            card = self.get_leftmost_non_hat_clued_card(player_index)
+            if card is not None:
+                cards.append(card)
+
+        identity_to_index = get_identity_to_index(self.variant_name)
+        target_residues = residues[
+            np.array([identity_to_index[x.to_tuple()] for x in cards], dtype=int)
+        ]
+        assert (target_residues >= 0).all()
+        for k, card in enumerate(cards):
+            if not self.is_playable_card(card):
+                continue
+            identity = card.to_tuple()
+            if identity in identities_called_to_play and not self.can_clue_dupes_as_plays:
+                target_residues[k] = 0
+            else:
+                identities_called_to_play.add(identity)
+        return cards, target_residues
+
     def handle_clue(
         self,
         clue_giver: int,
@@ -1492,54 +1537,43 @@ class EncoderV1GameState(BaseEncoderGameState):
         card_orders,
     ):
         order_to_index = self.order_to_index
-        identity_to_residue = self.identity_to_residue
-        residue_to_identities = self.residue_to_identities
+        residues = self.get_residues()
+        residue_masks = get_residue_masks(residues, self.mod_base)
         hat_residue = self.get_hat_residue(
             clue_giver, target_index, clue_type, clue_value, card_orders
         )
-        triggering_orders = set()
 
-        sum_of_others_residues = 0
         print(f"Identities called to play: {self.identities_called_to_play}")
-        for player_index, hand in self.hands.items():
-            if player_index in {self.our_player_index, clue_giver}:
-                continue
-
-            left_non_hat_clued = self.get_leftmost_non_hat_clued_card(player_index)
-            if left_non_hat_clued is None:
-                continue
-
-            identity = left_non_hat_clued.to_tuple()
-            if self.is_playable_card(left_non_hat_clued):
-                triggering_orders.add(left_non_hat_clued.order)
-                if (
-                    identity in self.identities_called_to_play
-                    and not self.can_clue_dupes_as_plays
-                ):
-                    other_residue = 0
-                else:
-                    other_residue = identity_to_residue[identity]
-                    self.identities_called_to_play.add(identity)
-            else:
-                other_residue = identity_to_residue[identity]
-
+        called_to_play = set(self.identities_called_to_play)
+        cards, other_residues = self.get_hat_targets(
+            [x for x in self.hands if x not in {self.our_player_index, clue_giver}],
+            self.identities_called_to_play,
+            residues,
+        )
+        triggering_orders = {x.order for x in cards if self.is_playable_card(x)}
+        sum_of_others_residues = int(other_residues.sum())
+        for left_non_hat_clued, other_residue in zip(cards, other_residues.tolist()):
+            player_index, i = order_to_index[left_non_hat_clued.order]
             print(
                 f"{self.player_names[player_index]} {left_non_hat_clued} "
                 f"has residue {other_residue}."
             )
-            sum_of_others_residues += other_residue
 
-            _, i = order_to_index[left_non_hat_clued.order]
-            implied_ids = residue_to_identities.get(other_residue, set())
+            # only identities called to play by this card or earlier ones
+            if left_non_hat_clued.order in triggering_orders:
+                called_to_play.add(left_non_hat_clued.to_tuple())
+            implied_ids = get_masked_identities(
+                self.variant_name, residue_masks[other_residue]
+            )
             if other_residue == 0:
-                implied_ids = implied_ids.union(self.identities_called_to_play)
+                implied_ids = implied_ids.union(called_to_play)
 
             new_candidates = self.all_candidates_list[player_index][i].intersection(
                 implied_ids
             )
 
             if len(new_candidates):
-                self.all_candidates_list[player_index][i] = new_candidates
+                self.set_candidates(player_index, i, new_candidates)
 
                 self.write_note(
                     left_non_hat_clued.order, note="", candidates=new_candidates
@@ -1558,7 +1592,9 @@ class EncoderV1GameState(BaseEncoderGameState):
 
             if left_non_hat_clued is not None:
                 my_residue = (hat_residue - sum_of_others_residues) % self.mod_base
-                my_implied_ids = residue_to_identities.get(my_residue, set())
+                my_implied_ids = get_masked_identities(
+                    self.variant_name, residue_masks[my_residue]
+                )
                 if my_residue == 0:
                     my_implied_ids = my_implied_ids.union(
                         self.identities_called_to_play
@@ -1576,8 +1612,8 @@ class EncoderV1GameState(BaseEncoderGameState):
                 print(f"Hat candidates: {my_implied_ids}")
 
                 increment_candidates = {
-                    i: residue_to_identities.get(
-                        (my_residue + i) % self.mod_base, set()
+                    i: get_masked_identities(
+                        self.variant_name, residue_masks[(my_residue + i) % self.mod_base]
                     ).union(
                         self.identities_called_to_play
                         if ((my_residue + i) % self.mod_base == 0)
@@ -1593,7 +1629,7 @@ class EncoderV1GameState(BaseEncoderGameState):
                 new_candidates = self.all_candidates_list[self.our_player_index][
                     i
                 ].intersection(my_implied_ids)
-                self.all_candidates_list[self.our_player_index][i] = new_candidates
+                self.set_candidates(self.our_player_index, i, new_candidates)
                 self.write_note(
                     left_non_hat_clued.order, note="", candidates=new_candidates
                 )
@@ -1605,29 +1641,11 @@ class EncoderV1GameState(BaseEncoderGameState):
 
     def get_legal_clues(self) -> Dict[Tuple[int, int, int], Set[Tuple[int, int]]]:
         # (clue_value, clue_type, target_index) -> cards_touched
-        sum_of_residues = 0
-        identity_to_residue = self.identity_to_residue
-        local_identities_called_to_play = deepcopy(self.identities_called_to_play)
-        for player_index, hand in self.hands.items():
-            if player_index == self.our_player_index:
-                continue
-            lnhc = self.get_leftmost_non_hat_clued_card(player_index)
-            if lnhc is None:
-                continue
-
-            identity = lnhc.to_tuple()
-            if self.is_playable_card(lnhc):
-                if identity in local_identities_called_to_play and (
-                    not self.can_clue_dupes_as_plays
-                ):
-                    sum_of_residues += 0
-                else:
-                    sum_of_residues += identity_to_residue[identity]
-                    local_identities_called_to_play.add(identity)
-            else:
-                sum_of_residues += identity_to_residue[identity]
-
-        sum_of_residues = sum_of_residues % self.mod_base
+        _, residues = self.get_hat_targets(
+            [x for x in self.hands if x != self.our_player_index],
+            deepcopy(self.identities_called_to_play),
+        )
+        sum_of_residues = int(residues.sum()) % self.mod_base
         return self.get_legal_clues_helper(sum_of_residues)
 
     def get_good_actions(self, player_index: int) -> Dict[str, List[int]]:
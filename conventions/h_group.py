@@ -1,39 +1,202 @@
-from game_state import GameState, get_all_touched_cards, RANK_CLUE, COLOR_CLUE, Card
-from typing import Dict, List, Tuple, Optional, Set
+from clue_table import ClueTable
+from game_state import GameState, SUITS, get_all_touched_cards, RANK_CLUE, COLOR_CLUE, Card
+from typing import Dict, FrozenSet, List, Tuple, Optional, Set
 from dataclasses import dataclass
-from copy import deepcopy
 
-# WIPWIPWIP
 
 class BadPlay(Exception):
     pass
 
 
 class SimulationState:
-    def __init__(self, pointer, stacks):
-        self.pointer: Tuple[int, int] = pointer
-        self.simulation_stacks: List[int] = deepcopy(stacks)
-        self.already_played_orders: Set[int] = set()
-        self.has_been_incremented: bool = False
-        self.additional_cards_gotten: Set[int] = set()
+    """Stacks as they would be after some hypothetical plays. Branches of a
+    search play onto one SimulationState and undo their plays afterwards,
+    instead of each working on a copy."""
 
-    def increment_pointer(self):
-        self.pointer = (self.pointer[0], self.pointer[1] + 1)
+    def __init__(self, stacks: List[int], incrs: List[int]):
+        self.simulation_stacks: List[int] = list(stacks)
+        self.incrs = incrs
+        self.already_played_orders: Set[int] = set()
+        self.history: List[Tuple[int, int, int]] = []
 
-    def is_playable(self, card: Card):
-        return self.simulation_stacks[card.suit_index] == card.rank - 1
+    def is_playable(self, suit_index: int, rank: int) -> bool:
+        return self.simulation_stacks[suit_index] + self.incrs[suit_index] == rank
 
-    def play(self, card: Card, finesse: bool = False):
-        if not self.is_playable(card):
+    def play(self, order: int, suit_index: int, rank: int):
+        if not self.is_playable(suit_index, rank):
             raise BadPlay
-        self.simulation_stacks[card.suit_index] += 1
-        self.already_played_orders.add(card.order)
-        if (card.suit_index, card.rank) == self.pointer:
-            self.increment_pointer()
-            self.has_been_incremented = True
+        self.simulation_stacks[suit_index] = rank
+        self.already_played_orders.add(order)
+        self.history.append((order, suit_index, rank))
+
+    def undo(self):
+        order, suit_index, rank = self.history.pop()
+        self.simulation_stacks[suit_index] = rank - self.incrs[suit_index]
+        self.already_played_orders.discard(order)
+
+    def rewind(self, num_plays: int = 0):
+        while len(self.history) > num_plays:
+            self.undo()
+
+
+@dataclass(frozen=True)
+class ConnectionNode:
+    kind: str  # "prompt" or "finesse"
+    player_index: int
+    order: int
+    suit_index: int
+    rank: int
+
+
+class ConnectionSearch:
+    """Finds the prompts and finesses through which a clued card can be made
+    playable, as seen by whoever gives the clue. A player holding a clued card
+    that could be the card needed next is prompted (and is no help if that card
+    turns out to be something else); otherwise their finesse position is
+    played, layered finesses included.
+
+    Chains for (suit_index, rank, target_index) are memoized, so every clue and
+    candidate asking for the same card reuses them, and all of them are built
+    on one SimulationState. max_nodes bounds the number of plays tried; once
+    it is reached, only the chains found so far are returned.
+    """
+
+    def __init__(self, state: "HGroupGameState", clue_giver: int, max_nodes: int = 2000):
+        self.state = state
+        self.clue_giver = clue_giver
+        self.max_nodes = max_nodes
+        self.num_nodes = 0
+        incrs = [
+            -1 if "Reversed" in suit else 1 for suit in SUITS[state.variant_name]
+        ]
+        self.simulation = SimulationState(state.stacks, incrs)
+        self.memo: Dict[Tuple[int, int, int], List[Tuple[ConnectionNode, ...]]] = {}
+
+        # players in the order they get to act after the clue, and their
+        # clued/unclued cards from newest to oldest
+        self.player_indices = [
+            (clue_giver + i) % state.num_players
+            for i in range(1, state.num_players)
+            if (clue_giver + i) % state.num_players != state.our_player_index
+        ]
+        self.clued_cards: Dict[int, List[Tuple[Card, Set[Tuple[int, int]]]]] = {}
+        self.unclued_cards: Dict[int, List[Card]] = {}
+        for player_index in self.player_indices:
+            hand = state.hands[player_index]
+            candidates_list = state.all_candidates_list[player_index]
+            self.clued_cards[player_index] = [
+                (hand[i], candidates_list[i])
+                for i in reversed(range(len(hand)))
+                if state.is_clued(hand[i].order)
+            ]
+            self.unclued_cards[player_index] = [
+                card for card in reversed(hand) if not state.is_clued(card.order)
+            ]
+
+    @property
+    def exhausted(self) -> bool:
+        return self.num_nodes >= self.max_nodes
+
+    def get_connections(
+        self, suit_index: int, rank: int, target_index: int
+    ) -> List[Tuple[ConnectionNode, ...]]:
+        """Every chain of plays by players other than the clue giver and the
+        target after which (suit_index, rank) is playable: [()] if it already
+        is, [] if there is none."""
+        key = (suit_index, rank, target_index)
+        if key not in self.memo:
+            self.memo[key] = self._get_connections(suit_index, rank, target_index)
+        return self.memo[key]
+
+    def _get_connections(
+        self, suit_index: int, rank: int, target_index: int
+    ) -> List[Tuple[ConnectionNode, ...]]:
+        incr = self.simulation.incrs[suit_index]
+        distance = (rank - self.state.stacks[suit_index]) * incr
+        if distance == 1:
+            return [()]
+        if distance <= 0:
+            return []
+
+        result = []
+        previous_rank = rank - incr
+        for chain in self.get_connections(suit_index, previous_rank, target_index):
+            # chains are enumerated from the real stacks, so the simulation
+            # is empty whenever one is replayed here
+            for node in chain:
+                self.simulation.play(node.order, node.suit_index, node.rank)
+            for player_index in self.player_indices:
+                if player_index == target_index or self.exhausted:
+                    continue
+                nodes = self.get_nodes(player_index, suit_index, previous_rank)
+                if nodes is not None:
+                    result.append(chain + nodes)
+            self.simulation.rewind()
+        return result
+
+    def get_nodes(
+        self, player_index: int, suit_index: int, rank: int
+    ) -> Optional[Tuple[ConnectionNode, ...]]:
+        """The plays player_index makes when (suit_index, rank) is called for
+        next, or None if they can't provide it."""
+        identity = (suit_index, rank)
+        played_orders = self.simulation.already_played_orders
+        num_plays = len(self.simulation.history)
+        nodes = []
+        for card, candidates in self.clued_cards[player_index]:
+            if card.order in played_orders or identity not in candidates:
+                continue
+            self.num_nodes += 1
+            nodes.append(ConnectionNode("prompt", player_index, card.order, card.suit_index, card.rank))
+            if card.to_tuple() == identity:
+                self.simulation.rewind(num_plays)
+                return tuple(nodes)
+            # prompted on the wrong card, which had better be playable too
+            if not self.simulation.is_playable(card.suit_index, card.rank):
+                self.simulation.rewind(num_plays)
+                return None
+            self.simulation.play(card.order, card.suit_index, card.rank)
+        if len(nodes):
+            self.simulation.rewind(num_plays)
+            return None
+
+        for card in self.unclued_cards[player_index]:
+            if card.order in played_orders:
+                continue
+            self.num_nodes += 1
+            nodes.append(ConnectionNode("finesse", player_index, card.order, card.suit_index, card.rank))
+            if card.to_tuple() == identity:
+                self.simulation.rewind(num_plays)
+                return tuple(nodes)
+            # a layered finesse plays through other playable cards first
+            if not self.simulation.is_playable(card.suit_index, card.rank):
+                break
+            self.simulation.play(card.order, card.suit_index, card.rank)
+        self.simulation.rewind(num_plays)
+        return None
 
-        if finesse:
-            self.additional_cards_gotten.add(card.order)
+    def get_best_connection(
+        self, suit_index: int, rank: int, target_index: int
+    ) -> Optional[Tuple[ConnectionNode, ...]]:
+        """The chain with the fewest finesses, or None if there is none."""
+        chains = self.get_connections(suit_index, rank, target_index)
+        if not len(chains):
+            return None
+        return min(chains, key=lambda chain: sum(node.kind == "finesse" for node in chain))
+
+
+@dataclass(frozen=True)
+class ClueCandidate:
+    """What giving one clue would do, as seen by its giver."""
+    focus_order: int
+    touched_orders: Tuple[int, ...]
+    # the touched cards plus any finessed into playing, or None if the focus
+    # can't be read as a play clue
+    cards_gotten: Optional[FrozenSet[int]]
+    # newly touched cards that are trash or already clued elsewhere
+    bad_touch_orders: FrozenSet[int]
+    # the target's chop, if the clue saves it
+    saved_orders: FrozenSet[int]
 
 
 @dataclass
@@ -82,6 +245,8 @@ class FinessePaths:
 
 
 class HGroupGameState(GameState):
+    journaled_attrs = ("other_info_clued_card_orders", "order_to_finesse_paths")
+
     def __init__(self, variant_name, player_names, our_player_index):
         super().__init__(variant_name, player_names, our_player_index)
         self.other_info_clued_card_orders["chop_moved_cards"] = set()
@@ -183,116 +348,15 @@ class HGroupGameState(GameState):
             "seen_in_other_hand": seen_in_other_hand,
         }
 
-    def _prompt_others_logic(
-        self, target_index: int, sim_state: SimulationState
-    ) -> SimulationState:
-        if sim_state.has_been_incremented:
-            return sim_state
-
-        for player in range(self.num_players):
-            if player == target_index or player == self.our_player_index:
-                continue
-
-            # only check prompt if the card is in the player's hand to begin with
-            all_clued_cards = [
-                c.to_tuple() for c in self.hands[player] if self.is_clued(c.order)
-            ]
-            if sim_state.pointer not in all_clued_cards:
-                continue
-
-            for i in range(len(self.all_candidates_list[player])):
-                card = self.hands[player][-i - 1]
-                if not self.is_clued(card.order):
-                    continue
-
-                candidates = self.all_candidates_list[player][-i - 1]
-                if sim_state.pointer not in candidates:
-                    continue
-
-                identity = self.hands[player][-i - 1].to_tuple()
-                if identity == sim_state.pointer:
-                    sim_state.play(card)
-                    return sim_state
-
-                # raises BadPlay if a bomb occurs
-                sim_state.play(card)
-
-        return sim_state
-
-    def _finesse_others_logic(
-        self, target_index: int, sim_state: SimulationState
-    ) -> SimulationState:
-        if sim_state.has_been_incremented:
-            return sim_state
-
-        for player in range(self.num_players):
-            if player == target_index or player == self.our_player_index:
-                continue
-
-            # only check prompt if the card is in the player's hand to begin with
-            all_unclued_cards = [
-                c.to_tuple() for c in self.hands[player] if not self.is_clued(c.order)
-            ]
-            if sim_state.pointer not in all_unclued_cards:
-                continue
-
-            for i in range(len(self.all_candidates_list[player])):
-                card = self.hands[player][-i - 1]
-                if self.is_clued(card.order):
-                    continue
-
-                candidates = self.all_candidates_list[player][-i - 1]
-                if sim_state.pointer not in candidates:
-                    continue
-
-                identity = self.hands[player][-i - 1].to_tuple()
-                if identity == sim_state.pointer:
-                    sim_state.play(card, finesse=True)
-                    return sim_state
-
-                # raises BadPlay if a bomb occurs
-                sim_state.play(card, finesse=True)
-
-        return sim_state
-
-    def _prompt_self_logic(
-        self, target_index: int, target_card: Card, sim_state: SimulationState
-    ) -> SimulationState:
-        if sim_state.has_been_incremented:
-            return sim_state
-
-        all_clued_cards = [
-            c.to_tuple() for c in self.hands[target_index] if self.is_clued(c.order)
-        ]
-        if sim_state.pointer not in all_clued_cards:
-            return sim_state
-
-        # ordered from left to right
-        all_potential_pointer_clued_cards = []
-        for i in range(len(self.all_candidates_list[target_index])):
-            card = self.hands[target_index][-i - 1]
-            if not self.is_clued(card.order):
-                continue
-
-            candidates = self.all_candidates_list[target_index][-i - 1]
-            if sim_state.pointer not in candidates:
-                continue
-
-            all_potential_pointer_clued_cards.append((i, card.order))
-
-            identity = self.hands[player][-i - 1].to_tuple()
-            if identity == sim_state.pointer:
-                sim_state.play(card)
-                return sim_state
-
-            # raises BadPlay if a bomb occurs
-            sim_state.play(card)
-
-        return sim_state
-
     def get_cards_gotten_from_play_clue(
-        self, target_index: int, clue_type: int, clue_value: int
-    ) -> Set[int]:
+        self,
+        target_index: int,
+        clue_type: int,
+        clue_value: int,
+        search: Optional[ConnectionSearch] = None,
+    ) -> Optional[Set[int]]:
+        """Orders of the cards touched plus those finessed into playing, or None
+        if the focused card can't be connected to the stacks."""
         # does not take into account good touch principle
         # assumes the clue is known to be a play clue, even for e.g. a 2 save
         all_touched = get_all_touched_cards(clue_type, clue_value, self.variant_name)
@@ -301,83 +365,115 @@ class HGroupGameState(GameState):
             for c in self.hands[target_index]
             if (c.suit_index, c.rank) in all_touched
         ]
-        cards_gotten = set(orders_touched)
         focus_order = self.get_focus_of_clue(target_index, orders_touched)
-        order_to_index = self.order_to_index
+        return self.get_cards_gotten(target_index, orders_touched, focus_order, search)
 
-        _, i = order_to_index[focus_order]
-        target_card = self.hands[target_index][i]
-        suit_index = target_card.suit_index
-        rank = target_card.rank
-        if (suit_index, rank) in self.playables:
+    def get_cards_gotten(
+        self,
+        target_index: int,
+        orders_touched: List[int],
+        focus_order: int,
+        search: Optional[ConnectionSearch] = None,
+    ) -> Optional[Set[int]]:
+        cards_gotten = set(orders_touched)
+        target_card = self.get_card(focus_order)
+        if target_card.to_tuple() in self.playables:
             return cards_gotten
 
         # otherwise the card needs some help to play
-        # check if card is directly promptable
-        missing_cards = [
-            (suit_index, i) for i in range(self.stacks[suit_index] + 1, rank)
-        ]
-        assert len(missing_cards)
-
-        sim_state = SimulationState(missing_cards[0], self.stacks)
-        while sim_state.pointer[1] < rank:
-            sim_state.has_been_incremented = False
-            print(f"Pointer: {sim_state.pointer}")
-
-            try:
-                sim_state = self._prompt_others_logic(target_index, deepcopy(sim_state))
-            except BadPlay:
-                print(f"Got BadPlay attempting to prompt {sim_state.pointer}")
-                pass
-
-            try:
-                sim_state = self._finesse_others_logic(
-                    target_index, deepcopy(sim_state)
-                )
-            except BadPlay:
-                print(f"Got BadPlay attempting to finesse {sim_state.pointer}")
-                pass
-
-            # not clued in other's hands - check if clued in own hand
-            if False:
-                for i in range(len(self.all_candidates_list[player])):
-                    order = self.hands[player][-i - 1].order
-                    if not self.is_clued(order):
-                        continue
-                    candidates = self.all_candidates_list[player][-i - 1]
-                    if pointer not in candidates:
+        if search is None:
+            search = ConnectionSearch(self, self.our_player_index)
+        chain = search.get_best_connection(target_card.suit_index, target_card.rank, target_index)
+        if chain is None:
+            return None
+        return cards_gotten.union(node.order for node in chain if node.kind == "finesse")
+
+    def is_worth_saving(self, card: Card, clue_type: int, clue_value: int, trash, criticals) -> bool:
+        identity = card.to_tuple()
+        if identity in trash:
+            return False
+        if identity in criticals:
+            return True
+        if clue_type != RANK_CLUE or clue_value != card.rank:
+            return False
+        if card.rank == 5:
+            return True
+        # 2 saves, unless someone else visibly holds the other copy
+        return card.rank == 2 and not any(
+            c.order != card.order and c.to_tuple() == identity
+            for player_index, hand in self.hands.items()
+            if player_index != self.our_player_index
+            for c in hand
+        )
+
+    def get_clue_candidates(self, max_nodes: int = 2000) -> Dict[Tuple[int, int, int], ClueCandidate]:
+        """(clue_value, clue_type, target_index) -> ClueCandidate for every clue we
+        could give. Touched cards come from one ClueTable over all targets and
+        every focus is connected through one shared ConnectionSearch."""
+        search = ConnectionSearch(self, self.our_player_index, max_nodes)
+        clue_table = ClueTable(self)
+        trash, criticals = self.trash, self.criticals
+        clued_identities: Dict[int, int] = {}
+        for player_index, hand in self.hands.items():
+            if player_index == self.our_player_index:
+                continue
+            for card in hand:
+                if self.is_clued(card.order):
+                    clued_identities[card.to_tuple()] = clued_identities.get(card.to_tuple(), 0) + 1
+
+        result = {}
+        for target_index in clue_table.target_indices:
+            chop_order = self.get_chop_order(target_index)
+            for clue_type, clue_value in clue_table.get_clues(target_index):
+                touched_cards = clue_table.get_touched_cards(clue_type, clue_value, target_index)
+                touched_orders = [card.order for card in touched_cards]
+                focus_order = self.get_focus_of_clue(target_index, touched_orders)
+
+                bad_touch_orders = set()
+                newly_touched_identities = set()
+                for card in reversed(touched_cards):
+                    if self.is_clued(card.order):
                         continue
+                    identity = card.to_tuple()
+                    if (
+                        identity in trash
+                        or identity in clued_identities
+                        or identity in newly_touched_identities
+                    ):
+                        bad_touch_orders.add(card.order)
+                    newly_touched_identities.add(identity)
+
+                saved_orders = set()
+                if chop_order in touched_orders and self.is_worth_saving(
+                    self.get_card(chop_order), clue_type, clue_value, trash, criticals
+                ):
+                    saved_orders.add(chop_order)
+
+                cards_gotten = self.get_cards_gotten(target_index, touched_orders, focus_order, search)
+                result[(clue_value, clue_type, target_index)] = ClueCandidate(
+                    focus_order=focus_order,
+                    touched_orders=tuple(touched_orders),
+                    cards_gotten=None if cards_gotten is None else frozenset(cards_gotten),
+                    bad_touch_orders=frozenset(bad_touch_orders),
+                    saved_orders=frozenset(saved_orders),
+                )
+        return result
 
-                    identity = self.hands[player][-i - 1].to_tuple()
-                    if identity == pointer:
-                        print("Incrementing pointer", pointer)
-                        pointer = (pointer[0], pointer[1] + 1)
-                        simulation_stacks[identity[0]] += 1
-                        already_played_orders.add(order)
-                        break
-                    else:
-                        if identity[1] != simulation_stacks[identity[0]] + 1:
-                            print("Bombs while prompting")
-                            return None  # bombs while prompting
-                        else:
-                            simulation_stacks[identity[0]] += 1
-                            already_played_orders.add(order)
-
-        return cards_gotten.union(sim_state.additional_cards_gotten)
-
-        target_cands_before_clue = self.all_candidates_list[target_index][i]
-        target_cands_after_clue = target_cands_before_clue.intersection(all_touched)
-        print(focused_card)
-        print(target_cands_after_clue)
-        2 / 0
-        if rank == self.stacks[suit_index] + 1:
-            return [candidate]
-
-        for player_index in range(self.num_players):
-            pass
-
-        # the play clue doesn't work
-        return None
+    def get_play_clues(
+        self, clue_candidates: Optional[Dict[Tuple[int, int, int], ClueCandidate]] = None
+    ) -> Dict[Tuple[int, int, int], Set[int]]:
+        """(clue_value, clue_type, target_index) -> orders gotten, for every clue
+        we could give that touches no bad cards, touches some new card and whose
+        focus connects to the stacks."""
+        if clue_candidates is None:
+            clue_candidates = self.get_clue_candidates()
+        return {
+            key: set(candidate.cards_gotten)
+            for key, candidate in clue_candidates.items()
+            if candidate.cards_gotten is not None
+            and not len(candidate.bad_touch_orders)
+            and not all(self.is_clued(order) for order in candidate.touched_orders)
+        }
 
     def handle_clue(
         self,
@@ -387,69 +483,56 @@ class HGroupGameState(GameState):
         clue_value: int,
         card_orders,
     ):
-        candidates_list = self.all_candidates_list[target_index]
         focus_order = self.get_focus_of_clue(target_index, card_orders)
+        if target_index != self.our_player_index:
+            self.track_finesse_paths(clue_giver, target_index, focus_order)
 
-        result = super().handle_clue(
+        return super().handle_clue(
             clue_giver, target_index, clue_type, clue_value, card_orders
         )
 
-        return result
-        if False:
-            finesse_paths = FinessePaths(self.turn)
-            _, i = self.order_to_index[focus_order]
-            candidates_after_clue = self.all_candidates_list[target_index][i]
-            for suit_index, rank in candidates_after_clue:
-                nodes: List[FinesseNode] = []
-                chain = [
-                    (suit_index, i)
-                    for i in range(self.stacks[suit_index] + 1, rank + 1)
-                ]
-                if not len(chain):  # trash card
-                    continue
-
-                if len(chain) == 1:
-                    s, r = chain[0]
-                    finesse_paths.add_nodes(
-                        [FinesseNode(s, r, target_index, [focus_order], 9999, True)]
-                    )
-                else:
-                    occupied_orders = set()
-                    chain_card_to_player_indices = {}
-                    for s, r in chain[:-1]:
-                        for player_iterate in range(self.num_players):
-                            if player_iterate == clue_giver:
-                                continue
-
-                            clued = reversed(self.get_clued_orders(player_iterate))
-                            unclued = reversed(self.get_unclued_orders(player_iterate))
-
-                    # raise ZeroDivisionError
-
-            finesse_paths.print()
-            2 / 0
+    def track_finesse_paths(self, clue_giver: int, target_index: int, focus_order: int):
+        """Records the ways the focused card can be connected, if any of them
+        needs a finesse. Finessed cards are expected to play within a round."""
+        focused_card = self.get_card(focus_order)
+        if focused_card.to_tuple() in self.playables:
+            return
+
+        search = ConnectionSearch(self, clue_giver)
+        chains = [
+            chain
+            for chain in search.get_connections(focused_card.suit_index, focused_card.rank, target_index)
+            if any(node.kind == "finesse" for node in chain)
+        ]
+        if not len(chains):
+            return
+
+        finesse_paths = FinessePaths(self.turn)
+        for chain in chains:
+            finesse_paths.add_nodes([
+                FinesseNode(
+                    node.suit_index,
+                    node.rank,
+                    node.player_index,
+                    [node.order],
+                    self.turn + self.num_players,
+                    completed=node.kind == "prompt",
+                )
+                for node in chain
+            ])
         self.order_to_finesse_paths[focus_order] = finesse_paths
-        return result
-        if False:
-            for i, card in enumerate(self.hands[target_index]):
-                if card.order == focus_of_clue:
-                    if clue_type == RANK_CLUE and clue_value not in {2, 5}:
-                        candidates_list[i] = candidates_list[i].intersection(
-                            self.playables.union(self.criticals)
-                        )
-                    elif clue_type == COLOR_CLUE:
-                        candidates_list[i] = candidates_list[i].intersection(
-                            self.playables.union(self.non_5_criticals)
-                        )
 
     def get_legal_clues(self) -> Dict[Tuple[int, int, int], Set[Tuple[int, int]]]:
         # (clue_value, clue_type, target_index) -> cards_touched
-        for target_index in range(self.num_players):
-            if target_index == self.our_player_index:
+        # a clue is legal if it saves or gets something without bad touch
+        result = {}
+        for key, candidate in self.get_clue_candidates().items():
+            if len(candidate.bad_touch_orders):
                 continue
-
-            # clue_type_values = [(RANK_CLUE, 1), (COLOR_CLUE, 1)]
-            # self.get_cards_touched_dict(self, target_index, clue_type_values)
+            if candidate.cards_gotten is None and not len(candidate.saved_orders):
+                continue
+            result[key] = {self.get_card(order).to_tuple() for order in candidate.touched_orders}
+        return result
 
 
 if __name__ == "__main__":
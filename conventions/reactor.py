@@ -1,12 +1,13 @@
-from game_state import (
-    GameState, RANK_CLUE, COLOR_CLUE, Card,
-    get_available_color_clues, get_available_rank_clues
-)
-from typing import Dict, List, Tuple, Optional, Set
+from clue_table import ClueTable
+from decision_context import DecisionContext, get_decision_context
+from game_state import GameState, OrderedSet, RANK_CLUE, COLOR_CLUE, Card
+from typing import Dict, FrozenSet, List, Tuple, Optional, Set, TypeVar
 from dataclasses import dataclass
 from copy import deepcopy
 from enum import Enum
 
+T = TypeVar("T")
+
 
 def get_reactive_playable_human_slot(
     target_hand: List[Card],
@@ -72,6 +73,38 @@ def get_reactive_trash_human_slot(
     return leftmost_trash
 
 
+def get_human_slot_lookup(hand: List[T]) -> Dict[int, T]:
+    """Human slot -> entry of a hand (or of its candidates list)."""
+    return {len(hand) - i: x for i, x in enumerate(hand)}
+
+
+def get_focused_human_slot(slots_touched: List[int]) -> int:
+    """slots_touched are sorted human slots. Slot 1 is only focused when it is
+    the only slot touched."""
+    return slots_touched[1] if (slots_touched[0] == 1 and len(slots_touched) > 1) else slots_touched[0]
+
+
+def get_finesse_human_slots(hand_size: int) -> List[int]:
+    """Order in which a reacter's slots are tried for a finesse: newest, then
+    oldest to second newest, i.e. [1, 5, 4, 3, 2] for five cards."""
+    return [1] + list(range(hand_size, 1, -1))
+
+
+@dataclass(frozen=True)
+class ReactionView:
+    """The target of a reactive clue as it was when the clue was given, holding
+    only what get_reactive_playable_human_slot/get_reactive_trash_human_slot
+    read. Candidate sets are replaced rather than mutated, so they are shared
+    with the live state instead of copied."""
+    target_hand: Tuple[Card, ...]
+    candidates_list: Tuple[Set[Tuple[int, int]], ...]
+    playables: FrozenSet[Tuple[int, int]]
+    trash: FrozenSet[Tuple[int, int]]
+    play_orders: FrozenSet[int]
+    clued_orders: FrozenSet[int]
+    discard_orders: FrozenSet[int]
+
+
 class UnresolvedReaction:
     def __init__(
         self,
@@ -80,13 +113,7 @@ class UnresolvedReaction:
         focused_slot: int,
         ordering: List[int],
         player_slot_orders: Dict[int, List[int]],
-        current_play_orders: List[int],
-        current_clued_orders: Set[int],
-        current_discard_orders: Set[int],
-        all_candidates_list: Dict[int, List[Set[Tuple[int, int]]]],
-        target_hand: List[Card],
-        playables: List[Tuple[int, int]],
-        trash: List[Tuple[int, int]]
+        view: ReactionView,
     ):
         assert len(ordering) >= 2
         self.target_index = target_index
@@ -94,13 +121,7 @@ class UnresolvedReaction:
         self.focused_slot = focused_slot
         self.ordering = ordering
         self.player_slot_orders = player_slot_orders
-        self.current_play_orders = current_play_orders
-        self.current_clued_orders = current_clued_orders
-        self.current_discard_orders = current_discard_orders
-        self.all_candidates_list = all_candidates_list
-        self.target_hand = target_hand
-        self.playables = playables
-        self.trash = trash
+        self.view = view
 
     def __str__(self) -> str:
         return f"[{self.play_parity} {self.focused_slot} {self.ordering} {self.player_slot_orders}]"
@@ -109,27 +130,32 @@ class UnresolvedReaction:
         return self.__str__()
     
     def is_playable(self, candidates: Set[Tuple[int, int]]) -> bool:
-        return not len(candidates.difference(self.playables)) and len(candidates)
+        return not len(candidates.difference(self.view.playables)) and len(candidates)
 
     def is_playable_card(self, card: Card) -> bool:
-        return (card.suit_index, card.rank) in self.playables
+        return (card.suit_index, card.rank) in self.view.playables
     
     def get_reactive_playable_human_slot(self):
-        return get_reactive_playable_human_slot(self.target_hand, self.all_candidates_list[self.target_index], self.playables, self.current_play_orders)
+        view = self.view
+        return get_reactive_playable_human_slot(view.target_hand, view.candidates_list, view.playables, view.play_orders)
 
     def get_reactive_trash_human_slot(self):
-        return get_reactive_trash_human_slot(self.target_hand, self.all_candidates_list[self.target_index], self.trash, self.current_clued_orders, self.current_discard_orders)
+        view = self.view
+        return get_reactive_trash_human_slot(view.target_hand, view.candidates_list, view.trash, view.clued_orders, view.discard_orders)
 
 
 class ReactorGameState(GameState):
+    journaled_attrs = ("play_orders", "discard_orders", "ctd_order", "unresolved_reactions")
+    use_endgame_solver = True
+
     def __init__(self, variant_name, player_names, our_player_index):
         super().__init__(variant_name, player_names, our_player_index)
-        self.discard_orders: Dict[int, List[int]] = {
-            i: []
+        self.discard_orders: Dict[int, OrderedSet] = {
+            i: OrderedSet()
             for i in range(self.num_players)
         }
-        self.play_orders: Dict[int, List[int]] = {
-            i: []
+        self.play_orders: Dict[int, OrderedSet] = {
+            i: OrderedSet()
             for i in range(self.num_players)
         }
         self.ctd_order: Dict[int, Optional[int]] = {
@@ -159,11 +185,11 @@ class ReactorGameState(GameState):
         return [x for discard_orders in self.discard_orders.values() for x in discard_orders]
 
     @property
-    def our_play_orders(self) -> List[int]:
+    def our_play_orders(self) -> OrderedSet:
         return self.play_orders[self.our_player_index]
     
     @property
-    def our_discard_orders(self) -> List[int]:
+    def our_discard_orders(self) -> OrderedSet:
         return self.discard_orders[self.our_player_index]
 
     @property
@@ -216,15 +242,17 @@ class ReactorGameState(GameState):
                 ordering.append(_player_index)
         return ordering
 
-    def every_good_card_of_rank_is_playable(self, rank: int) -> bool:
+    def every_good_card_of_rank_is_playable(self, rank: int, ctx: Optional[DecisionContext] = None) -> bool:
+        playables = self.playables if ctx is None else ctx.playables
+        trash = self.trash if ctx is None else ctx.trash
         touched_card_tuples = self.get_touched_card_tuples(RANK_CLUE, rank)
         at_least_one_card_playable = False
         for (si, r) in touched_card_tuples:
             if r != rank:
                 continue
-            if (si, r) not in self.playables and (si, r) not in self.trash:
+            if (si, r) not in playables and (si, r) not in trash:
                 return False
-            if (si, r) in self.playables:
+            if (si, r) in playables:
                 at_least_one_card_playable = True
         return at_least_one_card_playable
     
@@ -245,21 +273,21 @@ class ReactorGameState(GameState):
         return self.is_trash(cands_after_clue)
 
     def update_play_discard_orders(self):
-        for player_index in range(self.num_players):
-            candidates_list = self.all_candidates_list[player_index]
-            for i, candidates in enumerate(candidates_list):
-                card = self.hands[player_index][i]
-                if self.is_playable(candidates) and card.order not in self.play_orders[player_index]:
-                    print(f'[update_play_discard_orders 1] Adding play order {card.order}')
-                    self.play_orders[player_index].append(card.order)
-
-                if self.is_trash(candidates):
-                    if card.order not in self.discard_orders[player_index]:
-                        print(f'[update_play_discard_orders 2] Adding discard order {card.order}')
-                        self.discard_orders[player_index].append(card.order)
-                    self.play_orders[player_index] = [
-                        x for x in self.play_orders[player_index] if x != card.order
-                    ]
+        queues = [self.play_orders, self.discard_orders]
+        changed_cards = self.get_changed_cards(queues)
+        if len(changed_cards):
+            playables, trash = self.playables, self.trash
+        for player_index, card, candidates in changed_cards:
+            if len(candidates) and candidates.issubset(playables) and card.order not in self.play_orders[player_index]:
+                print(f'[update_play_discard_orders 1] Adding play order {card.order}')
+                self.play_orders[player_index].add(card.order)
+
+            if len(candidates) and candidates.issubset(trash):
+                if card.order not in self.discard_orders[player_index]:
+                    print(f'[update_play_discard_orders 2] Adding discard order {card.order}')
+                    self.discard_orders[player_index].add(card.order)
+                self.play_orders[player_index].discard(card.order)
+        self.mark_cards_checked(queues)
 
     def handle_clue(
         self,
@@ -295,7 +323,7 @@ class ReactorGameState(GameState):
                         # newest cards get pushed into the queue first
                         if order not in self.play_orders[target_index]:
                             print(f'[handle_stable_clue 1] Adding play order {order}')
-                            self.play_orders[target_index].append(order)
+                            self.play_orders[target_index].add(order)
                 elif self.every_card_of_rank_is_trash(clue_value):
                     # TODO: implement brown/null variant specific
                     ref_action_index = self.get_index_of_ref_play_target(
@@ -352,7 +380,7 @@ class ReactorGameState(GameState):
             elif ref_action_type == "play":
                 playable = self.hands[target_index][ref_action_index]
                 print(f'[handle_stable_clue 2] Adding play order {playable.order}')
-                self.play_orders[target_index].append(playable.order)
+                self.play_orders[target_index].add(playable.order)
                 self.write_note(playable.order, note=f"[f] order {len(self.play_orders[target_index])}")
         
         if ref_action_type == "lock":
@@ -361,6 +389,17 @@ class ReactorGameState(GameState):
             
         return result
     
+    def get_reaction_view(self, target_index: int) -> ReactionView:
+        return ReactionView(
+            target_hand=tuple(self.hands[target_index]),
+            candidates_list=tuple(self.all_candidates_list[target_index]),
+            playables=frozenset(self.playables),
+            trash=frozenset(self.trash),
+            play_orders=frozenset(self.all_play_orders),
+            clued_orders=frozenset(self.clued_card_orders),
+            discard_orders=frozenset(self.all_discard_orders),
+        )
+
     def handle_reactive_clue(
         self,
         clue_giver: int,
@@ -371,14 +410,10 @@ class ReactorGameState(GameState):
     ):
         ordering = self.get_reactive_player_index_ordering(clue_giver)
         target_hand = self.hands[target_index]
-        slots_touched = sorted(
+        focused_slot = get_focused_human_slot(sorted(
             len(target_hand) - i
             for i, card in enumerate(target_hand) if card.order in card_orders
-        )
-        focused_slot = (
-            slots_touched[1] if (slots_touched[0] == 1 and len(slots_touched) > 1)
-            else slots_touched[0]
-        )
+        ))
         self.unresolved_reactions[ordering[0]] = UnresolvedReaction(
             target_index=target_index,
             play_parity=0 if clue_type == RANK_CLUE else 1,
@@ -388,13 +423,7 @@ class ReactorGameState(GameState):
                 player_index: sorted([x.order for x in self.hands[player_index]], reverse=True)
                 for player_index in ordering
             },
-            current_play_orders=deepcopy(self.all_play_orders),
-            current_clued_orders=deepcopy(self.clued_card_orders),
-            current_discard_orders=deepcopy(self.all_discard_orders),
-            all_candidates_list=deepcopy(self.all_candidates_list),
-            target_hand=deepcopy(target_hand),
-            playables=deepcopy(self.playables),
-            trash=deepcopy(self.trash)
+            view=self.get_reaction_view(target_index),
         )
 
         return super().handle_clue(
@@ -403,12 +432,8 @@ class ReactorGameState(GameState):
     
     def handle_play(self, player_index: int, order: int, suit_index: int, rank: int):
         result = super().handle_play(player_index, order, suit_index, rank)
-        self.play_orders[player_index] = [
-            x for x in self.play_orders[player_index] if x != order
-        ]
-        self.discard_orders[player_index] = [
-            x for x in self.discard_orders[player_index] if x != order
-        ]
+        self.play_orders[player_index].discard(order)
+        self.discard_orders[player_index].discard(order)
         self.ctd_order[player_index] = None
         if self.unresolved_reactions[player_index] is not None:
             ur = self.unresolved_reactions[player_index]
@@ -419,21 +444,21 @@ class ReactorGameState(GameState):
             tgt_slot = (ur.focused_slot - slot_reacted - 1) % len(reacter_hand) + 1
 
             if ur.play_parity == 0:
-                playable_order = ur.player_slot_orders[ur.ordering[1]][tgt_slot - 1]
+                playable_order = ur.player_slot_orders[ur.target_index][tgt_slot - 1]
                 print(f'[handle_play 1] Unresolved reaction: adding play order {playable_order}')
-                if playable_order not in {x.order for x in self.hands[ur.ordering[1]]}:
+                if playable_order not in {x.order for x in self.hands[ur.target_index]}:
                     print(f'Bad playable order {playable_order} not found in hand, ignoring...')
                 else:
-                    self.play_orders[ur.ordering[1]].append(playable_order)
-                    self.write_note(playable_order, note=f"[f] order {len(self.play_orders[ur.ordering[1]])}")
+                    self.play_orders[ur.target_index].add(playable_order)
+                    self.write_note(playable_order, note=f"[f] order {len(self.play_orders[ur.target_index])}")
             elif ur.play_parity == 1:
-                discard_order = ur.player_slot_orders[ur.ordering[1]][tgt_slot - 1]
+                discard_order = ur.player_slot_orders[ur.target_index][tgt_slot - 1]
                 print(f'[handle_play 2] Unresolved reaction: adding discard order {discard_order}')
-                if discard_order not in {x.order for x in self.hands[ur.ordering[1]]}:
+                if discard_order not in {x.order for x in self.hands[ur.target_index]}:
                     print(f'Bad discard order {discard_order} not found in hand, ignoring...')
                 else:
-                    self.discard_orders[ur.ordering[1]].append(discard_order)
-                    self.write_note(discard_order, note=f"[kt] order {len(self.discard_orders[ur.ordering[1]])}")
+                    self.discard_orders[ur.target_index].add(discard_order)
+                    self.write_note(discard_order, note=f"[kt] order {len(self.discard_orders[ur.target_index])}")
 
             self.unresolved_reactions[player_index] = None
 
@@ -445,12 +470,8 @@ class ReactorGameState(GameState):
         # TODO: handle locked players
         # TODO: elim
         result = super().handle_discard(player_index, order, suit_index, rank)
-        self.discard_orders[player_index] = [
-            x for x in self.discard_orders[player_index] if x != order
-        ]
-        self.play_orders[player_index] = [
-            x for x in self.play_orders[player_index] if x != order
-        ]
+        self.discard_orders[player_index].discard(order)
+        self.play_orders[player_index].discard(order)
         self.ctd_order[player_index] = None
         if self.unresolved_reactions[player_index] is not None:
             ur = self.unresolved_reactions[player_index]
@@ -461,21 +482,21 @@ class ReactorGameState(GameState):
             tgt_slot = (ur.focused_slot - slot_reacted - 1) % len(reacter_hand) + 1
 
             if ur.play_parity == 0:
-                discard_order = ur.player_slot_orders[ur.ordering[1]][tgt_slot - 1]
+                discard_order = ur.player_slot_orders[ur.target_index][tgt_slot - 1]
                 print(f'[handle_discard 1] Unresolved reaction: adding discard order {discard_order}')
-                if discard_order not in {x.order for x in self.hands[ur.ordering[1]]}:
+                if discard_order not in {x.order for x in self.hands[ur.target_index]}:
                     print(f'Bad discard order {discard_order} not found in hand, skipping...')
                 else:
-                    self.discard_orders[ur.ordering[1]].append(discard_order)
-                    self.write_note(discard_order, note=f"[kt] order {len(self.discard_orders[ur.ordering[1]])}")
+                    self.discard_orders[ur.target_index].add(discard_order)
+                    self.write_note(discard_order, note=f"[kt] order {len(self.discard_orders[ur.target_index])}")
             elif ur.play_parity == 1:
-                playable_order = ur.player_slot_orders[ur.ordering[1]][tgt_slot - 1]
+                playable_order = ur.player_slot_orders[ur.target_index][tgt_slot - 1]
                 print(f'[handle_discard 2] Unresolved reaction: adding play order {playable_order}')
-                if playable_order not in {x.order for x in self.hands[ur.ordering[1]]}:
+                if playable_order not in {x.order for x in self.hands[ur.target_index]}:
                     print(f'Bad playable order {playable_order} not found in hand, skipping...')
                 else:
-                    self.play_orders[ur.ordering[1]].append(playable_order)
-                    self.write_note(playable_order, note=f"[f] order {len(self.play_orders[ur.ordering[1]])}")
+                    self.play_orders[ur.target_index].add(playable_order)
+                    self.write_note(playable_order, note=f"[f] order {len(self.play_orders[ur.target_index])}")
 
             self.unresolved_reactions[player_index] = None
 
@@ -498,41 +519,24 @@ class ReactorGameState(GameState):
         
         return None
     
-    def evaluate_clue_score(self, clue_type, clue_value, target_index) -> int:
-        touched_card_tuples = self.get_touched_card_tuples(clue_type, clue_value)
-        good_card_indices = [
-            i
-            for i in range(len(self.hands[target_index]))
-            if not self.is_trash_card(self.hands[target_index][i])
-        ]
-        bad_cards_touched = [
-            card for card in self.hands[target_index]
-            if self.is_trash_card(card) and card.to_tuple() in touched_card_tuples
-        ]
-        if len(bad_cards_touched):
-            score = 1000
-        else:
-            score = 1
-        
-        candidates_list = self.all_candidates_list[target_index]
-
-        for i in good_card_indices:
-            if self.hands[target_index][i].to_tuple() in touched_card_tuples:
-                new_candidates = candidates_list[i].intersection(touched_card_tuples)
-            else:
-                new_candidates = candidates_list[i].difference(touched_card_tuples)
-            score *= len(new_candidates)
-
-        return score
+    def evaluate_clue_score(
+        self, clue_type, clue_value, target_index, clue_table: Optional[ClueTable] = None
+    ) -> int:
+        if clue_table is None:
+            clue_table = ClueTable(self, [target_index])
+        score = 1000 if clue_table.touches_trash(clue_type, clue_value, target_index) else 1
+        return score * clue_table.get_candidates_product(clue_type, clue_value, target_index)
 
     def get_index_of_ref_discard_target(
         self,
         target_index: int,
         clue_type: int,
         clue_value: int,
-        touched_orders: Optional[List[int]] = None
+        touched_orders: Optional[List[int]] = None,
+        ctx: Optional[DecisionContext] = None,
     ) -> Optional[int]:
         """A return value of None signifies a lock"""
+        clued_card_orders = self.clued_card_orders if ctx is None else ctx.clued_card_orders
         touched_card_tuples = self.get_touched_card_tuples(clue_type, clue_value)
         if touched_orders is not None:
             _touched_orders = touched_orders
@@ -544,7 +548,7 @@ class ReactorGameState(GameState):
 
         num_cards_in_hand = len(self.hands[target_index])
         unclued_orders = [
-            card.order for card in self.hands[target_index] if card.order not in self.clued_card_orders
+            card.order for card in self.hands[target_index] if card.order not in clued_card_orders
         ]
         if not len(unclued_orders):
             return None
@@ -556,7 +560,7 @@ class ReactorGameState(GameState):
         # find the leftmost card to the right of a newly touched card
         newly_touched_indices = [
             i for i, card in enumerate(self.hands[target_index])
-            if card.order in _touched_orders and card.order not in self.clued_card_orders
+            if card.order in _touched_orders and card.order not in clued_card_orders
         ]
 
         if not len(newly_touched_indices):
@@ -571,7 +575,7 @@ class ReactorGameState(GameState):
                 continue
 
             card = self.hands[target_index][i]
-            if card.order in self.clued_card_orders:
+            if card.order in clued_card_orders:
                 continue
 
             if card.order in _touched_orders:
@@ -586,8 +590,10 @@ class ReactorGameState(GameState):
         target_index: int,
         clue_type: int,
         clue_value: int,
-        touched_orders: Optional[List[int]] = None
+        touched_orders: Optional[List[int]] = None,
+        ctx: Optional[DecisionContext] = None,
     ) -> int:
+        clued_card_orders = self.clued_card_orders if ctx is None else ctx.clued_card_orders
         touched_card_tuples = self.get_touched_card_tuples(clue_type, clue_value)
         if touched_orders is not None:
             _touched_orders = touched_orders
@@ -600,7 +606,7 @@ class ReactorGameState(GameState):
         num_cards_in_hand = len(self.hands[target_index])
         leftmost_newly_touched = None
         for i, card in enumerate(self.hands[target_index]):
-            if card.order in _touched_orders and card.order not in self.clued_card_orders:
+            if card.order in _touched_orders and card.order not in clued_card_orders:
                 leftmost_newly_touched = i
             
         if leftmost_newly_touched is None:
@@ -610,7 +616,7 @@ class ReactorGameState(GameState):
 
         unclued_indices = [
             i for i in range(num_cards_in_hand)
-            if self.hands[target_index][i].order not in self.clued_card_orders
+            if self.hands[target_index][i].order not in clued_card_orders
         ]
         x_to_unclued_indices = dict(enumerate(unclued_indices))
         unclued_indices_to_x = {idx: x for x, idx in x_to_unclued_indices.items()}
@@ -624,161 +630,175 @@ class ReactorGameState(GameState):
         ]
         return max(shifted_indices)
 
-    def get_stable_clues(self) -> Dict[Tuple[int, int, int], str]:
-        """(clue_value, clue_type, target_index) -> clue_type"""
+    def get_stable_clues(
+        self, ctx: Optional[DecisionContext] = None, clue_table: Optional[ClueTable] = None
+    ) -> Dict[Tuple[int, int, int], str]:
+        """(clue_value, clue_type, target_index) -> clue_type
+
+        clue_table, if given, must cover the targets considered here; it is
+        passed in so that the caller can score the clues off the same table.
+        """
+        if ctx is None:
+            ctx = get_decision_context(self)
         result = {}
         ordering = self.get_reactive_player_index_ordering()
 
-        for target_index in range(self.num_players):
-            if len(ordering) > 0 and target_index != ordering[0]:
-                continue
-            
-            target_hand = self.hands[target_index]
-            for clue_type in [RANK_CLUE, COLOR_CLUE]:
-                if clue_type == RANK_CLUE:
-                    all_clue_values = get_available_rank_clues(self.variant_name)
-                else:
-                    color_clues = get_available_color_clues(self.variant_name)
-                    all_clue_values = list(range(len(color_clues)))
+        target_indices = [
+            target_index for target_index in range(self.num_players)
+            if target_index != self.our_player_index and (not len(ordering) or target_index == ordering[0])
+        ]
+        if clue_table is None:
+            clue_table = ClueTable(self, target_indices, ctx)
 
-                for clue_value in all_clue_values:
-                    touched_card_tuples = self.get_touched_card_tuples(clue_type, clue_value)
-                    touched_cards = self.get_touched_cards(clue_type, clue_value, target_index)
-                    if not len(touched_cards):
+        for target_index in target_indices:
+            target_hand = self.hands[target_index]
+            playable_mask = clue_table.playable_masks[target_index]
+            trash_mask = clue_table.trash_masks[target_index]
+            for clue_type, clue_value in clue_table.get_clues(target_index):
+                clue_index = clue_table.get_index(clue_type, clue_value)
+                # oldest to newest
+                touched_cards = clue_table.get_touched_cards(clue_type, clue_value, target_index)
+                touched_card_orders = [card.order for card in touched_cards]
+                newly_touched_cards = [card for card in touched_cards if card.order not in ctx.clued_card_orders]
+
+                reveals_safe_action = False
+                for j, c in enumerate(target_hand):
+                    if c.order in ctx.play_orders:
                         continue
                     
-                    # oldest to newest
-                    touched_card_orders = [card.order for card in touched_cards]
-                    newly_touched_cards = [card for card in touched_cards if card.order not in self.clued_card_orders]
-
-                    reveals_safe_action = False
-                    for c in target_hand:
-                        if c.order in self.all_play_orders:
-                            continue
-                        
-                        if c.order in self.all_discard_orders:
-                            continue
-
-                        if c.order not in self.clued_card_orders:
-                            continue
-
-                        if c.order not in touched_card_orders:
-                            continue
-
-                        candidates = self.get_candidates(c.order)
-                        new_cands = candidates.intersection(touched_card_tuples)
-                        
-                        if self.is_playable(new_cands) or self.is_trash(new_cands):
-                            reveals_safe_action = True
-
-                    if reveals_safe_action:
-                        result[(clue_value, clue_type, target_index)] = "SAFE_ACTION"
-                    elif len(newly_touched_cards):
-                        if clue_type == RANK_CLUE:
-                            all_good_playable = self.every_good_card_of_rank_is_playable(clue_value)
-                            all_rank_trash = self.every_card_of_rank_is_trash(clue_value)
-
-                            if all_good_playable:
-                                if not self.is_weak_trash_card(newly_touched_cards[-1]):
-                                    result[(clue_value, clue_type, target_index)] = "DIRECT_PLAY"
-                            elif all_rank_trash:
-                                ref_play_index = self.get_index_of_ref_play_target(target_index, clue_type, clue_value)
-                                targeted_card = target_hand[ref_play_index]
-                                if self.is_playable_card(targeted_card) and targeted_card.to_tuple() not in self.all_play_tuples:
-                                    result[(clue_value, clue_type, target_index)] = "REF_PLAY"
-                            elif not all_good_playable:
-                                ref_discard_index = self.get_index_of_ref_discard_target(target_index, clue_type, clue_value)
-                                if ref_discard_index is None:
-                                    result[(clue_value, clue_type, target_index)] = "LOCK"
-                                else:
-                                    result[(clue_value, clue_type, target_index)] = "REF_DISCARD"
-                        else:
-                            ref_play_index = self.get_index_of_ref_play_target(target_index, clue_type, clue_value)
-                            playable_card = target_hand[ref_play_index]
-                            if self.is_playable_card(playable_card) and playable_card.to_tuple() not in self.all_play_tuples:
+                    if c.order in ctx.discard_orders:
+                        continue
+
+                    if c.order not in ctx.clued_card_orders:
+                        continue
+
+                    if c.order not in touched_card_orders:
+                        continue
+
+                    if playable_mask[clue_index, j] or trash_mask[clue_index, j]:
+                        reveals_safe_action = True
+
+                if reveals_safe_action:
+                    result[(clue_value, clue_type, target_index)] = "SAFE_ACTION"
+                elif len(newly_touched_cards):
+                    if clue_type == RANK_CLUE:
+                        all_good_playable = self.every_good_card_of_rank_is_playable(clue_value, ctx)
+                        all_rank_trash = self.every_card_of_rank_is_trash(clue_value)
+
+                        if all_good_playable:
+                            if newly_touched_cards[-1].to_tuple() not in ctx.weak_trash:
+                                result[(clue_value, clue_type, target_index)] = "DIRECT_PLAY"
+                        elif all_rank_trash:
+                            ref_play_index = self.get_index_of_ref_play_target(
+                                target_index, clue_type, clue_value, touched_card_orders, ctx
+                            )
+                            targeted_card = target_hand[ref_play_index]
+                            if targeted_card.to_tuple() in ctx.playables and targeted_card.to_tuple() not in ctx.play_tuples:
                                 result[(clue_value, clue_type, target_index)] = "REF_PLAY"
+                        elif not all_good_playable:
+                            ref_discard_index = self.get_index_of_ref_discard_target(
+                                target_index, clue_type, clue_value, touched_card_orders, ctx
+                            )
+                            if ref_discard_index is None:
+                                result[(clue_value, clue_type, target_index)] = "LOCK"
+                            else:
+                                result[(clue_value, clue_type, target_index)] = "REF_DISCARD"
+                    else:
+                        ref_play_index = self.get_index_of_ref_play_target(
+                            target_index, clue_type, clue_value, touched_card_orders, ctx
+                        )
+                        playable_card = target_hand[ref_play_index]
+                        if playable_card.to_tuple() in ctx.playables and playable_card.to_tuple() not in ctx.play_tuples:
+                            result[(clue_value, clue_type, target_index)] = "REF_PLAY"
 
         return result
 
-    def get_reactive_clues(self) -> Dict[Tuple[int, int, int], str]:
-        """(clue_value, clue_type, target_index) -> clue_type"""
-        if self.num_players > 3:
-            raise NotImplementedError
+    def get_reactive_clues(
+        self, ctx: Optional[DecisionContext] = None, clue_table: Optional[ClueTable] = None
+    ) -> Dict[Tuple[int, int, int], str]:
+        """(clue_value, clue_type, target_index) -> clue_type
+
+        The first player of the reactive ordering reacts, and every later player
+        of it can be the target, so with more than three players there are
+        several reacter/target pairs. Slot lookups are built once per hand and
+        touched slots come from one ClueTable (clue_table, if given), not per
+        clue.
+        """
+        if ctx is None:
+            ctx = get_decision_context(self)
         result = {}
         ordering = self.get_reactive_player_index_ordering()
 
         # TODO: response inversion
-        if not len(ordering):
+        if len(ordering) < 2:
             return {}
-        
+
         reacter_index = ordering[0]
-        reacter_hand = self.hands[reacter_index]
-        for target_index in [ordering[1]]:
+        reacter_cards = get_human_slot_lookup(self.hands[reacter_index])
+        reacter_candidates = get_human_slot_lookup(self.all_candidates_list[reacter_index])
+        finesse_slots = get_finesse_human_slots(len(self.hands[reacter_index]))
+        target_indices = ordering[1:]
+        if clue_table is None:
+            clue_table = ClueTable(self, target_indices, ctx)
+        for target_index in target_indices:
             target_hand = self.hands[target_index]
-            for clue_type in [RANK_CLUE, COLOR_CLUE]:
+            target_cards = get_human_slot_lookup(target_hand)
+            num_slots = len(target_hand)
+            # neither depends on the clue
+            pslot = get_reactive_playable_human_slot(
+                target_hand,
+                self.all_candidates_list[target_index],
+                ctx.playables,
+                ctx.play_orders
+            )
+            tslot = get_reactive_trash_human_slot(
+                target_hand,
+                self.all_candidates_list[target_index],
+                ctx.trash,
+                ctx.clued_card_orders,
+                ctx.discard_orders
+            )
+            for clue_type, clue_value in clue_table.get_clues(target_index):
+                touched_mask = clue_table.touched_masks[target_index][clue_table.get_index(clue_type, clue_value)]
+                # bot -> human slot ordering: [0, 1, 2, 3, 4] -> [5, 4, 3, 2, 1]
+                focused_slot = get_focused_human_slot(
+                    sorted(num_slots - i for i, touched in enumerate(touched_mask) if touched)
+                )
+                clue_key = (clue_value, clue_type, target_index)
+
                 if clue_type == RANK_CLUE:
-                    all_clue_values = get_available_rank_clues(self.variant_name)
+                    if pslot is None:
+                        for fslot in finesse_slots:
+                            target_card = target_cards[(focused_slot - fslot - 1) % num_slots + 1]
+                            if target_card.to_tuple() in self.one_away_from_playables:
+                                reacter_tuple_required = self.get_next_playable_card_tuple(target_card.suit_index)
+                                if reacter_tuple_required not in reacter_candidates[fslot]:
+                                    print(
+                                        f'[{clue_value}, {clue_type}, {target_index}] Attempted finessed card '
+                                        f'{reacter_tuple_required} cannot be on reacters slot {fslot}'
+                                    )
+                                    continue
+
+                                if reacter_cards[fslot].to_tuple() == reacter_tuple_required:
+                                    result[clue_key] = '2P0D_FINESSE'
+
+                                break
+                    else:
+                        reacter_card = reacter_cards.get((focused_slot - pslot - 1) % num_slots + 1)
+                        if (
+                            reacter_card is not None
+                            and reacter_card.to_tuple() in ctx.playables
+                            and reacter_card.to_tuple() != target_cards[pslot].to_tuple()
+                        ):
+                            result[clue_key] = '2P0D_PLAY'
                 else:
-                    color_clues = get_available_color_clues(self.variant_name)
-                    all_clue_values = list(range(len(color_clues)))
-
-                for clue_value in all_clue_values:
-                    slots_touched = self.get_touched_slots(clue_type, clue_value, target_index)
-                    if not len(slots_touched):
-                        continue
-                    
-                    # bot -> human slot ordering: [0, 1, 2, 3, 4] -> [5, 4, 3, 2, 1]
-                    slots_touched = sorted([len(target_hand) - x for x in slots_touched])
-                    focused_slot = (
-                        slots_touched[1] if (slots_touched[0] == 1 and len(slots_touched) > 1)
-                        else slots_touched[0]
-                    )
-                    pslot = get_reactive_playable_human_slot(
-                        target_hand,
-                        self.all_candidates_list[target_index],
-                        self.playables,
-                        self.all_play_orders
-                    )
-
-                    if clue_type == RANK_CLUE:
-                        if pslot is None:
-                            for fslot in [1, 5, 4, 3, 2]:
-                                target_fslot = (focused_slot - fslot - 1) % len(target_hand) + 1
-                                target_card = target_hand[-target_fslot]
-                                if target_card.to_tuple() in self.one_away_from_playables:
-                                    reacter_card = reacter_hand[-fslot]
-
-                                    reacter_tuple_required = self.get_next_playable_card_tuple(target_card.suit_index)
-                                    if reacter_tuple_required not in self.all_candidates_list[reacter_index][-fslot]:
-                                        print(
-                                            f'[{clue_value}, {clue_type}, {target_index}] Attempted finessed card '
-                                            f'{reacter_tuple_required} cannot be on reacters slot {fslot}'
-                                        )
-                                        continue
-                                    
-                                    if reacter_card.to_tuple() == reacter_tuple_required:
-                                        result[(clue_value, clue_type, target_index)] = '2P0D_FINESSE'
-
-                                    break
-                        else:
-                            reactive_pslot = (focused_slot - pslot - 1) % len(target_hand) + 1
-                            if self.is_playable_card(reacter_hand[-reactive_pslot]) and reacter_hand[-reactive_pslot].to_tuple() != target_hand[-pslot].to_tuple():
-                                result[(clue_value, clue_type, target_index)] = '2P0D_PLAY'
-                    else:                      
-                        tslot = get_reactive_trash_human_slot(
-                            target_hand,
-                            self.all_candidates_list[target_index],
-                            self.trash,
-                            self.clued_card_orders,
-                            self.all_discard_orders
-                        )
-                        if pslot is not None:
-                            reactive_tslot = (focused_slot - pslot - 1) % len(target_hand) + 1
-                            if not self.is_critical_card(reacter_hand[-reactive_tslot]):
-                                result[(clue_value, clue_type, target_index)] = '1P1D_DISCARD'
-                        elif tslot is not None:
-                            reactive_pslot = (focused_slot - tslot - 1) % len(target_hand) + 1
-                            if self.is_playable_card(reacter_hand[-reactive_pslot]):
-                                result[(clue_value, clue_type, target_index)] = '1P1D_PLAY'
+                    if pslot is not None:
+                        reacter_card = reacter_cards.get((focused_slot - pslot - 1) % num_slots + 1)
+                        if reacter_card is not None and not self.is_critical_card(reacter_card):
+                            result[clue_key] = '1P1D_DISCARD'
+                    elif tslot is not None:
+                        reacter_card = reacter_cards.get((focused_slot - tslot - 1) % num_slots + 1)
+                        if reacter_card is not None and reacter_card.to_tuple() in ctx.playables:
+                            result[clue_key] = '1P1D_PLAY'
 
         return result
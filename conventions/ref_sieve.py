@@ -1,27 +1,56 @@
+from clue_table import ClueTable
+from decision_context import DecisionContext, get_decision_context
 from game_state import (
-    GameState, get_all_touched_cards, RANK_CLUE, COLOR_CLUE, Card,
+    GameState, OrderedSet, get_all_touched_cards, RANK_CLUE, COLOR_CLUE, Card,
     get_available_color_clues, get_available_rank_clues
 )
-from typing import Dict, List, Tuple, Optional, Set
+from typing import Dict, List, Tuple, Optional, Sequence, Set
 from dataclasses import dataclass
 from copy import deepcopy
 from enum import Enum
 
+import numpy as np
+
 # WIPWIPWIP
 
 class BadRefSieveClue(Exception):
     pass
 
 
+def get_ref_play_index(touched: Sequence[bool], clued: Sequence[bool]) -> int:
+    """touched and clued are per card of the target, oldest to newest. Each
+    newly touched card references the next unclued card to its right
+    (wrapping around); the newest of those is the one to play."""
+    unclued_indices = [i for i, x in enumerate(clued) if not x]
+    return max(
+        unclued_indices[(x + 1) % len(unclued_indices)]
+        for x, i in enumerate(unclued_indices)
+        if touched[i]
+    )
+
+
+def get_ref_discard_index(touched: Sequence[bool], clued: Sequence[bool]) -> Optional[int]:
+    """The newest untouched, unclued card that isn't newer than the newest
+    newly touched card, or None if there is none (a lock)."""
+    newly_touched_indices = [i for i, (t, c) in enumerate(zip(touched, clued)) if t and not c]
+    for i in range(newly_touched_indices[-1], -1, -1):
+        if not touched[i] and not clued[i]:
+            return i
+    return None
+
+
 class RefSieveGameState(GameState):
+    journaled_attrs = ("play_orders", "discard_orders", "ctd_order")
+    use_endgame_solver = True
+
     def __init__(self, variant_name, player_names, our_player_index):
         super().__init__(variant_name, player_names, our_player_index)
-        self.discard_orders: Dict[int, List[int]] = {
-            i: []
+        self.discard_orders: Dict[int, OrderedSet] = {
+            i: OrderedSet()
             for i in range(self.num_players)
         }
-        self.play_orders: Dict[int, List[int]] = {
-            i: []
+        self.play_orders: Dict[int, OrderedSet] = {
+            i: OrderedSet()
             for i in range(self.num_players)
         }
         self.ctd_order: Dict[int, Optional[int]] = {
@@ -43,11 +72,11 @@ class RefSieveGameState(GameState):
         return {x for x in play_tuples if x[-1] > 0}
 
     @property
-    def our_play_orders(self) -> List[int]:
+    def our_play_orders(self) -> OrderedSet:
         return self.play_orders[self.our_player_index]
     
     @property
-    def our_discard_orders(self) -> List[int]:
+    def our_discard_orders(self) -> OrderedSet:
         return self.discard_orders[self.our_player_index]
 
     @property
@@ -73,15 +102,17 @@ class RefSieveGameState(GameState):
     def is_weak_trash_card(self, card: Card) -> bool:
         return card.to_tuple() in self.weak_trash
 
-    def every_good_card_of_rank_is_playable(self, rank: int) -> bool:
+    def every_good_card_of_rank_is_playable(self, rank: int, ctx: Optional[DecisionContext] = None) -> bool:
+        playables = self.playables if ctx is None else ctx.playables
+        trash = self.trash if ctx is None else ctx.trash
         all_touched_cards = get_all_touched_cards(RANK_CLUE, rank, self.variant_name)
         at_least_one_card_playable = False
         for (si, r) in all_touched_cards:
             if r != rank:
                 continue
-            if (si, r) not in self.playables and (si, r) not in self.trash:
+            if (si, r) not in playables and (si, r) not in trash:
                 return False
-            if (si, r) in self.playables:
+            if (si, r) in playables:
                 at_least_one_card_playable = True
         return at_least_one_card_playable
     
@@ -102,24 +133,27 @@ class RefSieveGameState(GameState):
         return self.is_trash(cands_after_clue)
 
     def update_play_discard_orders(self):
-        for player_index in range(self.num_players):
-            candidates_list = self.all_candidates_list[player_index]
-            for i, candidates in enumerate(candidates_list):
-                card = self.hands[player_index][i]
-                if self.is_playable(candidates) and card.order not in self.play_orders[player_index]:
-                    self.play_orders[player_index].append(card.order)
-
-                if self.is_trash(candidates):
-                    if card.order not in self.discard_orders[player_index]:
-                        self.discard_orders[player_index].append(card.order)
-                    self.play_orders[player_index] = [
-                        x for x in self.play_orders[player_index] if x != card.order
-                    ]
-
-                # assume good touch to some extent
-                if not len(candidates.difference(self.playables.union(self.trash))) and not self.is_trash(candidates) and card.order in self.clued_card_orders:
-                    if card.order not in self.play_orders[player_index]:
-                        self.play_orders[player_index].append(card.order)
+        queues = [self.play_orders, self.discard_orders]
+        changed_cards = self.get_changed_cards(queues)
+        if len(changed_cards):
+            playables, trash = self.playables, self.trash
+            playables_or_trash = playables.union(trash)
+            clued_card_orders = self.clued_card_orders
+        for player_index, card, candidates in changed_cards:
+            card_is_trash = len(candidates) and candidates.issubset(trash)
+            if len(candidates) and candidates.issubset(playables) and card.order not in self.play_orders[player_index]:
+                self.play_orders[player_index].add(card.order)
+
+            if card_is_trash:
+                if card.order not in self.discard_orders[player_index]:
+                    self.discard_orders[player_index].add(card.order)
+                self.play_orders[player_index].discard(card.order)
+
+            # assume good touch to some extent
+            if candidates.issubset(playables_or_trash) and not card_is_trash and card.order in clued_card_orders:
+                if card.order not in self.play_orders[player_index]:
+                    self.play_orders[player_index].add(card.order)
+        self.mark_cards_checked(queues)
 
     def handle_clue(
         self,
@@ -138,7 +172,7 @@ class RefSieveGameState(GameState):
                 if self.every_good_card_of_rank_is_playable(clue_value):
                     for order in newly_touched_card_orders:
                         if order not in self.play_orders[target_index]:
-                            self.play_orders[target_index].append(order)
+                            self.play_orders[target_index].add(order)
                 elif self.every_card_of_rank_is_trash(clue_value):
                     ref_action_index = self.get_index_of_ref_play_target(
                         target_index, clue_type, clue_value, touched_orders=card_orders
@@ -192,7 +226,7 @@ class RefSieveGameState(GameState):
                 self.ctd_order[target_index] = ctd.order
             elif ref_action_type == "play":
                 playable = self.hands[target_index][ref_action_index]
-                self.play_orders[target_index].append(playable.order)
+                self.play_orders[target_index].add(playable.order)
             else:
                 raise ValueError(ref_action_type)
             
@@ -200,24 +234,16 @@ class RefSieveGameState(GameState):
     
     def handle_play(self, player_index, order, suit_index, rank):
         result = super().handle_play(player_index, order, suit_index, rank)
-        self.play_orders[player_index] = [
-            x for x in self.play_orders[player_index] if x != order
-        ]
-        self.discard_orders[player_index] = [
-            x for x in self.discard_orders[player_index] if x != order
-        ]
+        self.play_orders[player_index].discard(order)
+        self.discard_orders[player_index].discard(order)
         self.ctd_order[player_index] = None
         self.update_play_discard_orders()
         return result
     
     def handle_discard(self, player_index, order, suit_index, rank):
         result = super().handle_discard(player_index, order, suit_index, rank)
-        self.discard_orders[player_index] = [
-            x for x in self.discard_orders[player_index] if x != order
-        ]
-        self.play_orders[player_index] = [
-            x for x in self.play_orders[player_index] if x != order
-        ]
+        self.discard_orders[player_index].discard(order)
+        self.play_orders[player_index].discard(order)
         self.ctd_order[player_index] = None
         self.update_play_discard_orders()
         return result
@@ -233,125 +259,66 @@ class RefSieveGameState(GameState):
         
         return None
     
-    def evaluate_clue_score(self, clue_type, clue_value, target_index) -> int:
-        all_cards_touched_by_clue = get_all_touched_cards(
-            clue_type, clue_value, self.variant_name
-        )
-        good_card_indices = [
-            i
-            for i in range(len(self.hands[target_index]))
-            if not self.is_trash_card(self.hands[target_index][i])
-        ]
-        bad_cards_touched = [
-            card for card in self.hands[target_index]
-            if self.is_trash_card(card) and card.to_tuple() in all_cards_touched_by_clue
-        ]
-        if len(bad_cards_touched):
-            score = 1000
-        else:
-            score = 1
-        
-        candidates_list = self.all_candidates_list[target_index]
-
-        for i in good_card_indices:
-            if self.hands[target_index][i].to_tuple() in all_cards_touched_by_clue:
-                new_candidates = candidates_list[i].intersection(
-                    all_cards_touched_by_clue
-                )
-            else:
-                new_candidates = candidates_list[i].difference(
-                    all_cards_touched_by_clue
-                )
-            score *= len(new_candidates)
-
-        return score
+    def evaluate_clue_score(
+        self, clue_type, clue_value, target_index, clue_table: Optional[ClueTable] = None
+    ) -> int:
+        if clue_table is None:
+            clue_table = ClueTable(self, [target_index])
+        score = 1000 if clue_table.touches_trash(clue_type, clue_value, target_index) else 1
+        return score * clue_table.get_candidates_product(clue_type, clue_value, target_index)
 
-    def get_index_of_ref_discard_target(
+    def get_touched_and_clued_masks(
         self,
         target_index: int,
         clue_type: int,
         clue_value: int,
-        touched_orders: Optional[List[int]] = None
-    ) -> Optional[int]:
-        all_touched_cards = get_all_touched_cards(clue_type, clue_value, self.variant_name)
+        touched_orders: Optional[List[int]] = None,
+        ctx: Optional[DecisionContext] = None,
+    ) -> Tuple[List[bool], List[bool]]:
+        clued_card_orders = self.clued_card_orders if ctx is None else ctx.clued_card_orders
+        target_hand = self.hands[target_index]
         if touched_orders is not None:
-            _touched_orders = touched_orders
+            touched_orders = set(touched_orders)
+            touched = [card.order in touched_orders for card in target_hand]
         else:
-            _touched_orders = [
-                card.order for card in self.hands[target_index]
-                if card.to_tuple() in all_touched_cards
-            ]
-
-        num_cards_in_hand = len(self.hands[target_index])
-        leftmost_newly_touched = None
+            all_touched_cards = get_all_touched_cards(clue_type, clue_value, self.variant_name)
+            touched = [card.to_tuple() in all_touched_cards for card in target_hand]
+        clued = [card.order in clued_card_orders for card in target_hand]
+        return touched, clued
 
-        for i, card in enumerate(self.hands[target_index]):
-            if card.order in _touched_orders and card.order not in self.clued_card_orders:
-                leftmost_newly_touched = i
-            
-        if leftmost_newly_touched is None:
+    def get_index_of_ref_discard_target(
+        self,
+        target_index: int,
+        clue_type: int,
+        clue_value: int,
+        touched_orders: Optional[List[int]] = None,
+        ctx: Optional[DecisionContext] = None,
+    ) -> Optional[int]:
+        touched, clued = self.get_touched_and_clued_masks(
+            target_index, clue_type, clue_value, touched_orders, ctx
+        )
+        if not any(t and not c for t, c in zip(touched, clued)):
             raise BadRefSieveClue(
                 f"Invalid Ref Discard clue: {target_index} {clue_type} {clue_value}"
             )
+        return get_ref_discard_index(touched, clued)
 
-        for j in range(num_cards_in_hand):
-            i = num_cards_in_hand - j - 1
-            if i > leftmost_newly_touched:
-                continue
-
-            card = self.hands[target_index][i]
-            if card.order in self.clued_card_orders:
-                continue
-
-            if card.order in _touched_orders:
-                continue
-
-            return i
-
-        return None
-    
     def get_index_of_ref_play_target(
         self,
         target_index: int,
         clue_type: int,
         clue_value: int,
-        touched_orders: Optional[List[int]] = None
+        touched_orders: Optional[List[int]] = None,
+        ctx: Optional[DecisionContext] = None,
     ) -> int:
-        all_touched_cards = get_all_touched_cards(clue_type, clue_value, self.variant_name)
-        if touched_orders is not None:
-            _touched_orders = touched_orders
-        else:
-            _touched_orders = [
-                card.order for card in self.hands[target_index]
-                if card.to_tuple() in all_touched_cards
-            ]
-
-        num_cards_in_hand = len(self.hands[target_index])
-        leftmost_newly_touched = None
-        for i, card in enumerate(self.hands[target_index]):
-            if card.order in _touched_orders and card.order not in self.clued_card_orders:
-                leftmost_newly_touched = i
-            
-        if leftmost_newly_touched is None:
+        touched, clued = self.get_touched_and_clued_masks(
+            target_index, clue_type, clue_value, touched_orders, ctx
+        )
+        if not any(t and not c for t, c in zip(touched, clued)):
             raise BadRefSieveClue(
                 f"Invalid Ref Play clue: {target_index} {clue_type} {clue_value}"
             )
-
-        unclued_indices = [
-            i for i in range(num_cards_in_hand)
-            if self.hands[target_index][i].order not in self.clued_card_orders
-        ]
-        x_to_unclued_indices = dict(enumerate(unclued_indices))
-        unclued_indices_to_x = {idx: x for x, idx in x_to_unclued_indices.items()}
-        newly_clued_indices = [
-            i for i in unclued_indices
-            if self.hands[target_index][i].order in _touched_orders
-        ]
-        shifted_indices = [
-            x_to_unclued_indices[(unclued_indices_to_x[i] + 1) % len(unclued_indices)]
-            for i in newly_clued_indices
-        ]
-        return max(shifted_indices)
+        return get_ref_play_index(touched, clued)
 
     def get_touched_cards(self, clue_type: int, clue_value: int, target_index: int) -> List[Card]:
         target_hand = self.hands[target_index]
@@ -359,74 +326,72 @@ class RefSieveGameState(GameState):
         touched_cards = [card for card in target_hand if card.to_tuple() in all_touched_cards]
         return touched_cards
 
-    def get_ref_sieve_clues(self) -> Dict[Tuple[int, int, int], str]:
-        # (clue_value, clue_type, target_index) -> clue_type
+    def get_ref_sieve_clues(
+        self, ctx: Optional[DecisionContext] = None, clue_table: Optional[ClueTable] = None
+    ) -> Dict[Tuple[int, int, int], str]:
+        """(clue_type, clue_value, target_index) -> what the clue means. Which
+        cards each clue touches comes from one ClueTable over every teammate;
+        whatever doesn't depend on the clue is worked out once per hand and
+        the rest per clue as (clue x card) masks."""
+        if ctx is None:
+            ctx = get_decision_context(self)
         result = {}
-        for target_index in range(self.num_players):
-            if target_index == self.our_player_index:
+        if clue_table is None:
+            clue_table = ClueTable(self, ctx=ctx)
+
+        # what a rank clue means depends only on the rank, not on the target
+        rank_to_meaning = {}
+        for clue_type, clue_value in clue_table.clue_type_values:
+            if clue_type != RANK_CLUE:
                 continue
-            
+            if self.every_good_card_of_rank_is_playable(clue_value, ctx):
+                rank_to_meaning[clue_value] = "DIRECT_PLAY"
+            elif self.every_card_of_rank_is_trash(clue_value):
+                rank_to_meaning[clue_value] = "REF_PLAY"
+            else:
+                rank_to_meaning[clue_value] = "REF_DISCARD"
+
+        for target_index in clue_table.target_indices:
             target_hand = self.hands[target_index]
-            for clue_type in [RANK_CLUE, COLOR_CLUE]:
-                if clue_type == RANK_CLUE:
-                    all_clue_values = get_available_rank_clues(self.variant_name)
+            # per card of the target, independent of the clue
+            clued = np.array([card.order in ctx.clued_card_orders for card in target_hand], dtype=bool)
+            queued = np.array([card.order in ctx.play_orders for card in target_hand], dtype=bool)
+            weak_trash = np.array([card.to_tuple() in ctx.weak_trash for card in target_hand], dtype=bool)
+            unqueued_playable = [
+                card.to_tuple() in ctx.playables and card.to_tuple() not in ctx.play_tuples
+                for card in target_hand
+            ]
+            # per (clue, card)
+            touched_mask = clue_table.touched_masks[target_index]
+            newly_touched_mask = touched_mask & ~clued
+            reveals_safe_action = (
+                touched_mask & clued & ~queued
+                & (clue_table.playable_masks[target_index] | clue_table.trash_masks[target_index])
+            ).any(axis=1)
+            touches_new = newly_touched_mask.any(axis=1)
+            touches_weak_trash = (newly_touched_mask & weak_trash).any(axis=1)
+
+            for clue_index, (clue_type, clue_value) in enumerate(clue_table.clue_type_values):
+                clue = (clue_type, clue_value, target_index)
+                if reveals_safe_action[clue_index]:
+                    result[clue] = "SAFE_ACTION"
+                    continue
+                if not touches_new[clue_index]:
+                    continue
+
+                meaning = "REF_PLAY" if clue_type == COLOR_CLUE else rank_to_meaning[clue_value]
+                if meaning == "DIRECT_PLAY" and touches_weak_trash[clue_index]:
+                    meaning = "REF_PLAY" if self.every_card_of_rank_is_trash(clue_value) else "REF_DISCARD"
+
+                if meaning == "DIRECT_PLAY":
+                    result[clue] = "DIRECT_PLAY"
+                elif meaning == "REF_PLAY":
+                    ref_play_index = get_ref_play_index(touched_mask[clue_index], clued)
+                    if unqueued_playable[ref_play_index]:
+                        result[clue] = "REF_PLAY"
+                elif get_ref_discard_index(touched_mask[clue_index], clued) is None:
+                    result[clue] = "LOCK"
                 else:
-                    color_clues = get_available_color_clues(self.variant_name)
-                    all_clue_values = list(range(len(color_clues)))
-
-                for clue_value in all_clue_values:
-                    all_touched_cards = get_all_touched_cards(clue_type, clue_value, self.variant_name)
-                    touched_cards = self.get_touched_cards(clue_type, clue_value, target_index)
-                    if not len(touched_cards):
-                        continue
-
-                    touched_card_orders = [card.order for card in touched_cards]
-                    newly_touched_cards = [card for card in touched_cards if card.order not in self.clued_card_orders]
-
-                    reveals_safe_action = False
-                    for c in target_hand:
-                        if c.order in self.all_play_orders:
-                            continue
-
-                        if c.order not in self.clued_card_orders:
-                            continue
-
-                        if c.order not in touched_card_orders:
-                            continue
-
-                        candidates = self.get_candidates(c.order)
-                        new_cands = candidates.intersection(all_touched_cards)
-                        
-                        if self.is_playable(new_cands) or self.is_trash(new_cands):
-                            reveals_safe_action = True
-
-                    if reveals_safe_action:
-                        result[(clue_type, clue_value, target_index)] = "SAFE_ACTION"
-                    elif len(newly_touched_cards):
-                        if clue_type == RANK_CLUE:
-                            nothing_is_trash = True
-                            for card in newly_touched_cards:
-                                if self.is_weak_trash_card(card):
-                                    nothing_is_trash = False
-
-                            if self.every_good_card_of_rank_is_playable(clue_value) and nothing_is_trash:
-                                result[(clue_type, clue_value, target_index)] = "DIRECT_PLAY"
-                            elif self.every_card_of_rank_is_trash(clue_value):
-                                ref_play_index = self.get_index_of_ref_play_target(target_index, clue_type, clue_value)
-                                playable_card = target_hand[ref_play_index]
-                                if self.is_playable_card(playable_card) and playable_card.to_tuple() not in self.all_play_tuples:
-                                    result[(clue_type, clue_value, target_index)] = "REF_PLAY"
-                            else:
-                                ref_discard_index = self.get_index_of_ref_discard_target(target_index, clue_type, clue_value)
-                                if ref_discard_index is None:
-                                    result[(clue_type, clue_value, target_index)] = "LOCK"
-                                else:
-                                    result[(clue_type, clue_value, target_index)] = "REF_DISCARD"
-                        else:
-                            ref_play_index = self.get_index_of_ref_play_target(target_index, clue_type, clue_value)
-                            playable_card = target_hand[ref_play_index]
-                            if self.is_playable_card(playable_card) and playable_card.to_tuple() not in self.all_play_tuples:
-                                result[(clue_type, clue_value, target_index)] = "REF_PLAY"
+                    result[clue] = "REF_DISCARD"
 
         return result
-
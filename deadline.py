@@ -0,0 +1,131 @@
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from belief import BeliefState
+from constants import RANK_CLUE
+from game_state import GameState, get_available_rank_clues
+
+# Never plan to use more than this fraction of our remaining clock on one move
+BUDGET_FRACTION = 0.2
+# Time kept in reserve for sending the action and network latency
+SAFETY_MARGIN_SECONDS = 1.0
+MAX_BUDGET_SECONDS = 20.0
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def get_time_budget(
+    times: List[int], player_index: int, time_taken: int = 0
+) -> Optional[float]:
+    """Seconds we can spend deciding, from the "clock" message (milliseconds).
+
+    In untimed games the server counts elapsed time down from zero, so the
+    values are negative and there is no budget."""
+    remaining_ms = times[player_index] - time_taken
+    if times[player_index] <= 0:
+        return None
+    budget = min(MAX_BUDGET_SECONDS, remaining_ms / 1000 * BUDGET_FRACTION)
+    return max(0.0, min(budget, remaining_ms / 1000 - SAFETY_MARGIN_SECONDS))
+
+
+class Deadline:
+    def __init__(
+        self, budget: Optional[float], clock: Callable[[], float] = time.perf_counter
+    ):
+        self.budget = budget
+        self.clock = clock
+        self.start = clock()
+
+    @property
+    def elapsed(self) -> float:
+        return self.clock() - self.start
+
+    @property
+    def remaining(self) -> Optional[float]:
+        if self.budget is None:
+            return None
+        return self.budget - self.elapsed
+
+    def expired(self) -> bool:
+        return self.budget is not None and self.elapsed >= self.budget
+
+    def check(self):
+        # cooperative checkpoint for code paths that have nothing usable yet
+        if self.expired():
+            raise DeadlineExceeded(f"{self.elapsed:.2f}s > {self.budget:.2f}s budget")
+
+
+class DeadlineMetrics:
+    """Counts per convention how often a timed decision ran over its budget and
+    how often we had to fall back to get_fallback_action."""
+
+    def __init__(self):
+        self.num_decisions: Dict[str, int] = defaultdict(int)
+        self.num_misses: Dict[str, int] = defaultdict(int)
+        self.num_fallbacks: Dict[str, int] = defaultdict(int)
+        self.max_overrun: Dict[str, float] = defaultdict(float)
+
+    def record(self, name: str, deadline: Deadline, used_fallback: bool):
+        if deadline.budget is None:
+            return
+        self.num_decisions[name] += 1
+        if used_fallback:
+            self.num_fallbacks[name] += 1
+        overrun = deadline.elapsed - deadline.budget
+        if overrun > 0:
+            self.num_misses[name] += 1
+            self.max_overrun[name] = max(self.max_overrun[name], overrun)
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{name}: {self.num_misses[name]}/{n} missed, "
+            f"{self.num_fallbacks[name]} fallbacks, "
+            f"max overrun {self.max_overrun[name]:.2f}s"
+            for name, n in sorted(self.num_decisions.items())
+        )
+
+
+def get_fallback_action(state: GameState, belief: Optional[BeliefState] = None) -> Tuple:
+    """A convention-agnostic move that only looks at our own candidates:
+    ("play", order), ("discard", order) or ("clue", target_index, clue_type, clue_value).
+    With a belief state, the discard is the unclued card least likely to be
+    critical instead of simply the oldest one.
+    """
+    hand = state.our_hand
+    candidates_list = state.our_candidates
+
+    for card, candidates in zip(hand, candidates_list):
+        if len(candidates) and state.is_playable(candidates):
+            return ("play", card.order)
+
+    if state.clue_tokens < 8:
+        for card, candidates in zip(hand, candidates_list):
+            if len(candidates) and state.is_trash(candidates):
+                return ("discard", card.order)
+        unclued_orders = state.get_unclued_orders(state.our_player_index)
+        if len(unclued_orders) and belief is not None:
+            critical_probs = belief.get_critical_probabilities()
+            trash_probs = belief.get_trash_probabilities()
+            slot = {card.order: i for i, card in enumerate(hand)}
+            return (
+                "discard",
+                min(
+                    unclued_orders,
+                    key=lambda x: (critical_probs[slot[x]], -trash_probs[slot[x]], slot[x]),
+                ),
+            )
+        if len(unclued_orders):
+            return ("discard", unclued_orders[0])
+
+    if state.clue_tokens >= 1:
+        target_index = (state.our_player_index + 1) % state.num_players
+        for rank in get_available_rank_clues(state.variant_name):
+            if len(state.get_touched_orders(RANK_CLUE, rank, target_index)):
+                return ("clue", target_index, RANK_CLUE, rank)
+
+    if state.clue_tokens < 8:
+        return ("discard", hand[0].order)
+    return ("play", hand[-1].order)
@@ -0,0 +1,38 @@
+from dataclasses import dataclass
+from typing import FrozenSet, Tuple
+
+from game_state import GameState
+
+
+@dataclass(frozen=True)
+class DecisionContext:
+    """The sets that Reactor and Ref Sieve clue enumeration test membership in
+    over and over. On the states themselves these are properties rebuilt on
+    every access; here they are built once per decision and passed along.
+    A context is only valid until the state it came from changes.
+    """
+    clued_card_orders: FrozenSet[int]
+    play_orders: FrozenSet[int]
+    discard_orders: FrozenSet[int]
+    play_tuples: FrozenSet[Tuple[int, int]]
+    playables: FrozenSet[Tuple[int, int]]
+    trash: FrozenSet[Tuple[int, int]]
+    weak_trash: FrozenSet[Tuple[int, int]]
+
+
+def get_decision_context(state: GameState) -> DecisionContext:
+    """For a state with play_orders and discard_orders queues (Reactor, Ref Sieve)."""
+    play_orders = frozenset(state.all_play_orders)
+    clued_card_orders = frozenset(state.clued_card_orders)
+    trash = frozenset(state.trash)
+    clued_tuples = {state.get_card(order).to_tuple() for order in clued_card_orders}
+    play_tuples = {state.get_card(order).to_tuple() for order in play_orders}
+    return DecisionContext(
+        clued_card_orders=clued_card_orders,
+        play_orders=play_orders,
+        discard_orders=frozenset(x for orders in state.discard_orders.values() for x in orders),
+        play_tuples=frozenset(x for x in play_tuples if x[-1] > 0),
+        playables=frozenset(state.playables),
+        trash=trash,
+        weak_trash=trash.union(x for x in clued_tuples if x[-1] > 0),
+    )
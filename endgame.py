@@ -0,0 +1,339 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from belief import BeliefState
+from deadline import Deadline
+from game_state import GameState, SUITS
+from sampler import HandSampler
+
+# The solver only kicks in once this few cards are left in the deck
+ENDGAME_DECK_THRESHOLD = 3
+NUM_SAMPLES = 16
+MIN_SAMPLES = 4
+NODE_BUDGET = 400000
+# Wall-clock bound on one solve in untimed games, where there is no clock to
+# take a budget from
+UNTIMED_BUDGET_SECONDS = 5.0
+
+# Canonical id of any card that can never be played again
+TRASH = -1
+# turns_left while the deck still has cards in it
+DECK_NOT_EMPTY = -1
+
+# (progress per suit, hands, deck index, clue tokens, bombs, current player, turns left)
+# Cards are ids suit * 5 + position - 1, where position is the card's place in
+# the play order of its suit (rank, or 6 - rank for reversed suits) and
+# progress counts the cards already played on each stack.
+Node = Tuple[Tuple[int, ...], Tuple[Tuple[int, ...], ...], int, int, int, int, int]
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+@dataclass
+class EndgameResult:
+    # ("play", order), ("discard", order) or ("clue",)
+    action: Tuple
+    expected_score: float
+    action_values: Dict[Tuple, float] = field(default_factory=dict)
+    num_samples: int = 0
+    num_nodes: int = 0
+    complete: bool = True
+
+
+class EndgameSearch:
+    """Exact search of one determinized endgame, where every hand and the order
+    of the deck are known. Teammates are assumed to play perfectly, so the value
+    of a position is the best score any sequence of actions reaches.
+
+    Positions are memoized in a transposition table over canonicalized nodes
+    (hands sorted, unplayable cards folded into TRASH), and a branch is cut as
+    soon as its achievable-score bound cannot beat the best line found so far.
+    """
+
+    def __init__(
+        self,
+        num_players: int,
+        num_suits: int,
+        deck: Tuple[int, ...],
+        node_budget: Optional[int] = None,
+        deadline: Optional[Deadline] = None,
+    ):
+        self.num_players = num_players
+        self.num_suits = num_suits
+        self.deck = deck
+        self.node_budget = node_budget
+        self.deadline = deadline
+        self.num_nodes = 0
+        self.table: Dict[Node, Tuple[int, bool]] = {}
+
+    def get_max_progress(self, progress, hands, deck_index) -> List[int]:
+        # how far each stack could still get with the cards that are left
+        counts = Counter(self.deck[deck_index:])
+        for hand in hands:
+            counts.update(hand)
+        max_progress = list(progress)
+        for suit in range(self.num_suits):
+            while max_progress[suit] < 5 and counts[suit * 5 + max_progress[suit]]:
+                max_progress[suit] += 1
+        return max_progress
+
+    def canonicalize(self, progress, hands, deck_index, clue_tokens, bombs, player, turns_left) -> Node:
+        max_progress = self.get_max_progress(progress, hands, deck_index)
+        canonical_hands = tuple(
+            tuple(
+                sorted(
+                    card
+                    if card != TRASH and progress[card // 5] <= card % 5 < max_progress[card // 5]
+                    else TRASH
+                    for card in hand
+                )
+            )
+            for hand in hands
+        )
+        return (progress, canonical_hands, deck_index, clue_tokens, bombs, player, turns_left)
+
+    def get_upper_bound(self, node: Node) -> int:
+        progress, hands, deck_index, _, _, _, turns_left = node
+        max_progress = self.get_max_progress(progress, hands, deck_index)
+        num_playable = sum(max_progress) - sum(progress)
+        if turns_left == DECK_NOT_EMPTY:
+            max_plays = len(self.deck) - deck_index + self.num_players
+        else:
+            max_plays = turns_left
+        return sum(progress) + min(num_playable, max_plays)
+
+    def get_children(self, node: Node, hand: Tuple[int, ...]) -> List[Tuple[Tuple, Optional[Node]]]:
+        """(action, child) pairs for the current player holding `hand`, where an
+        action is ("play"/"discard"/"misplay", slot) or ("clue",). A child of
+        None means the team struck out."""
+        progress, hands, deck_index, clue_tokens, bombs, player, turns_left = node
+        plays, clues, discards = [], [], []
+        seen = set()
+        for slot, card in enumerate(hand):
+            if card in seen:
+                continue
+            seen.add(card)
+            if card != TRASH and card % 5 == progress[card // 5]:
+                plays.append((("play", slot), self.get_child(node, hand, slot, True, False)))
+            elif card == TRASH and clue_tokens == 8 and bombs < 2:
+                # bombing trash is the only way to stall on 8 clues without a clue
+                plays.append((("misplay", slot), self.get_child(node, hand, slot, False, True)))
+            if clue_tokens < 8:
+                discards.append((("discard", slot), self.get_child(node, hand, slot, False, False)))
+
+        if clue_tokens >= 1 and self.num_players > 1:
+            next_turns_left = turns_left if turns_left == DECK_NOT_EMPTY else turns_left - 1
+            clues.append(
+                (
+                    ("clue",),
+                    (progress, hands, deck_index, clue_tokens - 1, bombs, (player + 1) % self.num_players, next_turns_left),
+                )
+            )
+
+        # trash discards first, they are the most likely to be good
+        discards.sort(key=lambda x: hand[x[0][1]] != TRASH)
+        children = plays + clues + discards
+        if not len(children):
+            # an empty hand in the final round with no clue to give
+            next_turns_left = turns_left if turns_left == DECK_NOT_EMPTY else turns_left - 1
+            children.append(
+                (("pass",), (progress, hands, deck_index, clue_tokens, bombs, (player + 1) % self.num_players, next_turns_left))
+            )
+        return children
+
+    def get_child(self, node: Node, hand, slot: int, is_play: bool, is_misplay: bool) -> Optional[Node]:
+        progress, hands, deck_index, clue_tokens, bombs, player, turns_left = node
+        card = hand[slot]
+        new_hand = list(hand[:slot] + hand[slot + 1 :])
+        if is_play:
+            suit = card // 5
+            progress = progress[:suit] + (progress[suit] + 1,) + progress[suit + 1 :]
+            if progress[suit] == 5:
+                clue_tokens = min(8, clue_tokens + 1)
+        elif is_misplay:
+            bombs += 1
+            if bombs >= 3:
+                return None
+        else:
+            clue_tokens += 1
+
+        if deck_index < len(self.deck):
+            new_hand.append(self.deck[deck_index])
+            deck_index += 1
+            if deck_index == len(self.deck):
+                # everyone, including us, gets one more turn
+                turns_left = self.num_players
+        else:
+            turns_left -= 1
+
+        new_hands = hands[:player] + (tuple(new_hand),) + hands[player + 1 :]
+        return (progress, new_hands, deck_index, clue_tokens, bombs, (player + 1) % self.num_players, turns_left)
+
+    def search(self, node: Node, alpha: int) -> int:
+        """Best final score reachable from node. A result <= alpha is only an
+        upper bound, which is all the caller needs to discard the branch."""
+        self.num_nodes += 1
+        if self.node_budget is not None and self.num_nodes > self.node_budget:
+            raise _BudgetExceeded
+        if self.deadline is not None and self.num_nodes % 1024 == 0 and self.deadline.expired():
+            raise _BudgetExceeded
+
+        node = self.canonicalize(*node)
+        progress, hands, _, _, _, player, turns_left = node
+        score = sum(progress)
+        if turns_left == 0 or score == 5 * self.num_suits:
+            return score
+
+        entry = self.table.get(node)
+        if entry is not None:
+            value, is_exact = entry
+            if is_exact or value <= alpha:
+                return value
+
+        bound = self.get_upper_bound(node)
+        if bound <= alpha:
+            return bound
+
+        best = -1
+        for _, child in self.get_children(node, hands[player]):
+            value = 0 if child is None else self.search(child, max(alpha, best))
+            if value > best:
+                best = value
+                if best >= bound:
+                    break
+
+        self.table[node] = (best, best > alpha)
+        return best
+
+    def evaluate_root(self, node: Node) -> Dict[Tuple, int]:
+        """Exact value of every action of the current player, keyed by
+        ("play", slot), ("discard", slot) or ("clue",)."""
+        progress, hands, _, clue_tokens, bombs, player, _ = node
+        hand = hands[player]
+        result = {}
+        for slot, card in enumerate(hand):
+            if card != TRASH and card % 5 == progress[card // 5]:
+                child = self.get_child(node, hand, slot, True, False)
+            else:
+                # playing a card that is not playable is a bomb
+                child = self.get_child(node, hand, slot, False, True)
+            result[("play", slot)] = 0 if child is None else self.search(child, -1)
+            if clue_tokens < 8:
+                child = self.get_child(node, hand, slot, False, False)
+                result[("discard", slot)] = self.search(child, -1)
+
+        for action, child in self.get_children(node, hand):
+            if action == ("clue",):
+                result[action] = self.search(child, -1)
+        return result
+
+
+def get_card_id(state: GameState, suit_index: int, rank: int) -> int:
+    position = 6 - rank if "Reversed" in SUITS[state.variant_name][suit_index] else rank
+    return suit_index * 5 + position - 1
+
+
+def get_progress(state: GameState) -> Tuple[int, ...]:
+    return tuple(
+        6 - stack if "Reversed" in SUITS[state.variant_name][suit] else stack
+        for suit, stack in enumerate(state.stacks)
+    )
+
+
+def get_tie_break(state: GameState, action: Tuple) -> Tuple[int, int]:
+    # Values only differ between determinizations, so equally scored actions are
+    # ranked by how little they gamble on our unknown cards: known plays, then
+    # stalling, then known trash, then other discards, then blind plays
+    if action[0] == "clue":
+        return (3, 0)
+    candidates = state.our_candidates[action[1]]
+    if action[0] == "play":
+        return (4 if state.is_playable(candidates) else 0, -action[1])
+    return (2 if state.is_trash(candidates) else 1, -action[1])
+
+
+def get_final_round_turns_left(state: GameState) -> int:
+    """Turns left in the game, ours included, once the deck is empty: everyone
+    gets one after the last card is drawn, less those already taken."""
+    if state.final_round_turn is None:
+        return state.num_players
+    # it is our turn, so there is at least that one
+    return max(1, state.num_players - (state.turn - state.final_round_turn))
+
+
+def solve_endgame(
+    state: GameState,
+    num_samples: int = NUM_SAMPLES,
+    min_samples: int = MIN_SAMPLES,
+    node_budget: Optional[int] = NODE_BUDGET,
+    deadline: Optional[Deadline] = None,
+    seed: int = 0,
+    belief: Optional[BeliefState] = None,
+) -> Optional[EndgameResult]:
+    """Averages the exact value of each of our actions over determinizations of
+    our hand (sampled with the help of belief, if given) and the deck. Returns
+    None if fewer than min_samples searches finished within the node budget /
+    deadline."""
+    rng = np.random.default_rng(seed)
+    sampler = HandSampler(state, belief=belief)
+    sampled_hands = sampler.sample(num_samples, rng)
+    deck_counts = sampler.get_deck_counts(sampled_hands)
+    progress = get_progress(state)
+    num_suits = len(state.stacks)
+    totals: Dict[Tuple, float] = {}
+    num_done = 0
+    num_nodes = 0
+
+    for sampled_hand, sampled_deck_counts in zip(sampled_hands, deck_counts):
+        our_hand = sampler.to_identities(sampled_hand)
+        deck_indices = np.repeat(np.arange(len(sampled_deck_counts)), sampled_deck_counts)
+        deck = sampler.to_identities(rng.permutation(deck_indices))
+        hands = tuple(
+            tuple(get_card_id(state, *x) for x in our_hand)
+            if player_index == state.our_player_index
+            else tuple(get_card_id(state, *card.to_tuple()) for card in state.hands[player_index])
+            for player_index in range(state.num_players)
+        )
+        deck_ids = tuple(get_card_id(state, *x) for x in deck)
+        turns_left = DECK_NOT_EMPTY if len(deck_ids) else get_final_round_turns_left(state)
+        node = (progress, hands, 0, state.clue_tokens, state.bombs, state.our_player_index, turns_left)
+
+        search = EndgameSearch(
+            state.num_players,
+            num_suits,
+            deck_ids,
+            node_budget=None if node_budget is None else node_budget - num_nodes,
+            deadline=deadline,
+        )
+        try:
+            values = search.evaluate_root(node)
+        except _BudgetExceeded:
+            num_nodes += search.num_nodes
+            break
+        num_nodes += search.num_nodes
+        num_done += 1
+        for action, value in values.items():
+            totals[action] = totals.get(action, 0) + value
+
+    if num_done < min_samples or not len(totals):
+        return None
+
+    best = max(totals, key=lambda x: (totals[x], get_tie_break(state, x)))
+    action_values = {
+        action if action[0] == "clue" else (action[0], state.our_hand[action[1]].order): total / num_done
+        for action, total in totals.items()
+    }
+    best_action = best if best[0] == "clue" else (best[0], state.our_hand[best[1]].order)
+    return EndgameResult(
+        action=best_action,
+        expected_score=action_values[best_action],
+        action_values=action_values,
+        num_samples=num_done,
+        num_nodes=num_nodes,
+        complete=num_done == num_samples,
+    )
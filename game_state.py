@@ -1,8 +1,11 @@
 from constants import MAX_CLUE_NUM, COLOR_CLUE, RANK_CLUE
 
 import os
+import copy
+import contextlib
+import functools
 import json
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
 from dataclasses import dataclass
 import numpy as np
 import itertools
@@ -52,6 +55,136 @@ class Card:
         return (self.suit_index, self.rank)
 
 
+class OrderedSet:
+    """Card orders in the order they were added, with constant time membership
+    tests, for queues (play orders, discard orders) that are both consumed
+    front first and checked against over and over. Compares equal to a list
+    holding the same orders in the same order."""
+
+    def __init__(self, orders: Iterable[int] = ()):
+        self.orders: Dict[int, None] = dict.fromkeys(orders)
+
+    def add(self, order: int):
+        self.orders[order] = None
+
+    def discard(self, order: int):
+        self.orders.pop(order, None)
+
+    def __contains__(self, order) -> bool:
+        return order in self.orders
+
+    def __iter__(self):
+        return iter(self.orders)
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def __getitem__(self, i: int) -> int:
+        # the queue's head (and tail) are read every turn, so don't copy the
+        # whole queue for them
+        if len(self.orders) and i in (0, -1):
+            return next(iter(self.orders) if i == 0 else reversed(self.orders))
+        return list(self.orders)[i]
+
+    def __eq__(self, other):
+        if isinstance(other, (OrderedSet, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self.orders))
+
+
+# values that are never mutated in place, so a fork can always share them
+IMMUTABLE_TYPES = (int, float, bool, str, bytes, tuple, frozenset, type(None))
+
+
+def fork_value(value, share_sets: bool, memo: Dict[int, object]):
+    """Copies the dicts and lists of `value` (and sets, unless share_sets)
+    while sharing everything that is never mutated in place: Cards, tuples and
+    other immutables. Anything else is deepcopied. memo keeps aliasing intact."""
+    if isinstance(value, (Card,) + IMMUTABLE_TYPES):
+        return value
+    if isinstance(value, set) and share_sets:
+        # a set also reached through an attribute that does copy its sets
+        # must end up as one object in the fork too
+        return memo.setdefault(id(value), value)
+
+    key = id(value)
+    if key in memo:
+        return memo[key]
+    if isinstance(value, dict):
+        result = memo[key] = {}
+        for k, v in value.items():
+            result[k] = fork_value(v, share_sets, memo)
+    elif isinstance(value, list):
+        result = memo[key] = []
+        result.extend(fork_value(v, share_sets, memo) for v in value)
+    elif isinstance(value, set):
+        result = memo[key] = set(value)
+    elif isinstance(value, OrderedSet):
+        result = memo[key] = OrderedSet(value)
+    else:
+        result = copy.deepcopy(value, memo)
+    return result
+
+
+# stands in for an attribute or dict key that did not exist before an action
+MISSING = object()
+
+
+class JournalEntry:
+    """What one apply_* call changed, as what to put back: the previous value
+    of each attribute it changed and of each dict item it changed. Containers
+    that get changed in place are swapped for structural copies (fork_value)
+    when they are first saved, so the entry holds the very objects the state
+    had before."""
+
+    def __init__(self):
+        self.attrs: Dict[str, object] = {}
+        self.items: List[Tuple[dict, object, object]] = []
+        self.saved_items: Set[Tuple[int, object]] = set()
+        # shared by every copy made for this entry, to keep aliasing intact;
+        # dropped once the action is done
+        self.memo: Optional[Dict[int, object]] = {}
+
+    def save_attr(self, state: "GameState", name: str, in_place: bool):
+        if name in self.attrs:
+            return
+        value = state.__dict__.get(name, MISSING)
+        self.attrs[name] = value
+        if in_place and value is not MISSING:
+            share_sets = name in state.shared_set_attrs
+            state.__dict__[name] = fork_value(value, share_sets, self.memo)
+
+    def save_item(self, container: dict, key):
+        if (id(container), key) in self.saved_items:
+            return
+        self.saved_items.add((id(container), key))
+        value = container.get(key, MISSING)
+        self.items.append((container, key, value))
+        if value is not MISSING:
+            container[key] = fork_value(value, False, self.memo)
+
+    def close(self):
+        self.memo = None
+        self.saved_items = set()
+
+    def restore(self, state: "GameState"):
+        for container, key, value in reversed(self.items):
+            if value is MISSING:
+                del container[key]
+            else:
+                container[key] = value
+        for name, value in self.attrs.items():
+            if value is MISSING:
+                del state.__dict__[name]
+            else:
+                state.__dict__[name] = value
+
+
 def get_available_rank_clues(variant_name: str):
     for substr in [
         "Pink-Ones",
@@ -202,9 +335,12 @@ def get_all_cards_with_multiplicity(variant_name: str) -> List[Tuple[int, int]]:
     return cards
 
 
+# Clue enumeration asks for the same few clues over and over; the result is
+# frozen so that the cached copy can be handed out safely
+@functools.lru_cache(maxsize=None)
 def get_all_touched_cards(
     clue_type: int, clue_value: int, variant_name: str
-) -> Set[Tuple[int, int]]:
+) -> FrozenSet[Tuple[int, int]]:
     available_color_clues = get_available_color_clues(variant_name)
     prism_touch = list(zip(available_color_clues * 5, [1, 2, 3, 4, 5]))
     cards = set()
@@ -463,7 +599,7 @@ def get_all_touched_cards(
                     }
                 ):
                     cards.add((i, rank))
-    return cards
+    return frozenset(cards)
 
 
 def get_all_non_touched_cards(clue_type: int, clue_value: int, variant_name: str):
@@ -473,6 +609,7 @@ def get_all_non_touched_cards(clue_type: int, clue_value: int, variant_name: str
     )
 
 
+@functools.lru_cache(maxsize=None)
 def is_brownish_pinkish(variant_name):
     num_ranks_touching_card = {x: 0 for x in get_all_cards(variant_name)}
     for rank in get_available_rank_clues(variant_name):
@@ -487,6 +624,7 @@ def is_brownish_pinkish(variant_name):
     return False
 
 
+@functools.lru_cache(maxsize=None)
 def is_whiteish_rainbowy(variant_name):
     available_color_clues = get_available_color_clues(variant_name)
     num_colors_touching_card = {x: 0 for x in get_all_cards(variant_name)}
@@ -589,6 +727,18 @@ def get_starting_efficiency(num_players: int, variant_name: str):
 
 
 class GameState:
+    # attributes whose leaves are per-card sets of identities, shared by fork()
+    shared_set_attrs = {"all_filtrations", "all_possibilities_list", "all_candidates_list"}
+    # convention fields that the handlers change, in place or by rebinding, and
+    # every apply_* call journals on top of what the base handlers record
+    journaled_attrs: Tuple[str, ...] = ()
+    # whether the endgame solver may take over our plays and discards; it
+    # assumes teammates see everything, so conventions that read meaning into
+    # plays and discards (hat clues, chop) leave it off
+    use_endgame_solver: bool = False
+    # the entry of the apply_* call in progress, if any
+    open_entry: Optional[JournalEntry] = None
+
     def __init__(self, variant_name, player_names, our_player_index):
         self.set_variant_name(variant_name, len(player_names))
         self.player_names: List[str] = player_names
@@ -623,6 +773,21 @@ class GameState:
         self.turn: int = 0
         self.max_score: int = 99999
         self.notes: Dict[int, str] = {}
+        # identifies the game on the server (see snapshot.get_game_id), if known
+        self.game_id: Optional[str] = None
+        # the turn the final round starts on, once the last card has been drawn
+        self.final_round_turn: Optional[int] = None
+        # the Zobrist hash of the stacks, discards and hands (see zobrist.py),
+        # kept up to date by the handlers once something has hashed the state
+        self.zobrist_hash: Optional[int] = None
+
+        # what each apply_* call changed, popped by undo()
+        self.journal: List[JournalEntry] = []
+
+        # what get_changed_cards compares against: order -> (candidates, queue
+        # memberships) and the stacks/discards as of the last mark_cards_checked
+        self.checked_cards: Dict[int, Tuple] = {}
+        self.checked_status: Optional[Tuple] = None
 
     @property
     def all_base_filtrations(self) -> Dict[int, List[Set[Tuple[int, int]]]]:
@@ -766,6 +931,13 @@ class GameState:
                 result[card.order] = (player_index, i)
         return result
 
+    @property
+    def zobrist_keys(self):
+        # imported here since zobrist imports this module
+        from zobrist import get_zobrist_keys
+
+        return get_zobrist_keys(self.variant_name)
+
     def get_next_playable_card_tuple(self, suit_index: int) -> Tuple[int, int]:
         incr = (-1 if "Reversed" in SUITS[self.variant_name][suit_index] else 1)
         return (suit_index, self.stacks[suit_index] + incr)
@@ -996,6 +1168,7 @@ class GameState:
                 if query_candidates
                 else self.all_possibilities_list[player_index]
             )
+            replace = self.set_candidates if query_candidates else self.set_possibilities
             fk_orders = self.get_fully_known_card_orders(player_index, query_candidates)
             for i, poss in enumerate(poss_list):
                 this_order = self.hands[player_index][i].order
@@ -1012,7 +1185,10 @@ class GameState:
                     if max_num_cards[(suit, rank)] == copies_visible:
                         removed_cards.add((suit, rank))
 
-                poss_list[i] = poss_list[i].difference(removed_cards)
+                # sets are replaced only when something changes, which is what
+                # lets caches keyed on set identity (fork, zobrist) stay warm
+                if len(removed_cards):
+                    replace(player_index, i, poss_list[i].difference(removed_cards))
 
     def _process_doubletons(self, query_candidates=True):
         maxcds = self.max_num_cards
@@ -1022,6 +1198,7 @@ class GameState:
                 if query_candidates
                 else self.all_possibilities_list[player_index]
             )
+            replace = self.set_candidates if query_candidates else self.set_possibilities
             doubleton_orders = self.get_doubleton_orders(player_index, query_candidates)
             for doubleton, orders in doubleton_orders.items():
                 if len(orders) < 2:
@@ -1035,7 +1212,8 @@ class GameState:
 
                 for i, _ in enumerate(poss_list):
                     if self.hands[player_index][i].order not in orders:
-                        poss_list[i] = poss_list[i].difference({first, second})
+                        if not poss_list[i].isdisjoint({first, second}):
+                            replace(player_index, i, poss_list[i].difference({first, second}))
 
     def _process_tripletons(self, query_candidates=True):
         maxcds = self.max_num_cards
@@ -1045,6 +1223,7 @@ class GameState:
                 if query_candidates
                 else self.all_possibilities_list[player_index]
             )
+            replace = self.set_candidates if query_candidates else self.set_possibilities
             tripleton_orders = self.get_tripleton_orders(player_index, query_candidates)
             for tripleton, orders in tripleton_orders.items():
                 if len(orders) < 3:
@@ -1060,7 +1239,25 @@ class GameState:
 
                 for i, _ in enumerate(poss_list):
                     if self.hands[player_index][i].order not in orders:
-                        poss_list[i] = poss_list[i].difference({first, second, third})
+                        if not poss_list[i].isdisjoint({first, second, third}):
+                            replace(player_index, i, poss_list[i].difference({first, second, third}))
+
+    def set_candidates(self, player_index: int, i: int, candidates: Set[Tuple[int, int]]):
+        self._set_identities(0, self.all_candidates_list, player_index, i, candidates)
+
+    def set_possibilities(self, player_index: int, i: int, possibilities: Set[Tuple[int, int]]):
+        self._set_identities(1, self.all_possibilities_list, player_index, i, possibilities)
+
+    def _set_identities(self, kind: int, identities_lists, player_index: int, i: int, identities):
+        # the one place candidates and possibilities get replaced, so that the
+        # running Zobrist hash sees every change
+        identities_list = identities_lists[player_index]
+        if self.zobrist_hash is not None:
+            keys = self.zobrist_keys
+            order = self.hands[player_index][i].order
+            self.zobrist_hash ^= keys.get_set_hash(kind, order, identities_list[i])
+            self.zobrist_hash ^= keys.get_set_hash(kind, order, identities)
+        identities_list[i] = identities
 
     def process_visible_cards(self):
         for _ in range(3):
@@ -1071,6 +1268,163 @@ class GameState:
             self._process_doubletons(False)
             self._process_tripletons(False)
 
+    def get_status_key(self) -> Tuple:
+        """Changes whenever playables or trash may have."""
+        return (tuple(self.stacks), frozenset(self.discards.items()))
+
+    def get_checked_key(
+        self, player_index: int, order: int, candidates, queues: List[Dict[int, OrderedSet]]
+    ) -> Tuple:
+        return (candidates,) + tuple(order in queue[player_index] for queue in queues)
+
+    def get_changed_cards(
+        self, queues: List[Dict[int, OrderedSet]]
+    ) -> List[Tuple[int, Card, Set[Tuple[int, int]]]]:
+        """(player_index, card, candidates) of every card that may need its place
+        in queues (per player dicts of orders) updated since mark_cards_checked
+        was last called: those whose candidates were replaced, which the
+        deduction above always does on a change, or whose membership in a queue
+        changed. If the stacks or discards changed, every card is returned."""
+        recheck_all = self.get_status_key() != self.checked_status
+        result = []
+        for player_index in range(self.num_players):
+            for card, candidates in zip(self.hands[player_index], self.all_candidates_list[player_index]):
+                checked = self.checked_cards.get(card.order)
+                if (
+                    recheck_all
+                    or checked is None
+                    or checked[0] is not candidates
+                    or checked != self.get_checked_key(player_index, card.order, candidates, queues)
+                ):
+                    result.append((player_index, card, candidates))
+        return result
+
+    def mark_cards_checked(self, queues: List[Dict[int, OrderedSet]]):
+        self.journal_attrs("checked_status", "checked_cards")
+        self.checked_status = self.get_status_key()
+        self.checked_cards = {
+            card.order: self.get_checked_key(player_index, card.order, candidates, queues)
+            for player_index in range(self.num_players)
+            for card, candidates in zip(self.hands[player_index], self.all_candidates_list[player_index])
+        }
+
+    def fork(self) -> "GameState":
+        """A copy of this state to apply hypothetical actions to.
+
+        The sets of identities held for each card (everything under
+        shared_set_attrs) are only ever replaced, never mutated, so the fork
+        shares them with this state instead of copying them; only the lists and
+        dicts around them are new. This makes a fork cost one pointer per card
+        rather than a full copy of every candidate set, which is what deepcopy
+        spends nearly all of its time on."""
+        result = copy.copy(self)
+        result.__dict__.update(self._get_forked_attrs())
+        result.journal = []
+        return result
+
+    def _get_forked_attrs(self) -> Dict[str, object]:
+        # the shared sets go into memo first, so that anything else pointing
+        # at one of them (say a deepcopied convention object) keeps sharing it
+        memo = {}
+        forked = {}
+        for name in self.shared_set_attrs:
+            if name in self.__dict__:
+                forked[name] = fork_value(self.__dict__[name], True, memo)
+        return {
+            name: forked[name] if name in forked else fork_value(value, False, memo)
+            for name, value in self.__dict__.items()
+            if name != "journal"
+        }
+
+    @contextlib.contextmanager
+    def _journal_entry(self):
+        # the per-card lists and convention fields are changed all over the
+        # handlers (conventions included), so they are saved up front; the
+        # rest is saved by whichever handler changes it
+        entry = self.open_entry = JournalEntry()
+        try:
+            for name in sorted(self.shared_set_attrs) + list(self.journaled_attrs):
+                entry.save_attr(self, name, in_place=True)
+            # the handlers keep it up to date if it is set at all
+            entry.save_attr(self, "zobrist_hash", in_place=False)
+            yield
+        except BaseException:
+            # an action that blows up halfway leaves the state as it was
+            entry.restore(self)
+            raise
+        finally:
+            del self.open_entry
+            entry.close()
+        self.journal.append(entry)
+
+    def journal_attrs(self, *names: str, in_place: bool = False):
+        """Saves attributes the apply_* call in progress is about to change:
+        just the old value if they only get rebound, or, if in_place, the old
+        object, giving the state a copy to change instead."""
+        if self.open_entry is not None:
+            for name in names:
+                self.open_entry.save_attr(self, name, in_place)
+
+    def journal_items(self, container: dict, keys: Iterable):
+        """Saves the items of container under keys that the apply_* call in
+        progress is about to change, the same way."""
+        if self.open_entry is not None:
+            for key in keys:
+                self.open_entry.save_item(container, key)
+
+    def undo(self):
+        """Rolls back the most recent apply_* call exactly."""
+        self.journal.pop().restore(self)
+
+    def end_turn(self, player_index: int):
+        self.journal_attrs("turn", "current_player_index")
+        self.turn += 1
+        self.current_player_index = (player_index + 1) % self.num_players
+
+    # The apply_* methods play out a whole action the way the server would
+    # report it (clue tokens, strikes and the turn passing included) and journal
+    # it, so that search code can explore it in place and undo() it afterwards.
+    # Draws are applied separately with apply_draw.
+    def apply_clue(
+        self,
+        clue_giver: int,
+        target_index: int,
+        clue_type: int,
+        clue_value: int,
+        card_orders,
+    ):
+        with self._journal_entry():
+            self.handle_clue(clue_giver, target_index, clue_type, clue_value, card_orders)
+            self.journal_attrs("clue_tokens")
+            self.clue_tokens -= 1
+            self.end_turn(clue_giver)
+
+    def apply_play(self, player_index: int, order: int, suit_index: int, rank: int):
+        with self._journal_entry():
+            if (suit_index, rank) in self.playables:
+                self.handle_play(player_index, order, suit_index, rank)
+                final_rank = 1 if "Reversed" in SUITS[self.variant_name][suit_index] else 5
+                if rank == final_rank:
+                    self.journal_attrs("clue_tokens")
+                    self.clue_tokens = min(MAX_CLUE_NUM, self.clue_tokens + 1)
+            else:
+                self.handle_discard(player_index, order, suit_index, rank)
+                self.journal_attrs("bombs")
+                self.bombs += 1
+                self.handle_strike(order)
+            self.end_turn(player_index)
+
+    def apply_discard(self, player_index: int, order: int, suit_index: int, rank: int):
+        with self._journal_entry():
+            self.handle_discard(player_index, order, suit_index, rank)
+            self.journal_attrs("clue_tokens")
+            self.clue_tokens = min(MAX_CLUE_NUM, self.clue_tokens + 1)
+            self.end_turn(player_index)
+
+    def apply_draw(self, player_index: int, order: int, suit_index: int, rank: int):
+        with self._journal_entry():
+            self.handle_draw(player_index, order, suit_index, rank)
+
     def print(self):
         our_player_name = self.player_names[self.our_player_index]
         current_player = self.player_names[self.current_player_index]
@@ -1155,6 +1509,7 @@ class GameState:
         print(output)
 
     def remove_card_from_hand(self, player_index, order):
+        self.journal_items(self.hands, [player_index])
         hand = self.hands[player_index]
         card_index = None
         for i in range(len(hand)):
@@ -1163,6 +1518,8 @@ class GameState:
                 card_index = i
 
         assert card_index is not None, f"can't find #{order} in {player_index}'s hand"
+        if self.zobrist_hash is not None:
+            self.zobrist_hash ^= self.zobrist_keys.get_card_hash(self, player_index, card_index)
         card = hand[card_index]
         del hand[card_index]
         del self.all_candidates_list[player_index][card_index]
@@ -1172,6 +1529,7 @@ class GameState:
 
     def handle_draw(self, player_index, order, suit_index, rank):
         new_card = Card(order=order, suit_index=suit_index, rank=rank)
+        self.journal_items(self.hands, [player_index])
         self.hands[player_index].append(new_card)
         self.all_candidates_list[player_index].append(get_all_cards(self.variant_name))
         self.all_possibilities_list[player_index].append(
@@ -1180,21 +1538,36 @@ class GameState:
         self.all_base_filtrations[player_index].append(
             get_all_cards(self.variant_name)
         )
+        if self.zobrist_hash is not None:
+            i = len(self.hands[player_index]) - 1
+            self.zobrist_hash ^= self.zobrist_keys.get_card_hash(self, player_index, i)
+        if self.final_round_turn is None and self.num_cards_in_deck == 0:
+            self.journal_attrs("final_round_turn")
+            # the server reports a draw before the turn passes, apply_draw after
+            drawn_this_turn = self.current_player_index == player_index
+            self.final_round_turn = self.turn + 1 if drawn_this_turn else self.turn
         self.process_visible_cards()
         return new_card
 
     def handle_play(self, player_index: int, order: int, suit_index: int, rank: int):
         self.remove_card_from_hand(player_index, order)
+        self.journal_attrs("stacks", in_place=True)
+        if self.zobrist_hash is not None:
+            stack_keys = self.zobrist_keys.stack_keys[suit_index]
+            self.zobrist_hash ^= stack_keys[self.stacks[suit_index]] ^ stack_keys[rank]
         self.stacks[suit_index] = rank
         self.process_visible_cards()
         return Card(order, suit_index, rank)
 
     def handle_discard(self, player_index: int, order: int, suit_index: int, rank: int):
         self.remove_card_from_hand(player_index, order)
-        if (suit_index, rank) not in self.discards:
-            self.discards[(suit_index, rank)] = 1
-        else:
-            self.discards[(suit_index, rank)] += 1
+        self.journal_items(self.discards, [(suit_index, rank)])
+        num_discarded = self.discards.get((suit_index, rank), 0)
+        if self.zobrist_hash is not None:
+            keys = self.zobrist_keys
+            self.zobrist_hash ^= keys.get_discard_hash((suit_index, rank), num_discarded)
+            self.zobrist_hash ^= keys.get_discard_hash((suit_index, rank), num_discarded + 1)
+        self.discards[(suit_index, rank)] = num_discarded + 1
         self.process_visible_cards()
         return Card(order, suit_index, rank)
     
@@ -1234,32 +1607,40 @@ class GameState:
                 new_base_filt = base_filt_list[i].intersection(
                     all_cards_touched_by_clue
                 )
-                poss_list[i] = new_possibilities
+                self.set_possibilities(target_index, i, new_possibilities)
                 base_filt_list[i] = new_base_filt
                 assert len(new_possibilities) and len(new_base_filt)
                 if not len(new_candidates):
                     self.write_note(card.order, note="Positive clue conflict!")
-                    candidates_list[i] = new_possibilities
+                    self.set_candidates(target_index, i, new_possibilities)
                 else:
-                    candidates_list[i] = new_candidates
+                    self.set_candidates(target_index, i, new_candidates)
             else:
                 new_candidates = candidates_list[i].difference(
                     all_cards_touched_by_clue
                 )
                 new_possibilities = poss_list[i].difference(all_cards_touched_by_clue)
                 new_base_filt = base_filt_list[i].difference(all_cards_touched_by_clue)
-                poss_list[i] = new_possibilities
+                self.set_possibilities(target_index, i, new_possibilities)
                 base_filt_list[i] = new_base_filt
                 assert len(new_possibilities) and len(new_base_filt)
                 if not len(new_candidates):
                     self.write_note(card.order, note="Negative clue conflict!")
-                    candidates_list[i] = new_possibilities
+                    self.set_candidates(target_index, i, new_possibilities)
                 else:
-                    candidates_list[i] = new_candidates
+                    self.set_candidates(target_index, i, new_candidates)
         self.process_visible_cards()
         return touched_cards
 
     def track_clued_cards(self, clue_type: int, clue_value: int, card_orders):
+        if clue_type == RANK_CLUE:
+            self.journal_items(self.rank_clued_card_orders, card_orders)
+        elif clue_type == COLOR_CLUE:
+            self.journal_items(self.color_clued_card_orders, card_orders)
+        if self.zobrist_hash is not None:
+            for order in card_orders:
+                if not self.is_clued(order):
+                    self.zobrist_hash ^= self.zobrist_keys.clued_keys[order]
         for order in card_orders:
             if clue_type == RANK_CLUE:
                 if order not in self.rank_clued_card_orders:
@@ -1318,6 +1699,7 @@ class GameState:
                 _note += "[trash]"
         _note += note
 
+        self.journal_items(self.notes, [order])
         if order not in self.notes:
             self.notes[order] = _note
             return
@@ -1,14 +1,44 @@
 import json
+import time
 import websocket
 
 from constants import ACTION, COLOR_CLUE, RANK_CLUE
 from game_state import GameState
-from conventions.encoder import EncoderV1GameState, EncoderV2GameState
+from conventions.encoder import (
+    BaseEncoderGameState,
+    EncoderV1GameState,
+    EncoderV2GameState,
+)
 from conventions.h_group import HGroupGameState
 from conventions.ref_sieve import RefSieveGameState
-from conventions.reactor import ReactorGameState
+from conventions.reactor import ReactorGameState, get_finesse_human_slots
+from belief import BeliefState
+from clue_scoring import HAT_CLUE_WEIGHTS, ClueScores
+from clue_table import ClueTable
+from decision_context import get_decision_context
+from deadline import (
+    Deadline,
+    DeadlineExceeded,
+    DeadlineMetrics,
+    get_fallback_action,
+    get_time_budget,
+)
+from endgame import ENDGAME_DECK_THRESHOLD, UNTIMED_BUDGET_SECONDS, solve_endgame
+from login import get_backoff_delay
+from rollout import RolloutEvaluator
+from snapshot import SnapshotStore, get_game_id, get_missed_actions, is_same_game
+from teammates import TeammatePredictor
+from table_lifecycle import (
+    EVICT_DORMANT_REASONS,
+    EVICT_GAME_OVER,
+    EVICT_TABLE_GONE,
+    MAX_LOBBY_TABLES,
+    TableLifecycle,
+    format_memory_report,
+    get_memory_report,
+)
 import traceback
-from typing import Dict, Type
+from typing import Callable, Dict, List, Optional, Tuple, Type
 
 
 def is_int(x):
@@ -28,7 +58,14 @@ class HanabiClient:
         convention: str,
         disconnect_on_game_end: bool,
         table_name: str,
-        max_num_players: int
+        max_num_players: int,
+        snapshot_dir: Optional[str] = None,
+        refresh_cookie: Optional[Callable[[], str]] = None,
+        max_reconnect_attempts: int = 10,
+        inactivity_timeout: Optional[float] = 6 * 60 * 60,
+        max_retained_tables: Optional[int] = 32,
+        num_rollouts: Optional[int] = None,
+        rollout_workers: Optional[int] = None,
     ):
         self.bot_to_join = bot_to_join
         self.convention_name = (
@@ -53,6 +90,35 @@ class HanabiClient:
         self.action_time = False
         self.everyone_connected = False
         self.games: Dict[int, GameState] = {}
+        self.num_actions_handled: Dict[int, int] = {}
+        self.snapshots = SnapshotStore(snapshot_dir) if snapshot_dir is not None else None
+        self.lifecycle = TableLifecycle(inactivity_timeout, max_retained_tables)
+        self.lobby_lifecycle = TableLifecycle(inactivity_timeout, MAX_LOBBY_TABLES)
+
+        # Latest "clock" message per table and when we got it, used to budget
+        # how long a decision may take in timed games
+        self.clocks: Dict[int, Tuple[Dict, float]] = {}
+        self.deadline = Deadline(None)
+        self.deadline_metrics = DeadlineMetrics()
+        self.beliefs: Dict[int, BeliefState] = {}
+        # Predicted teammate moves, memoized per position for each table
+        self.teammates: Dict[int, TeammatePredictor] = {}
+        self.action_sent = False
+        # Rollouts replace the fixed fallback priorities whenever there is time
+        # left to run them
+        self.rollouts = (
+            RolloutEvaluator(num_rollouts, rollout_workers) if num_rollouts else None
+        )
+
+        # Reconnection bookkeeping
+        self.url = url
+        self.cookie = cookie
+        self.refresh_cookie = refresh_cookie
+        self.max_reconnect_attempts = max_reconnect_attempts
+        self.num_reconnect_attempts = 0
+        self.opened = False
+        self.disconnected_at: Optional[float] = None
+        self.outage_durations: List[float] = []
 
         # Initialize the website command handlers (for the lobby)
         self.commandHandlers["welcome"] = self.welcome
@@ -76,17 +142,45 @@ class HanabiClient:
         self.commandHandlers["chatTyping"] = self.chat_typing
 
         # Start the WebSocket client
-        print(f'Connecting to "{url}".')
-
-        self.ws = websocket.WebSocketApp(
-            url,
-            on_message=lambda ws, message: self.websocket_message(ws, message),
-            on_error=lambda ws, error: self.websocket_error(ws, error),
-            on_open=lambda ws: self.websocket_open(ws),
-            on_close=lambda ws: self.websocket_close(ws),
-            cookie=cookie,
-        )
-        self.ws.run_forever()
+        self.run_forever()
+
+    def run_forever(self):
+        # Keep reconnecting (with backoff) until the server stops letting us back
+        # in; the games we were playing survive in self.games across connections
+        while True:
+            print(f'Connecting to "{self.url}".')
+            self.opened = False
+            self.ws = websocket.WebSocketApp(
+                self.url,
+                on_message=lambda ws, message: self.websocket_message(ws, message),
+                on_error=lambda ws, error: self.websocket_error(ws, error),
+                on_open=lambda ws: self.websocket_open(ws),
+                on_close=lambda ws, *args: self.websocket_close(ws),
+                cookie=self.cookie,
+            )
+            self.ws.run_forever()
+
+            if self.num_reconnect_attempts >= self.max_reconnect_attempts:
+                print(f"Giving up after {self.num_reconnect_attempts} reconnection attempts.")
+                if self.rollouts is not None:
+                    self.rollouts.close()
+                return
+
+            # a connection that never opened may have been refused because our
+            # session expired, so log in again before the next attempt
+            if not self.opened and self.refresh_cookie is not None:
+                try:
+                    self.cookie = self.refresh_cookie()
+                except Exception as e:
+                    print(f"Failed to refresh the session cookie ({e.__class__.__name__}).")
+
+            delay = get_backoff_delay(self.num_reconnect_attempts, 1.0, 30.0)
+            self.num_reconnect_attempts += 1
+            print(
+                f"Reconnecting in {delay:.1f}s "
+                f"(attempt {self.num_reconnect_attempts}/{self.max_reconnect_attempts})."
+            )
+            time.sleep(delay)
 
     def websocket_message(self, ws, message):
         # WebSocket messages from the server come in the format of:
@@ -119,6 +213,7 @@ class HanabiClient:
                 traceback.print_exc()
                 print("**************************\n" * 3)
                 return
+            self.evict_stale_tables()
         else:
             print(f'debug: ignoring command "{command}"')
 
@@ -128,9 +223,21 @@ class HanabiClient:
 
     def websocket_close(self, ws):
         print("WebSocket connection closed.")
+        if self.opened and self.disconnected_at is None:
+            self.disconnected_at = time.time()
 
     def websocket_open(self, ws):
         print("Successfully established WebSocket connection.")
+        self.opened = True
+        self.num_reconnect_attempts = 0
+        if self.disconnected_at is not None:
+            outage = time.time() - self.disconnected_at
+            self.outage_durations.append(outage)
+            self.disconnected_at = None
+            print(
+                f"Reconnected after a {outage:.1f}s outage; "
+                f"resuming {len(self.games)} table(s)."
+            )
 
     # --------------------------------
     # Website Command Handlers (Lobby)
@@ -141,9 +248,23 @@ class HanabiClient:
         # once we have established a connection
         # It contains our username, settings, and so forth
         self.username = data["username"]
-        if self.bot_to_join == "create":
+        if len(self.games) or len(self.lifecycle.dormant):
+            # We reconnected in the middle of some games
+            self.resume_games()
+        elif self.bot_to_join == "create":
             self.chat_create_table()
 
+    def resume_games(self):
+        # Rejoin every table we were playing at; the server answers with the usual
+        # "init" (which asks for the "gameActionList" itself), and that is
+        # reconciled against the state we already hold rather than replayed
+        # Tables we evicted while their game was still running come back the
+        # same way, from their snapshot
+        for table_id in list(self.games) + list(self.lifecycle.dormant):
+            print(f"Resuming table {table_id}.")
+            self.lifecycle.wake(table_id)
+            self.send("tableReattend", {"tableID": table_id})
+
     def error(self, data):
         # Either we have done something wrong,
         # or something has gone wrong on the server
@@ -195,6 +316,9 @@ class HanabiClient:
             self.chat_reattend(table_id)
         elif command == "restart":
             self.chat_restart()
+        elif command == "memory":
+            for line in format_memory_report(get_memory_report(self.games)):
+                self.chat_reply(line, data["who"])
         else:
             msg = "That is not a valid command."
             self.chat_reply(msg, data["who"])
@@ -277,6 +401,7 @@ class HanabiClient:
 
     def table(self, data):
         self.tables[data["id"]] = data
+        self.lobby_lifecycle.touch(data["id"])
         if (
             self.bot_to_join is not None
             and self.bot_to_join != "create"
@@ -289,7 +414,9 @@ class HanabiClient:
             self.table(data)
 
     def table_gone(self, data):
-        del self.tables[data["tableID"]]
+        self.tables.pop(data["tableID"], None)
+        self.lobby_lifecycle.forget(data["tableID"])
+        self.evict_table(data["tableID"], EVICT_TABLE_GONE)
 
     def table_start(self, data):
         # The server has told us that a game that we are in is starting
@@ -329,13 +456,47 @@ class HanabiClient:
         self.everyone_connected = False
 
         # Make a new game state and store it on the "games" dictionary
-
-        state = self.game_state_cls(
+        # If we crashed mid-game, pick up from the last snapshot instead so that
+        # only the actions we missed need to be replayed
+        table_id = data["tableID"]
+        game_id = get_game_id(data)
+        restored = None
+        existing = self.games.get(table_id)
+        if existing is not None and is_same_game(
+            existing,
+            self.game_state_cls,
             variant_name=data["options"]["variantName"],
             player_names=data["playerNames"],
             our_player_index=data["ourPlayerIndex"],
-        )
-        self.games[data["tableID"]] = state
+            game_id=game_id,
+        ):
+            # We reconnected to a game we never lost track of
+            restored = existing, self.num_actions_handled.get(table_id, 0)
+        elif self.snapshots is not None:
+            restored = self.snapshots.load(
+                table_id,
+                self.game_state_cls,
+                variant_name=data["options"]["variantName"],
+                player_names=data["playerNames"],
+                our_player_index=data["ourPlayerIndex"],
+                game_id=game_id,
+            )
+
+        if restored is not None:
+            state, num_actions_handled = restored
+            print(f"Restored table {table_id} ({num_actions_handled} actions)")
+        else:
+            state = self.game_state_cls(
+                variant_name=data["options"]["variantName"],
+                player_names=data["playerNames"],
+                our_player_index=data["ourPlayerIndex"],
+            )
+            state.game_id = game_id
+            num_actions_handled = 0
+
+        self.games[table_id] = state
+        self.num_actions_handled[table_id] = num_actions_handled
+        self.lifecycle.touch(table_id)
 
         # At this point, the JavaScript client would have enough information to
         # load and display the game UI; for our purposes, we do not need to
@@ -361,12 +522,38 @@ class HanabiClient:
 
     def game_action(self, data):
         # We just received a new action for an ongoing game
+        if data["tableID"] not in self.games:
+            self.reload_table(data["tableID"])
+            return
         self.handle_action(data["action"], data["tableID"])
+        if data["action"]["type"] == "turn":
+            self.save_snapshot(data["tableID"])
         self._go(data)
 
     def game_action_list(self, data):
-        for action in data["list"]:
-            self.handle_action(action, data["tableID"])
+        table_id = data["tableID"]
+        if len(data["list"]) < self.num_actions_handled.get(table_id, 0):
+            # The server knows of fewer actions than we handled, so our state
+            # cannot be for this game (e.g. the table was restarted)
+            print(f"Action list for table {table_id} is behind our state, rebuilding")
+            old_state = self.games[table_id]
+            self.games[table_id] = self.game_state_cls(
+                variant_name=old_state.variant_name,
+                player_names=old_state.player_names,
+                our_player_index=old_state.our_player_index,
+            )
+            self.games[table_id].game_id = old_state.game_id
+            self.num_actions_handled[table_id] = 0
+
+        missed_actions = get_missed_actions(
+            data["list"], self.num_actions_handled.get(table_id, 0)
+        )
+        for action in missed_actions:
+            if table_id not in self.games:
+                # the game ended part-way through the list
+                break
+            self.handle_action(action, table_id)
+        self.save_snapshot(table_id)
 
         # Let the server know that we have finished "loading the UI"
         # (so that our name does not appear as red / disconnected)
@@ -379,23 +566,42 @@ class HanabiClient:
 
         # Local variables
         state = self.games[table_id]
+        self.num_actions_handled[table_id] = self.num_actions_handled.get(table_id, 0) + 1
+        self.lifecycle.touch(table_id)
+
+        # the belief about our hand follows the state action by action
+        belief = self.beliefs.get(table_id)
+        if belief is not None and belief.state is not state:
+            belief = None
 
         if data["type"] == "draw":
             card = state.handle_draw(
                 data["playerIndex"], data["order"], data["suitIndex"], data["rank"]
             )
+            if belief is not None:
+                belief.handle_draw(
+                    data["playerIndex"], data["order"], data["suitIndex"], data["rank"]
+                )
 
         elif data["type"] == "play":
             # state.print()
             state.handle_play(
                 data["playerIndex"], data["order"], data["suitIndex"], data["rank"]
             )
+            if belief is not None:
+                belief.handle_play(
+                    data["playerIndex"], data["order"], data["suitIndex"], data["rank"]
+                )
 
         elif data["type"] == "discard":
             # state.print()
             state.handle_discard(
                 data["playerIndex"], data["order"], data["suitIndex"], data["rank"]
             )
+            if belief is not None:
+                belief.handle_discard(
+                    data["playerIndex"], data["order"], data["suitIndex"], data["rank"]
+                )
 
         elif data["type"] == "clue":
             # state.print()
@@ -421,6 +627,7 @@ class HanabiClient:
             state.max_score = data["maxScore"]
 
         elif data["type"] == "gameOver":
+            self.evict_table(table_id, EVICT_GAME_OVER)
             if self.disconnect_on_game_end:
                 raise SystemExit
 
@@ -436,12 +643,14 @@ class HanabiClient:
         )
 
         # Delete the game state for the game to free up memory
-        del self.games[data["tableID"]]
+        self.evict_table(data["tableID"], EVICT_GAME_OVER)
 
     def connected(self, data):
         print("Connected: " + str(data))
         self.everyone_connected = sum(data["list"]) == len(data["list"])
         print("self.everyone_connected = " + str(self.everyone_connected))
+        if data["tableID"] not in self.games:
+            return
         state = self.games[data["tableID"]]
         if state.turn == 0 and self.everyone_connected:
             state.print()
@@ -453,6 +662,9 @@ class HanabiClient:
             'timeTaken': 0
         }
         """
+        self.clocks[data["tableID"]] = (data, time.perf_counter())
+        if data["tableID"] not in self.games:
+            self.reload_table(data["tableID"])
         self.action_time = True
         self._go(data)
 
@@ -475,10 +687,12 @@ class HanabiClient:
 
     def play(self, order, table_id):
         print(f"Playing order: {order}")
+        self.action_sent = True
         self.send("action", {"tableID": table_id, "type": ACTION.PLAY, "target": order})
 
     def discard(self, order, table_id):
         print(f"Discarding order: {order}")
+        self.action_sent = True
         self.send(
             "action", {"tableID": table_id, "type": ACTION.DISCARD, "target": order}
         )
@@ -486,6 +700,7 @@ class HanabiClient:
     def clue(self, target_index, clue_type, clue_value, table_id):
         _type = {COLOR_CLUE: ACTION.COLOR_CLUE, RANK_CLUE: ACTION.RANK_CLUE}[clue_type]
         print(f"Giving {_type._name_} with value {clue_value} to {target_index}")
+        self.action_sent = True
         self.send(
             "action",
             {
@@ -496,13 +711,131 @@ class HanabiClient:
             },
         )
 
+    def evict_table(self, table_id, reason: str):
+        # Finished and terminated games are gone for good; tables dropped for
+        # inactivity or to stay under the cap keep their snapshot on disk, and
+        # are reloaded from it by reload_table once the game comes back to life
+        if table_id in self.games:
+            report = get_memory_report({table_id: self.games[table_id]})
+            print(f"Evicting table {table_id} ({reason}, {report[table_id] / 1024:.1f} KiB)")
+            del self.games[table_id]
+        self.num_actions_handled.pop(table_id, None)
+        self.clocks.pop(table_id, None)
+        self.beliefs.pop(table_id, None)
+        self.teammates.pop(table_id, None)
+        self.lifecycle.forget(table_id, dormant=reason in EVICT_DORMANT_REASONS)
+        if self.snapshots is not None and reason in {EVICT_GAME_OVER, EVICT_TABLE_GONE}:
+            self.snapshots.delete(table_id)
+
+    def evict_stale_tables(self):
+        for table_id, reason in self.lifecycle.get_tables_to_evict().items():
+            self.evict_table(table_id, reason)
+        for table_id in self.lobby_lifecycle.get_tables_to_evict():
+            self.tables.pop(table_id, None)
+            self.lobby_lifecycle.forget(table_id)
+
+    def reload_table(self, table_id):
+        # A message for a table we evicted while its game was still running: ask
+        # for the game again; "init" restores the snapshot and the action list
+        # that follows brings it up to date (including this message)
+        if not self.lifecycle.wake(table_id):
+            return
+        print(f"Reloading evicted table {table_id}")
+        self.send("getGameInfo1", {"tableID": table_id})
+
+    def save_snapshot(self, table_id):
+        if self.snapshots is None or table_id not in self.games:
+            return
+        self.snapshots.save(
+            table_id, self.games[table_id], self.num_actions_handled.get(table_id, 0)
+        )
+
     def write_note(self, table_id, order, note):
         self.send("note", {"tableID": table_id, "order": order, "note": note})
 
+    def get_deadline(self, table_id) -> Deadline:
+        if table_id not in self.clocks:
+            return Deadline(None)
+
+        data, received_at = self.clocks[table_id]
+        our_player_index = self.games[table_id].our_player_index
+        time_taken = 0
+        if data["activePlayerIndex"] == our_player_index:
+            time_taken = data.get("timeTaken", 0)
+        budget = get_time_budget(data["times"], our_player_index, time_taken)
+        if budget is not None:
+            # whatever we spent since the clock message arrived is already gone
+            budget = max(0.0, budget - (time.perf_counter() - received_at))
+        return Deadline(budget)
+
+    def get_teammates(self, state: GameState, table_id: int) -> TeammatePredictor:
+        if table_id not in self.teammates:
+            self.teammates[table_id] = TeammatePredictor(state.variant_name)
+        return self.teammates[table_id]
+
+    def get_belief(self, state: GameState, table_id: int) -> BeliefState:
+        # built once per game and then updated by handle_action
+        belief = self.beliefs.get(table_id)
+        if belief is None or belief.state is not state:
+            belief = self.beliefs[table_id] = BeliefState(state)
+        return belief
+
+    def fallback(self, state: GameState, table_id: int):
+        action = None
+        belief = self.get_belief(state, table_id)
+        if self.rollouts is not None and not self.deadline.expired():
+            result = self.rollouts.evaluate(state, deadline=self.deadline, belief=belief)
+            if result is not None:
+                print(
+                    f"Rollouts: {result.action} expecting {result.expected_score:.2f} "
+                    f"({result.num_rollouts} rollouts, {result.num_failed} failed)"
+                )
+                action = result.action
+
+        if action is None:
+            action = get_fallback_action(state, belief)
+        print(f"Deadline fallback: {action}")
+        if action[0] == "play":
+            self.play(action[1], table_id)
+        elif action[0] == "discard":
+            self.discard(action[1], table_id)
+        else:
+            _, target_index, clue_type, clue_value = action
+            self.clue(target_index, clue_type, clue_value, table_id)
+
     def decide_action(self, table_id):
         # The server expects to be told about actions in the following format:
         # https://github.com/Hanabi-Live/hanabi-live/blob/main/server/src/command.go
         state = self.games[table_id]
+        self.deadline = self.get_deadline(table_id)
+        self.action_sent = False
+        used_fallback = False
+        if self.deadline.budget is not None:
+            print(f"Time budget for this decision: {self.deadline.budget:.2f}s")
+
+        try:
+            if state.use_endgame_solver and state.num_cards_in_deck <= ENDGAME_DECK_THRESHOLD:
+                self.endgame(state, table_id)
+            if not self.action_sent:
+                self.run_convention(state, table_id)
+        except DeadlineExceeded as e:
+            print(f"Ran out of time deciding ({e})")
+
+        if not self.action_sent:
+            # either the strategy overran or it fell through without acting
+            used_fallback = True
+            self.fallback(state, table_id)
+
+        self.deadline_metrics.record(self.convention_name, self.deadline, used_fallback)
+        if self.deadline.expired():
+            print(f"Deadline missed by {-self.deadline.remaining:.2f}s")
+            print(self.deadline_metrics.summary())
+        self.deadline = Deadline(None)
+
+        for order, note in state.notes.items():
+            self.write_note(table_id, order, note)
+
+    def run_convention(self, state: GameState, table_id: int):
         if isinstance(state, EncoderV1GameState):
             self.encoder_v1(state, table_id)
         elif isinstance(state, EncoderV2GameState):
@@ -516,48 +849,69 @@ class HanabiClient:
         else:
             raise ValueError(type(state))
 
-        for order, note in state.notes.items():
-            self.write_note(table_id, order, note)
+    def endgame(self, state: GameState, table_id: int):
+        # A reaction we owe our teammates takes priority over the solver
+        if isinstance(state, ReactorGameState):
+            if state.unresolved_reactions[state.our_player_index] is not None:
+                return
+
+        deadline = self.deadline
+        if deadline.budget is None:
+            deadline = Deadline(UNTIMED_BUDGET_SECONDS)
+        result = solve_endgame(state, deadline=deadline, belief=self.get_belief(state, table_id))
+        if result is None:
+            print("Endgame search ran out of budget, deferring to the convention")
+            return
+
+        print(
+            f"Endgame solver: {result.action} expecting {result.expected_score:.2f} "
+            f"({result.num_samples} samples, {result.num_nodes} nodes)"
+        )
+        if result.action[0] == "play":
+            self.play(result.action[1], table_id)
+        elif result.action[0] == "discard":
+            self.discard(result.action[1], table_id)
+        # Stall clues are left to the convention, so that they still mean
+        # something to our teammates
 
     def hgroup(self, state: HGroupGameState, table_id: int):
         good_actions = {
             player_index: state.get_good_actions(player_index)
             for player_index in range(state.num_players)
         }
+        self.deadline.check()
         my_good_actions = good_actions[state.our_player_index]
-        next_player_good_actions = good_actions[state.next_player_index]
         print(f"{state.our_player_name} POV - good actions:")
         for player_index, orders in good_actions.items():
             print(player_index, orders)
 
-        next_player_has_safe_action = False
         my_chop_order = state.get_chop_order(state.our_player_index)
         np_chop_order = state.get_chop_order(state.next_player_index)
-
-        for action_type, orders in next_player_good_actions.items():
-            if action_type == "seen_in_other_hand":
-                # TODO: handle this at later levels
-                continue
-            if len(orders):
-                next_player_has_safe_action = True
-                break
-
-        if not next_player_has_safe_action and state.clue_tokens >= 1:
-            if np_chop_order is not None:
-                np_chop = state.get_card(np_chop_order)
-                if (np_chop.suit_index, np_chop.rank) in state.playables:
-                    self.clue(
-                        state.next_player_index,
-                        COLOR_CLUE,
-                        np_chop.suit_index,
-                        table_id,
-                    )
-                    return
-                elif (np_chop.suit_index, np_chop.rank) in state.criticals:
-                    self.clue(
-                        state.next_player_index, RANK_CLUE, np_chop.rank, table_id
-                    )
-                    return
+        np_action = self.get_teammates(state, table_id).predict(state, state.next_player_index)
+        print(f"Next player is expected to {np_action}")
+        next_player_has_safe_action = np_action != ("discard", np_chop_order)
+
+        clue_candidates = state.get_clue_candidates() if state.clue_tokens >= 1 else {}
+        self.deadline.check()
+        if not next_player_has_safe_action and np_chop_order is not None:
+            # save or get the next player's chop, touching as little junk and
+            # getting as much as possible along the way
+            chop_clues = [
+                (key, candidate)
+                for key, candidate in clue_candidates.items()
+                if key[2] == state.next_player_index
+                and (
+                    np_chop_order in candidate.saved_orders
+                    or np_chop_order in (candidate.cards_gotten or ())
+                )
+            ]
+            if len(chop_clues):
+                (clue_value, clue_type, target_index), _ = min(
+                    chop_clues,
+                    key=lambda x: (len(x[1].bad_touch_orders), -len(x[1].cards_gotten or ())),
+                )
+                self.clue(target_index, clue_type, clue_value, table_id)
+                return
 
         # play if nothing urgent to do
         if len(my_good_actions["playable"]):
@@ -629,6 +983,15 @@ class HanabiClient:
                             self.play(playable_order, table_id)
                             return
 
+        play_clues = state.get_play_clues(clue_candidates)
+        if len(play_clues):
+            (clue_value, clue_type, target_index), cards_gotten = max(
+                play_clues.items(), key=lambda x: len(x[1])
+            )
+            print(f"Giving play clue getting {cards_gotten}")
+            self.clue(target_index, clue_type, clue_value, table_id)
+            return
+
         if state.clue_tokens < 8:
             for trashable in [
                 "trash",
@@ -650,8 +1013,13 @@ class HanabiClient:
         self.clue(state.next_player_index, RANK_CLUE, burn_clue_card.rank, table_id)
 
     def reactor(self, state: ReactorGameState, table_id: int):
-        stable_clues = state.get_stable_clues()
-        reactive_clues = state.get_reactive_clues()
+        ctx = get_decision_context(state)
+        clue_table = ClueTable(state, ctx=ctx)
+        stable_clues = state.get_stable_clues(ctx, clue_table)
+        self.deadline.check()
+        reactive_clues = state.get_reactive_clues(ctx, clue_table)
+        clue_scores = ClueScores(state, clue_table)
+        self.deadline.check()
         print('------------------')
         print('Players play/discard/chop:')
         for pindex in range(state.num_players):
@@ -677,7 +1045,7 @@ class HanabiClient:
         # TODO: fold into a function
         ur = state.unresolved_reactions[state.our_player_index]
         if ur is not None:
-            target_index = ur.ordering[1]
+            target_index = ur.target_index
             target_orders = ur.player_slot_orders[target_index]
             reacter_orders = ur.player_slot_orders[state.our_player_index]
             pslot = ur.get_reactive_playable_human_slot()
@@ -694,7 +1062,7 @@ class HanabiClient:
                     state.unresolved_reactions[state.our_player_index] = None
                     return
 
-                for reacter_slot in [1,5,4,3,2]:
+                for reacter_slot in get_finesse_human_slots(len(reacter_orders)):
                     order_to_play = reacter_orders[reacter_slot - 1]
                     order_to_play_candidates = state.get_candidates(order_to_play)
                     fslot = (ur.focused_slot - reacter_slot - 1) % len(target_orders) + 1
@@ -735,22 +1103,21 @@ class HanabiClient:
             self.discard(state.our_discard_orders[0], table_id)
             return
 
+        # clues of the same kind are told apart by information gain
         if len(reactive_clues) and state.clue_tokens >= 2:
-            for (clue_value, clue_type, target_index), clue_str in reactive_clues.items():
-                if clue_str in {'2P0D_PLAY', '2P0D_FINESSE'}:
-                    self.clue(target_index, clue_type, clue_value, table_id)
-                    return
-                
-            for (clue_value, clue_type, target_index), clue_str in reactive_clues.items():
-                if clue_str in {'1P1D_DISCARD', '1P1D_PLAY'}:
+            for clue_strs in [{'2P0D_PLAY', '2P0D_FINESSE'}, {'1P1D_DISCARD', '1P1D_PLAY'}]:
+                clues = [x for x, y in reactive_clues.items() if y in clue_strs]
+                if len(clues):
+                    clue_value, clue_type, target_index = max(clues, key=lambda x: clue_scores.get_gain(x[1], x[0], x[2]))
                     self.clue(target_index, clue_type, clue_value, table_id)
                     return
-                
+
         if len(stable_clues) and state.clue_tokens >= 1:
-            for (clue_value, clue_type, target_index), clue_str in stable_clues.items():
-                if clue_str != 'LOCK':
-                    self.clue(target_index, clue_type, clue_value, table_id)
-                    return
+            clues = [x for x, y in stable_clues.items() if y != 'LOCK']
+            if len(clues):
+                clue_value, clue_type, target_index = max(clues, key=lambda x: clue_scores.get_gain(x[1], x[0], x[2]))
+                self.clue(target_index, clue_type, clue_value, table_id)
+                return
         
         if (state.clue_tokens < 8):
             chop_order = state.get_chop_order(state.our_player_index)
@@ -761,7 +1128,11 @@ class HanabiClient:
         self.play(state.our_hand[-1].order, table_id)
 
     def ref_sieve(self, state: RefSieveGameState, table_id: int):
-        ref_sieve_clues = state.get_ref_sieve_clues()
+        ctx = get_decision_context(state)
+        clue_table = ClueTable(state, ctx=ctx)
+        ref_sieve_clues = state.get_ref_sieve_clues(ctx, clue_table)
+        clue_scores = ClueScores(state, clue_table)
+        self.deadline.check()
         print('Players play/discard/chop:')
         for pindex in range(state.num_players):
             print(pindex, state.play_orders[pindex], state.discard_orders[pindex], state.get_chop_order(pindex))
@@ -788,7 +1159,7 @@ class HanabiClient:
                 discard_clues_to_bob = [x for x, y in clues_to_bob.items() if y in {"REF_DISCARD"}]
                 if len(play_clues_to_bob):
                     play_clues_ranked = sorted(
-                        play_clues_to_bob, key=lambda x: state.evaluate_clue_score(x[0], x[1], x[2])
+                        play_clues_to_bob, key=lambda x: -clue_scores.get_gain(*x)
                     )
                     for clue_type, clue_value, target_index in play_clues_ranked:
                         self.clue(target_index, clue_type, clue_value, table_id)
@@ -843,7 +1214,7 @@ class HanabiClient:
 
             if len(play_clues):
                 play_clues_ranked = sorted(
-                    play_clues, key=lambda x: state.evaluate_clue_score(x[0], x[1], x[2])
+                    play_clues, key=lambda x: -clue_scores.get_gain(*x)
                 )
                 for clue_type, clue_value, target_index in play_clues_ranked:
                     self.clue(target_index, clue_type, clue_value, table_id)
@@ -896,6 +1267,17 @@ class HanabiClient:
 
         self.play(state.our_hand[-1].order, table_id)
 
+    def score_hat_clues(self, state: BaseEncoderGameState):
+        legal_clues = state.get_legal_clues()
+        clue_table = ClueTable(state, sorted({x[-1] for x in legal_clues}))
+        clue_scores = ClueScores(state, clue_table, HAT_CLUE_WEIGHTS)
+        return {
+            (clue_value, clue_type, target_index): -clue_scores.get_gain(
+                clue_type, clue_value, target_index
+            )
+            for clue_value, clue_type, target_index in legal_clues
+        }
+
     def encoder_v2(self, state: EncoderV2GameState, table_id: int):
         # ragequit
         if state.pace < 0 or state.max_score < 5 * len(state.stacks):
@@ -907,6 +1289,7 @@ class HanabiClient:
             player_index: state.get_good_actions(player_index)
             for player_index in range(state.num_players)
         }
+        self.deadline.check()
         my_good_actions = good_actions[state.our_player_index]
         print(state.our_player_name + " good actions:")
         for action_type, orders in good_actions.items():
@@ -1081,13 +1464,7 @@ class HanabiClient:
             num_useful_cards += 1
 
         # clues that narrow down useful cards the most are good, lowest scores first
-        legal_clues = state.get_legal_clues()
-        legal_clue_to_score = {
-            (clue_value, clue_type, target_index): state.evaluate_clue_score(
-                clue_value, clue_type, target_index
-            )
-            for (clue_value, clue_type, target_index) in legal_clues
-        }
+        legal_clue_to_score = self.score_hat_clues(state)
         legal_hat_clues = sorted(legal_clue_to_score.items(), key=lambda x: x[-1])
         print("All legal clues available:")
         for x, score in legal_hat_clues:
@@ -1203,6 +1580,7 @@ class HanabiClient:
             player_index: state.get_good_actions(player_index)
             for player_index in range(state.num_players)
         }
+        self.deadline.check()
         my_good_actions = good_actions[state.our_player_index]
         print(state.our_player_name + " good actions:")
         for action_type, orders in good_actions.items():
@@ -1355,13 +1733,7 @@ class HanabiClient:
             num_useful_cards += 1
 
         # clues that narrow down useful cards the most are good, lowest scores first
-        legal_clues = state.get_legal_clues()
-        legal_clue_to_score = {
-            (clue_value, clue_type, target_index): state.evaluate_clue_score(
-                clue_value, clue_type, target_index
-            )
-            for (clue_value, clue_type, target_index) in legal_clues
-        }
+        legal_clue_to_score = self.score_hat_clues(state)
         legal_hat_clues = sorted(legal_clue_to_score.items(), key=lambda x: x[-1])
         print("All legal clues available:")
         for x, score in legal_hat_clues:
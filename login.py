@@ -0,0 +1,179 @@
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Used when the server does not say how long the session cookie lasts
+DEFAULT_COOKIE_TTL = 24 * 60 * 60
+# Treat cookies as expired a little early so that we never connect with one
+# that runs out mid-handshake
+COOKIE_EXPIRY_MARGIN = 5 * 60
+
+# One connection pool for the whole process; every account's session mounts it
+# so that logging in many bots reuses the same TCP/TLS connections
+_SHARED_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+_SESSIONS: Dict[str, requests.Session] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+class LoginError(Exception):
+    pass
+
+
+def get_session(username: str) -> requests.Session:
+    # each account gets its own cookie jar, but they all share one pool
+    with _SESSIONS_LOCK:
+        if username not in _SESSIONS:
+            session = requests.Session()
+            session.mount("http://", _SHARED_ADAPTER)
+            session.mount("https://", _SHARED_ADAPTER)
+            _SESSIONS[username] = session
+        return _SESSIONS[username]
+
+
+def get_cookie_expiry(set_cookie: str, now: float) -> float:
+    attributes = {}
+    for part in set_cookie.split(";")[1:]:
+        key, _, value = part.strip().partition("=")
+        attributes[key.lower()] = value
+
+    if "max-age" in attributes:
+        try:
+            return now + int(attributes["max-age"])
+        except ValueError:
+            pass
+
+    if "expires" in attributes:
+        try:
+            return parsedate_to_datetime(attributes["expires"]).timestamp()
+        except (TypeError, ValueError):
+            pass
+
+    return now + DEFAULT_COOKIE_TTL
+
+
+def get_backoff_delay(
+    attempt: int, base_delay: float, max_delay: float, jitter: float = 0.5
+) -> float:
+    # exponential backoff with jitter so that many bots restarting together
+    # do not hit the server in lockstep
+    delay = min(max_delay, base_delay * (2**attempt))
+    return delay * (1 - jitter + jitter * random.random())
+
+
+class LoginManager:
+    """Logs accounts in through a shared connection pool and caches the session
+    cookies (with their expiry) on disk, so restarting a fleet of bots does not
+    log every account in again."""
+
+    def __init__(
+        self,
+        url: str,
+        cache_path: Optional[str] = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.url = url
+        self.cache_path = cache_path
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+
+    def _read_cache(self) -> Dict[str, Dict]:
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_cache(self, cache: Dict[str, Dict]):
+        if self.cache_path is None:
+            return
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def get_cached_cookie(self, username: str) -> Optional[str]:
+        entry = self._read_cache().get(self.url, {}).get(username)
+        if entry is None:
+            return None
+        if entry["expires"] - COOKIE_EXPIRY_MARGIN <= time.time():
+            return None
+        return entry["cookie"]
+
+    def invalidate(self, username: str):
+        with self.lock:
+            cache = self._read_cache()
+            if username in cache.get(self.url, {}):
+                del cache[self.url][username]
+                self._write_cache(cache)
+
+    def get_cookie(self, username: str, password: str, force: bool = False) -> str:
+        if not force:
+            cookie = self.get_cached_cookie(username)
+            if cookie is not None:
+                print(f'Using cached session cookie for "{username}".')
+                return cookie
+
+        cookie, expires = self.login(username, password)
+        with self.lock:
+            cache = self._read_cache()
+            cache.setdefault(self.url, {})[username] = {
+                "cookie": cookie,
+                "expires": expires,
+            }
+            self._write_cache(cache)
+        return cookie
+
+    def login(self, username: str, password: str):
+        session = get_session(username)
+        for attempt in range(self.max_retries + 1):
+            print(f'Authenticating to "{self.url}" with username = "{username}".')
+            try:
+                resp = session.post(
+                    self.url,
+                    {
+                        "username": username,
+                        "password": password,
+                        # This is normally the version of the JavaScript client,
+                        # but it will also accept "bot" as a valid version
+                        "version": "bot",
+                    },
+                    timeout=30,
+                )
+            except requests.RequestException as e:
+                print(f"Login request failed ({e.__class__.__name__}).")
+                resp = None
+
+            if resp is not None and resp.status_code == 200:
+                # Scrape the cookie from the response
+                set_cookie = resp.headers.get("Set-Cookie", "")
+                cookie = set_cookie.split(";")[0].strip()
+                if cookie == "":
+                    raise LoginError(
+                        "Failed to parse the cookie from the authentication "
+                        f"response headers: {resp.headers}"
+                    )
+                return cookie, get_cookie_expiry(set_cookie, time.time())
+
+            # rate limits and server errors are worth retrying, bad credentials are not
+            if resp is not None and resp.status_code != 429 and resp.status_code < 500:
+                raise LoginError(f"Authentication failed: {resp.text}")
+
+            if attempt < self.max_retries:
+                delay = get_backoff_delay(attempt, self.base_delay, self.max_delay)
+                print(f"Retrying login in {delay:.1f}s.")
+                time.sleep(delay)
+
+        raise LoginError(f"Authentication failed after {self.max_retries + 1} attempts.")
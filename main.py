@@ -3,9 +3,9 @@ import sys
 
 import os
 import json
-import requests
 
 from hanabi_client import HanabiClient
+from login import LoginError, LoginManager
 
 
 # Authenticate, login to the WebSocket server, and run forever
@@ -37,40 +37,58 @@ def run(username, bot_to_join):
     ws_url = ws_protocol + "://" + host + ws_path
 
     password = config["bots"][username]
-    print(f'Authenticating to "{url}" with username = "{username}".')
-    resp = requests.post(
-        url,
-        {
-            "username": username,
-            "password": password,
-            # This is normally the version of the JavaScript client,
-            # but it will also accept "bot" as a valid version
-            "version": "bot",
-        },
+    # Session cookies are cached on disk (with their expiry) so that restarting
+    # many bots at once does not log every account in again
+    cookie_cache = config.get(
+        "cookie_cache",
+        os.path.join(os.path.realpath(os.path.dirname(__file__)), "cookie_cache.json"),
     )
-
-    # Handle failed authentication and other errors
-    if resp.status_code != 200:
-        print("Authentication failed:")
-        print(resp.text)
-        sys.exit(1)
-
-    # Scrape the cookie from the response
-    cookie = ""
-    for header in resp.headers.items():
-        if header[0] == "Set-Cookie":
-            cookie = header[1]
-            break
-    if cookie == "":
-        print("Failed to parse the cookie from the authentication response headers:")
-        print(resp.headers)
-        sys.exit(1)
+    login_manager = LoginManager(url, cookie_cache)
 
     convention = config["convention"]
     disconnect_on_game_end = config["disconnect_on_game_end"]
     table_name = config.get("table_name", "bots")
     max_num_players = config.get("max_num_players", 5)
-    HanabiClient(ws_url, cookie, bot_to_join, convention, disconnect_on_game_end, table_name, max_num_players)
+    # Every table's game state is snapshotted here each turn so that a crashed bot
+    # can resume its games; set "snapshot_dir" to null to disable
+    snapshot_dir = config.get(
+        "snapshot_dir",
+        os.path.join(os.path.realpath(os.path.dirname(__file__)), "snapshots", username),
+    )
+
+    # Game states for tables that go quiet for this long (in seconds), or that
+    # fall beyond the retention cap, are dropped; null disables either limit
+    inactivity_timeout = config.get("table_inactivity_timeout", 6 * 60 * 60)
+    max_retained_tables = config.get("max_retained_tables", 32)
+    # Monte Carlo rollouts per fallback decision, spread over "rollout_workers"
+    # processes (null for one per CPU); leave unset to keep the fixed fallback
+    num_rollouts = config.get("num_rollouts")
+    rollout_workers = config.get("rollout_workers")
+
+    try:
+        cookie = login_manager.get_cookie(username, password)
+    except LoginError as e:
+        print(e)
+        sys.exit(1)
+
+    # The client reconnects (logging in again when the session has expired) on
+    # its own and only returns once it gives up, so there is nothing to retry here
+    HanabiClient(
+        ws_url,
+        cookie,
+        bot_to_join,
+        convention,
+        disconnect_on_game_end,
+        table_name,
+        max_num_players,
+        snapshot_dir=snapshot_dir,
+        refresh_cookie=lambda: login_manager.get_cookie(username, password, force=True),
+        inactivity_timeout=inactivity_timeout,
+        max_retained_tables=max_retained_tables,
+        num_rollouts=num_rollouts,
+        rollout_workers=rollout_workers,
+    )
+    sys.exit(1)
 
 
 if __name__ == "__main__":
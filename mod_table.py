@@ -0,0 +1,250 @@
+import functools
+import json
+import os
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from game_state import DARK_SUIT_NAMES, SUITS
+
+# Mod tables map each residue to the identities it stands for:
+# trash is marked as (0, 0)
+# playable is marked as (-1, 0)
+# stack x + n is marked as (x, -n)
+ModTable = Dict[int, List[Tuple[int, int]]]
+# (style, num_suits, dark_suit_indices, modulus)
+ModTableKey = Tuple[str, int, Tuple[int, ...], int]
+
+mod_tables_file = os.path.join(
+    os.path.realpath(os.path.dirname(__file__)), "mod_tables.json"
+)
+
+# one per player count from 2 to 6, as 4 residues per other player
+MODULI = (4, 8, 12, 16, 20)
+# residues every table of a style starts with, and the stack offsets the rest
+# are made of
+FIXED_RESIDUES = {
+    "v1": [[(0, 0)], [(-1, 0)]],
+    "v2": [[(0, 0)]],
+}
+OFFSETS = {
+    "v1": range(2, 6),
+    "v2": range(1, 6),
+}
+# caps the size of residues not yet holding anything
+NO_CAP = 1 << 10
+
+
+def get_suit_shape(variant_name: str) -> Tuple[int, Tuple[int, ...]]:
+    suits = SUITS[variant_name]
+    return len(suits), tuple(i for i, suit in enumerate(suits) if suit in DARK_SUIT_NAMES)
+
+
+def get_token_groups(
+    style: str, num_suits: int, dark_suit_indices: Tuple[int, ...]
+) -> List[List[Tuple[int, int]]]:
+    """Stack offsets by priority: nearest first, and within an offset the dark
+    suits after the others."""
+    groups = []
+    for offset in OFFSETS[style]:
+        groups.append([(i, -offset) for i in range(num_suits) if i not in dark_suit_indices])
+        groups.append([(i, -offset) for i in dark_suit_indices])
+    return [x for x in groups if len(x)]
+
+
+def get_mod_table_cost(
+    style: str, num_suits: int, dark_suit_indices: Tuple[int, ...], mod_table: ModTable
+) -> Tuple[int, ...]:
+    """The worst-case candidate count of the residues holding each token group
+    (by priority), then the total candidate count over all tokens. Lower is
+    better, compared lexicographically."""
+    num_fixed = len(FIXED_RESIDUES[style])
+    token_to_size = {
+        token: len(tokens)
+        for residue, tokens in mod_table.items()
+        if residue >= num_fixed
+        for token in tokens
+    }
+    return tuple(
+        max(token_to_size[token] for token in group)
+        for group in get_token_groups(style, num_suits, dark_suit_indices)
+    ) + (sum(token_to_size.values()),)
+
+
+def get_placements(state: Tuple[Tuple[int, int], ...], num_tokens: int, cap: int):
+    """Every way to add num_tokens tokens to the residues of state, a sorted
+    tuple of (size, cap), without any receiving residue going over cap. Yields
+    the new state and the (size, cap, num_added) of each receiving residue."""
+    classes = sorted(Counter(state).items())
+
+    def place(i: int, num_left: int):
+        if num_left == 0:
+            yield ()
+            return
+        if i == len(classes):
+            return
+        (size, residue_cap), multiplicity = classes[i]
+        max_added = min(residue_cap, cap) - size
+        for parts in get_partitions(num_left, multiplicity, max_added):
+            for rest in place(i + 1, num_left - sum(parts)):
+                yield tuple((size, residue_cap, x) for x in parts) + rest
+
+    for decision in place(0, num_tokens):
+        new_state = list(state)
+        for size, residue_cap, num_added in decision:
+            new_state.remove((size, residue_cap))
+            new_state.append((size + num_added, min(residue_cap, cap)))
+        yield tuple(sorted(new_state)), decision
+
+
+@functools.lru_cache(maxsize=None)
+def get_partitions(total: int, max_parts: int, max_part: int) -> List[Tuple[int, ...]]:
+    """Non-increasing tuples of at most max_parts positive ints, each at most
+    max_part, summing to at most total."""
+    result = [()]
+    if max_parts == 0 or max_part <= 0:
+        return result
+    for first in range(1, min(total, max_part) + 1):
+        for rest in get_partitions(total - first, max_parts - 1, first):
+            result.append((first,) + rest)
+    return result
+
+
+def compile_mod_table(
+    style: str, num_suits: int, dark_suit_indices: Tuple[int, ...], modulus: int
+) -> ModTable:
+    """The mod table with the lowest get_mod_table_cost. Token groups are
+    placed one at a time, each with the smallest worst case that still leaves
+    room for the rest; residues with the same size and cap are interchangeable,
+    so the search runs over sorted tuples of them and is memoized on those."""
+    groups = get_token_groups(style, num_suits, dark_suit_indices)
+    num_free = modulus - len(FIXED_RESIDUES[style])
+    assert num_free > 0
+
+    @functools.lru_cache(maxsize=None)
+    def search(k: int, state: Tuple[Tuple[int, int], ...]):
+        if k == len(groups):
+            return (sum(size * size for size, _ in state),), ()
+
+        num_left = sum(len(x) for x in groups[k + 1 :])
+        max_cap = sum(size for size, _ in state) + len(groups[k]) + num_left
+        for cap in range(1, max_cap + 1):
+            best = None
+            for new_state, decision in get_placements(state, len(groups[k]), cap):
+                has_room = any(x == NO_CAP for _, x in new_state) or (
+                    sum(x - size for size, x in new_state) >= num_left
+                )
+                if not has_room:
+                    continue
+                result = search(k + 1, new_state)
+                if result is None:
+                    continue
+                cost = (cap,) + result[0]
+                if best is None or cost < best[0]:
+                    best = (cost, ((cap, decision),) + result[1])
+            if best is not None:
+                return best
+        return None
+
+    _, decisions = search(0, tuple((0, NO_CAP) for _ in range(num_free)))
+
+    # replay the decisions on actual residues, handing out suits in order
+    residues = [(0, NO_CAP, [])] * num_free
+    for group, (cap, decision) in zip(groups, decisions):
+        tokens = iter(group)
+        used = set()
+        for size, residue_cap, num_added in decision:
+            j = next(
+                j
+                for j, x in enumerate(residues)
+                if j not in used and x[:2] == (size, residue_cap)
+            )
+            used.add(j)
+            residues[j] = (
+                size + num_added,
+                min(residue_cap, cap),
+                residues[j][2] + [next(tokens) for _ in range(num_added)],
+            )
+
+    token_to_priority = {token: k for k, group in enumerate(groups) for token in group}
+    free_residues = sorted(
+        (x[2] for x in residues),
+        key=lambda tokens: (
+            not len(tokens),
+            [(token_to_priority[x], x[0]) for x in tokens],
+        ),
+    )
+    return dict(enumerate(FIXED_RESIDUES[style] + free_residues))
+
+
+def get_mod_table_key(style: str, variant_name: str, modulus: int) -> ModTableKey:
+    return (style,) + get_suit_shape(variant_name) + (modulus,)
+
+
+def get_all_mod_table_keys() -> List[ModTableKey]:
+    suit_shapes = sorted({get_suit_shape(variant_name) for variant_name in SUITS})
+    return [
+        (style,) + suit_shape + (modulus,)
+        for style in FIXED_RESIDUES
+        for suit_shape in suit_shapes
+        for modulus in MODULI
+    ]
+
+
+def compile_mod_tables(
+    get_pinned_mod_table: Callable[[ModTableKey], Optional[ModTable]]
+) -> Dict[ModTableKey, ModTable]:
+    """A mod table for every style, suit shape of a variant and modulus. Tables
+    get_pinned_mod_table returns are kept as they are, since everyone playing
+    the convention has to agree on them; the rest are compiled."""
+    result = {}
+    for key in get_all_mod_table_keys():
+        mod_table = get_pinned_mod_table(key)
+        result[key] = compile_mod_table(*key) if mod_table is None else mod_table
+    return result
+
+
+def save_mod_tables(mod_tables: Dict[ModTableKey, ModTable], path: str = mod_tables_file):
+    entries = [
+        {
+            "style": style,
+            "num_suits": num_suits,
+            "dark_suit_indices": list(dark_suit_indices),
+            "modulus": modulus,
+            "mod_table": [mod_table[residue] for residue in range(modulus)],
+        }
+        for (style, num_suits, dark_suit_indices, modulus), mod_table in mod_tables.items()
+    ]
+    # one table per line
+    with open(path, "w") as f:
+        f.write("[\n" + ",\n".join(json.dumps(x) for x in entries) + "\n]\n")
+
+
+@functools.lru_cache(maxsize=None)
+def load_mod_tables(path: str = mod_tables_file) -> Dict[ModTableKey, ModTable]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        entries = json.load(f)
+    return {
+        (x["style"], x["num_suits"], tuple(x["dark_suit_indices"]), x["modulus"]): {
+            residue: [tuple(token) for token in tokens]
+            for residue, tokens in enumerate(x["mod_table"])
+        }
+        for x in entries
+    }
+
+
+def get_mod_table(style: str, variant_name: str, modulus: int) -> ModTable:
+    """The mod table from mod_tables.json, so that no search runs at startup.
+    Suit shapes missing from it are compiled on first use."""
+    key = get_mod_table_key(style, variant_name, modulus)
+    mod_tables = load_mod_tables()
+    if key not in mod_tables:
+        mod_tables[key] = compile_mod_table(*key)
+    return mod_tables[key]
+
+
+if __name__ == "__main__":
+    from conventions.encoder import get_hand_written_mod_table
+
+    save_mod_tables(compile_mod_tables(get_hand_written_mod_table))
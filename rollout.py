@@ -0,0 +1,365 @@
+import contextlib
+import copy
+import io
+import os
+from concurrent.futures import ALL_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from belief import BeliefState
+from constants import COLOR_CLUE, MAX_CLUE_NUM, RANK_CLUE
+from deadline import Deadline, get_fallback_action
+from endgame import get_progress
+from game_state import (
+    SUITS,
+    Card,
+    GameState,
+    get_all_touched_cards,
+    get_available_color_clues,
+    get_available_rank_clues,
+)
+from sampler import HandSampler
+
+NUM_ROLLOUTS = 256
+# Score lost per strike and gained per clue token left at the end of a
+# rollout; one round is too short for either to show up in the score itself
+STRIKE_PENALTY = 1.0
+CLUE_TOKEN_VALUE = 0.1
+
+
+@dataclass
+class RolloutResult:
+    # ("play", order), ("discard", order) or ("clue", target_index, clue_type, clue_value)
+    action: Tuple
+    expected_score: float
+    action_values: Dict[Tuple, float] = field(default_factory=dict)
+    num_rollouts: int = 0
+    num_failed: int = 0
+
+
+def get_legal_actions(state: GameState) -> List[Tuple]:
+    actions = [("play", card.order) for card in state.our_hand]
+    if state.clue_tokens < MAX_CLUE_NUM:
+        actions += [("discard", card.order) for card in state.our_hand]
+    if state.clue_tokens >= 1:
+        clue_type_values = [(RANK_CLUE, rank) for rank in get_available_rank_clues(state.variant_name)]
+        clue_type_values += [
+            (COLOR_CLUE, i) for i in range(len(get_available_color_clues(state.variant_name)))
+        ]
+        for target_index in range(state.num_players):
+            if target_index == state.our_player_index:
+                continue
+            for clue_type, clue_value in clue_type_values:
+                if len(state.get_touched_orders(clue_type, clue_value, target_index)):
+                    actions.append(("clue", target_index, clue_type, clue_value))
+    return actions
+
+
+def get_rollout_action(state: GameState) -> Tuple:
+    """What the player whose point of view `state` is takes next in a rollout:
+    whatever their convention has queued up for them (the play and discard
+    orders of Reactor and Ref Sieve), otherwise get_fallback_action."""
+    play_orders = getattr(state, "play_orders", {}).get(state.our_player_index, [])
+    discard_orders = getattr(state, "discard_orders", {}).get(state.our_player_index, [])
+    if len(play_orders):
+        return ("play", play_orders[0])
+    if len(discard_orders) and state.clue_tokens < MAX_CLUE_NUM:
+        return ("discard", discard_orders[0])
+    return get_fallback_action(state)
+
+
+def get_max_score(state: GameState) -> int:
+    # how far each stack can still get given the cards discarded so far
+    max_num_cards = state.max_num_cards
+    total = 0
+    for suit, progress in enumerate(get_progress(state)):
+        is_reversed = "Reversed" in SUITS[state.variant_name][suit]
+        while progress < 5:
+            rank = 5 - progress if is_reversed else progress + 1
+            if state.discards.get((suit, rank), 0) >= max_num_cards[(suit, rank)]:
+                break
+            progress += 1
+        total += progress
+    return total
+
+
+def get_rollout_value(state: GameState, max_score_before: int) -> float:
+    if state.bombs >= 3:
+        return 0.0
+    score = sum(get_progress(state))
+    max_score_lost = max_score_before - get_max_score(state)
+    return (
+        score
+        - max_score_lost
+        - STRIKE_PENALTY * state.bombs
+        + CLUE_TOKEN_VALUE * state.clue_tokens
+    )
+
+
+class Rollout:
+    """One determinization of the game: every hand (ours sampled) and the top
+    of the deck are known, and each player acts from a copy of the state seen
+    from their own seat, so clues are read by the same convention class that
+    we use."""
+
+    def __init__(
+        self,
+        state: GameState,
+        our_hand: List[Tuple[int, int]],
+        deck: List[Tuple[int, int]],
+    ):
+        self.variant_name = state.variant_name
+        self.num_players = state.num_players
+        self.identities: Dict[int, Tuple[int, int]] = {}
+        for player_index, hand in state.hands.items():
+            for card in hand:
+                self.identities[card.order] = card.to_tuple()
+        for card, identity in zip(state.our_hand, our_hand):
+            self.identities[card.order] = identity
+        self.deck = list(deck)
+        self.next_order = max(self.identities, default=-1) + 1
+
+        self.states: Dict[int, GameState] = {}
+        for player_index in range(self.num_players):
+            view = state.fork()
+            view.our_player_index = player_index
+            for hand_player_index, hand in view.hands.items():
+                for i, card in enumerate(hand):
+                    if hand_player_index == player_index:
+                        hand[i] = Card(card.order, -1, -1)
+                    else:
+                        hand[i] = Card(card.order, *self.identities[card.order])
+            # hands changed behind the handlers' backs
+            view.zobrist_hash = None
+            view.process_visible_cards()
+            self.states[player_index] = view
+
+    def fork(self) -> "Rollout":
+        result = copy.copy(self)
+        result.identities = dict(self.identities)
+        result.deck = list(self.deck)
+        result.states = {i: state.fork() for i, state in self.states.items()}
+        return result
+
+    def get_touched_orders(self, clue_type: int, clue_value: int, target_index: int) -> List[int]:
+        touched_cards = get_all_touched_cards(clue_type, clue_value, self.variant_name)
+        return [
+            card.order
+            for card in self.states[target_index].hands[target_index]
+            if self.identities[card.order] in touched_cards
+        ]
+
+    def step(self, player_index: int, action: Tuple):
+        states = self.states.values()
+        if action[0] == "clue":
+            _, target_index, clue_type, clue_value = action
+            touched_orders = self.get_touched_orders(clue_type, clue_value, target_index)
+            for state in states:
+                state.apply_clue(player_index, target_index, clue_type, clue_value, touched_orders)
+            return
+
+        order = action[1]
+        for state in states:
+            if action[0] == "play":
+                state.apply_play(player_index, order, *self.identities[order])
+            else:
+                state.apply_discard(player_index, order, *self.identities[order])
+
+        if len(self.deck):
+            order = self.next_order
+            self.next_order += 1
+            identity = self.deck.pop()
+            self.identities[order] = identity
+            for state in states:
+                if state.our_player_index == player_index:
+                    state.apply_draw(player_index, order, -1, -1)
+                else:
+                    state.apply_draw(player_index, order, *identity)
+
+    def run(
+        self,
+        player_index: int,
+        action: Tuple,
+        policy: Callable[[GameState], Tuple] = get_rollout_action,
+    ) -> float:
+        """Plays `action` for player_index, lets everyone else take one turn
+        with `policy`, and returns the value of where the round ends up."""
+        max_score_before = get_max_score(self.states[player_index])
+        self.step(player_index, action)
+        for i in range(1, self.num_players):
+            current_player_index = (player_index + i) % self.num_players
+            current_state = self.states[current_player_index]
+            if current_state.bombs >= 3 or not len(current_state.our_hand):
+                break
+            self.step(current_player_index, policy(current_state))
+        return get_rollout_value(self.states[player_index], max_score_before)
+
+
+def run_rollouts(
+    state: GameState,
+    actions: List[Tuple],
+    num_rollouts: int,
+    seed: Optional[int] = None,
+    time_limit: Optional[float] = None,
+    policy: Callable[[GameState], Tuple] = get_rollout_action,
+    belief: Optional[BeliefState] = None,
+) -> Tuple[np.ndarray, int, int]:
+    """Evaluates every action on the same num_rollouts determinizations, our
+    hand sampled with the help of belief if given. Returns (total value per
+    action, rollouts done, rollouts that failed)."""
+    deadline = Deadline(time_limit)
+    rng = np.random.default_rng(seed)
+    sampler = HandSampler(state, belief=belief)
+    hands = sampler.sample(num_rollouts, rng)
+    deck_counts = sampler.get_deck_counts(hands)
+    totals = np.zeros(len(actions))
+    num_done, num_failed = 0, 0
+
+    # the conventions narrate everything they do, which nobody reads here
+    with contextlib.redirect_stdout(io.StringIO()):
+        for hand, counts in zip(hands, deck_counts):
+            if deadline.expired():
+                break
+            deck = [
+                sampler.identities[i]
+                for i in rng.permutation(np.repeat(np.arange(len(counts)), counts))
+            ]
+            try:
+                rollout = Rollout(state, sampler.to_identities(hand), deck)
+                values = [
+                    rollout.fork().run(state.our_player_index, action, policy)
+                    for action in actions
+                ]
+            except Exception:
+                # convention code can trip over positions that only a wrong
+                # guess about our hand leads to; drop that determinization
+                num_failed += 1
+                continue
+            totals += values
+            num_done += 1
+    return totals, num_done, num_failed
+
+
+class RolloutEvaluator:
+    """Scores each of our legal actions by Monte Carlo rollouts, sharded over
+    a process pool. Every shard samples its own determinizations and evaluates
+    all actions on each of them, so the comparison between actions is not
+    drowned out by the luck of the draw.
+
+    With max_workers=0 the rollouts run in this process instead.
+    """
+
+    def __init__(
+        self,
+        num_rollouts: int = NUM_ROLLOUTS,
+        max_workers: Optional[int] = None,
+        policy: Callable[[GameState], Tuple] = get_rollout_action,
+    ):
+        self.num_rollouts = num_rollouts
+        self.max_workers = max_workers
+        self.policy = policy
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def num_shards(self) -> int:
+        if self.max_workers == 0:
+            return 1
+        return self.max_workers or os.cpu_count() or 1
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        # started on first use, since spinning up workers takes a while
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def reset_executor(self):
+        # a pool that lost a worker refuses all further work, so the next
+        # evaluation starts a new one
+        if self.executor is not None:
+            print("Rollout process pool broke, restarting it next time")
+        self.close()
+
+    def evaluate(
+        self,
+        state: GameState,
+        actions: Optional[List[Tuple]] = None,
+        deadline: Optional[Deadline] = None,
+        seed: Optional[int] = None,
+        belief: Optional[BeliefState] = None,
+    ) -> Optional[RolloutResult]:
+        """None if there is nothing to choose between or no rollout finished,
+        including when every shard failed."""
+        actions = get_legal_actions(state) if actions is None else actions
+        if not len(actions):
+            return None
+        time_limit = None if deadline is None else deadline.remaining
+        num_shards = self.num_shards
+        seeds = np.random.SeedSequence(seed).spawn(num_shards)
+        shard_sizes = [
+            self.num_rollouts // num_shards + (i < self.num_rollouts % num_shards)
+            for i in range(num_shards)
+        ]
+
+        shards = []
+        if self.max_workers == 0:
+            try:
+                shards.append(
+                    run_rollouts(
+                        state, actions, shard_sizes[0], seeds[0], time_limit, self.policy, belief
+                    )
+                )
+            except Exception as e:
+                print(f"Rollouts failed ({e.__class__.__name__}: {e})")
+        else:
+            try:
+                futures = [
+                    self.get_executor().submit(
+                        run_rollouts,
+                        state,
+                        actions,
+                        size,
+                        shard_seed,
+                        time_limit,
+                        self.policy,
+                        belief,
+                    )
+                    for size, shard_seed in zip(shard_sizes, seeds)
+                    if size > 0
+                ]
+            except BrokenProcessPool:
+                futures = []
+                self.reset_executor()
+            # shards check the clock themselves; the timeout only guards
+            # against the pool itself being slow to answer
+            done, not_done = wait(futures, timeout=time_limit, return_when=ALL_COMPLETED)
+            for future in not_done:
+                future.cancel()
+            # a shard that failed (or a worker that died) costs only its own
+            # rollouts; if none are left the caller falls back as it would
+            # without rollouts
+            for future in done:
+                try:
+                    shards.append(future.result())
+                except BrokenProcessPool:
+                    self.reset_executor()
+                except Exception as e:
+                    print(f"Rollout shard failed ({e.__class__.__name__}: {e})")
+
+        totals = sum(shard[0] for shard in shards)
+        num_rollouts = sum(shard[1] for shard in shards)
+        num_failed = sum(shard[2] for shard in shards)
+        if num_rollouts == 0:
+            return None
+
+        values = totals / num_rollouts
+        action_values = {action: float(value) for action, value in zip(actions, values)}
+        best = max(actions, key=lambda x: action_values[x])
+        return RolloutResult(best, action_values[best], action_values, num_rollouts, num_failed)
@@ -0,0 +1,195 @@
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from game_state import GameState, SUITS, get_all_cards, get_all_cards_with_multiplicity
+
+if TYPE_CHECKING:
+    from belief import BeliefState
+
+# the least a belief may scale an identity's proposal weight by, so that the
+# proposal never rules out anything the target distribution allows
+MIN_BELIEF_TILT = 1e-2
+
+
+def get_identities(variant_name: str) -> List[Tuple[int, int]]:
+    # fixed column order for every per-identity array
+    return sorted(get_all_cards(variant_name))
+
+
+def get_identity_to_index(variant_name: str) -> Dict[Tuple[int, int], int]:
+    return {identity: i for i, identity in enumerate(get_identities(variant_name))}
+
+
+def get_remaining_counts(state: GameState, player_index: Optional[int] = None) -> np.ndarray:
+    """Copies of each identity that player_index (by default us) cannot see: not
+    played, not discarded and not in another hand we know the contents of.
+    These are in their hand or the deck."""
+    if player_index is None:
+        player_index = state.our_player_index
+    identity_to_index = get_identity_to_index(state.variant_name)
+    counts = np.zeros(len(identity_to_index), dtype=np.int64)
+    for identity in get_all_cards_with_multiplicity(state.variant_name):
+        counts[identity_to_index[identity]] += 1
+
+    for suit, stack in enumerate(state.stacks):
+        if "Reversed" in SUITS[state.variant_name][suit]:
+            played_ranks = range(stack, 6)
+        else:
+            played_ranks = range(1, stack + 1)
+        for rank in played_ranks:
+            counts[identity_to_index[(suit, rank)]] -= 1
+
+    for identity, num in state.discards.items():
+        counts[identity_to_index[identity]] -= num
+
+    for hand_player_index, hand in state.hands.items():
+        if hand_player_index == player_index:
+            continue
+        for card in hand:
+            # our own cards are unknown to us even when others can see them
+            if card.suit_index == -1:
+                continue
+            counts[identity_to_index[card.to_tuple()]] -= 1
+
+    return np.maximum(counts, 0)
+
+
+def get_mask(
+    candidates_list: List[set], identity_to_index: Dict[Tuple[int, int], int]
+) -> np.ndarray:
+    mask = np.zeros((len(candidates_list), len(identity_to_index)), dtype=bool)
+    for i, candidates in enumerate(candidates_list):
+        for identity in candidates:
+            mask[i, identity_to_index[identity]] = True
+    return mask
+
+
+class HandSampler:
+    """Draws identities for every card in our hand at once, for many samples
+    in parallel.
+
+    Slots are filled one at a time (most constrained first), each drawing from
+    the copies still unassigned in that sample, so identities are weighted by
+    how many copies remain rather than uniformly over the candidate set. The
+    slot-by-slot proposal is corrected with importance weights, which
+    `sample` uses to resample, so the hands follow the true distribution over
+    deals of the unseen cards.
+
+    Given a BeliefState for our hand, each slot's proposal is tilted towards
+    what the belief makes of that slot competing for copies with the slots
+    still to be filled (the first slot to be filled uses the belief as it
+    stands). The hands follow the same distribution, with weights that vary
+    less, so fewer samples are wasted in resampling.
+    """
+
+    def __init__(
+        self,
+        state: GameState,
+        use_candidates: bool = True,
+        belief: Optional["BeliefState"] = None,
+    ):
+        self.identities = get_identities(state.variant_name)
+        identity_to_index = get_identity_to_index(state.variant_name)
+        self.counts = get_remaining_counts(state)
+        self.possibility_mask = get_mask(state.our_possibilities, identity_to_index)
+        if use_candidates:
+            # convention inferences can be wrong, so never look outside the
+            # possibilities even if a candidate set says otherwise
+            candidate_mask = get_mask(state.our_candidates, identity_to_index)
+            self.mask = candidate_mask & self.possibility_mask
+        else:
+            self.mask = self.possibility_mask
+        self.num_slots = len(state.our_hand)
+        self.slot_order = np.argsort(
+            (self.mask & (self.counts > 0)).sum(axis=1), kind="stable"
+        )
+        self.tilt = np.ones(self.mask.shape)
+        if belief is not None:
+            assert belief.state is state and belief.player_index == state.our_player_index
+            self.tilt = self.get_tilt(self.get_proposal_probabilities(belief))
+
+    def get_proposal_probabilities(self, belief: "BeliefState") -> np.ndarray:
+        # the slots filled before a slot are already taken out of the counts it
+        # is drawn from, so only the ones after it still compete with it
+        probabilities = np.zeros(self.mask.shape)
+        slot_order = list(self.slot_order)
+        for k, slot in enumerate(slot_order):
+            if k == 0:
+                probabilities[slot] = belief.refresh()[slot]
+            else:
+                masks = self.mask[slot_order[k:]].astype(float)
+                probabilities[slot] = belief.fit(masks, self.counts.astype(float))[0]
+        return probabilities
+
+    def get_tilt(self, probabilities: np.ndarray) -> np.ndarray:
+        # how much the belief moves each slot's identities away from the plain
+        # count-weighted proposal
+        weights = self.mask * self.counts
+        totals = weights.sum(axis=1, keepdims=True)
+        naive = np.divide(weights, totals, out=np.zeros(weights.shape), where=totals > 0)
+        tilt = np.divide(probabilities, naive, out=np.ones(weights.shape), where=naive > 0)
+        return np.maximum(tilt, MIN_BELIEF_TILT)
+
+    def sample_weighted(
+        self, num_samples: int, rng: Optional[np.random.Generator] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (hands, log_weights): hands is an int array of identity
+        indices with shape (num_samples, num_slots)."""
+        rng = np.random.default_rng() if rng is None else rng
+        counts = np.tile(self.counts, (num_samples, 1))
+        hands = np.zeros((num_samples, self.num_slots), dtype=np.int64)
+        log_weights = np.zeros(num_samples)
+        rows = np.arange(num_samples)
+
+        for slot in self.slot_order:
+            weights = counts * self.mask[slot] * self.tilt[slot]
+            totals = weights.sum(axis=1)
+            tilted = totals > 0
+
+            # if the candidates leave nothing, fall back to the possibilities,
+            # and after that to anything unseen
+            for fallback_mask in [self.possibility_mask[slot], None]:
+                empty = totals == 0
+                if not empty.any():
+                    break
+                if fallback_mask is None:
+                    weights[empty] = counts[empty]
+                else:
+                    weights[empty] = counts[empty] * fallback_mask
+                totals[empty] = weights[empty].sum(axis=1)
+
+            cumulative = np.cumsum(weights, axis=1)
+            targets = rng.random(num_samples) * totals
+            chosen = (cumulative <= targets[:, None]).sum(axis=1)
+            chosen = np.minimum(chosen, len(self.identities) - 1)
+
+            hands[:, slot] = chosen
+            counts[rows, chosen] -= 1
+            np.maximum(counts, 0, out=counts)
+            # the target weighs each pick by its count, the proposal by its
+            # count times its tilt (fallbacks aren't tilted)
+            tilt = np.where(tilted, self.tilt[slot, chosen], 1.0)
+            log_weights += np.log(np.where(totals > 0, totals, 1)) - np.log(tilt)
+
+        return hands, log_weights
+
+    def sample(
+        self, num_samples: int, rng: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+        """num_samples hands, resampled by importance weight."""
+        rng = np.random.default_rng() if rng is None else rng
+        hands, log_weights = self.sample_weighted(num_samples, rng)
+        weights = np.exp(log_weights - log_weights.max())
+        picks = rng.choice(num_samples, size=num_samples, p=weights / weights.sum())
+        return hands[picks]
+
+    def get_deck_counts(self, hands: np.ndarray) -> np.ndarray:
+        """Unseen copies left for the deck after each sampled hand."""
+        counts = np.tile(self.counts, (len(hands), 1))
+        for slot in range(hands.shape[1]):
+            np.subtract.at(counts, (np.arange(len(hands)), hands[:, slot]), 1)
+        return np.maximum(counts, 0)
+
+    def to_identities(self, hand: np.ndarray) -> List[Tuple[int, int]]:
+        return [self.identities[i] for i in hand]
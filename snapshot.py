@@ -0,0 +1,117 @@
+import os
+import pickle
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from game_state import GameState
+
+# bump this whenever the layout of GameState (or a convention subclass) changes
+# in a way that makes older snapshots unsafe to restore
+SNAPSHOT_VERSION = 7
+
+
+class SnapshotStore:
+    """Persists one compressed GameState snapshot per table so that a restarted
+    bot can resume a game without replaying every action through the engine.
+
+    Snapshots are pickled whole, so convention-specific fields (play_orders,
+    unresolved_reactions, hat_clued_card_orders, order_to_finesse_paths, ...)
+    come along for free.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_path(self, table_id: int) -> str:
+        return os.path.join(self.directory, f"table_{table_id}.snapshot")
+
+    def save(self, table_id: int, state: GameState, num_actions_handled: int):
+        blob = {
+            "version": SNAPSHOT_VERSION,
+            "num_actions_handled": num_actions_handled,
+            "state": state,
+        }
+        data = zlib.compress(pickle.dumps(blob, protocol=pickle.HIGHEST_PROTOCOL))
+
+        # write to a temporary file first so that a crash mid-write never leaves
+        # a truncated snapshot behind
+        path = self.get_path(table_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load(
+        self,
+        table_id: int,
+        game_state_cls: type,
+        variant_name: str,
+        player_names: List[str],
+        our_player_index: int,
+        game_id: Optional[str] = None,
+    ) -> Optional[Tuple[GameState, int]]:
+        """Returns (state, num_actions_handled), or None if there is no usable
+        snapshot for this exact game."""
+        path = self.get_path(table_id)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "rb") as f:
+                blob = pickle.loads(zlib.decompress(f.read()))
+        except Exception as e:
+            print(f"Ignoring unreadable snapshot {path} ({e.__class__.__name__})")
+            return None
+
+        state = blob.get("state")
+        if blob.get("version") != SNAPSHOT_VERSION or not is_same_game(
+            state, game_state_cls, variant_name, player_names, our_player_index, game_id
+        ):
+            print(f"Ignoring stale snapshot {path}")
+            return None
+
+        return state, blob["num_actions_handled"]
+
+    def delete(self, table_id: int):
+        path = self.get_path(table_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def get_table_ids(self) -> List[int]:
+        result = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith("table_") and filename.endswith(".snapshot"):
+                result.append(int(filename[len("table_") : -len(".snapshot")]))
+        return sorted(result)
+
+
+def is_same_game(
+    state: GameState,
+    game_state_cls: type,
+    variant_name: str,
+    player_names: List[str],
+    our_player_index: int,
+    game_id: Optional[str] = None,
+) -> bool:
+    # whether a state we already hold can stand in for the game described by an
+    # "init" message, instead of building a fresh one; the same players can start
+    # another game of the same variant at the same table, hence the game id
+    return (
+        type(state) is game_state_cls
+        and state.variant_name == variant_name
+        and state.player_names == player_names
+        and state.our_player_index == our_player_index
+        and state.game_id == game_id
+    )
+
+
+def get_game_id(init_data: Dict) -> str:
+    # the seed alone repeats when a seed is replayed, so add the start time
+    return f"{init_data.get('seed')}@{init_data.get('datetimeStarted')}"
+
+
+def get_missed_actions(action_list: List[Dict], num_actions_handled: int) -> List[Dict]:
+    # the server always sends the full action list, so everything up to the
+    # number of actions already folded into the snapshot can be skipped
+    return action_list[num_actions_handled:]
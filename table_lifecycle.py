@@ -0,0 +1,110 @@
+import sys
+import time
+from typing import Dict, List, Optional
+
+# reasons a table's state gets dropped, used in logs and eviction reports
+EVICT_TABLE_GONE = "tableGone"
+EVICT_GAME_OVER = "gameOver"
+EVICT_INACTIVE = "inactive"
+EVICT_OVER_CAP = "overCap"
+# the games in these may still be running, so their tables are reloaded on
+# their next message
+EVICT_DORMANT_REASONS = {EVICT_INACTIVE, EVICT_OVER_CAP}
+
+# lobby entries kept around for the join/start chat commands
+MAX_LOBBY_TABLES = 256
+
+
+def get_deep_size(obj, seen: Optional[set] = None) -> int:
+    """Approximate number of bytes reachable from obj, counting every object once."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += get_deep_size(key, seen) + get_deep_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for x in obj:
+            size += get_deep_size(x, seen)
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += get_deep_size(vars(obj), seen)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += get_deep_size(getattr(obj, slot), seen)
+    return size
+
+
+class TableLifecycle:
+    """Tracks when each table we hold state for was last active and decides which
+    ones to drop, so that a long-running host does not keep GameStates for
+    finished, terminated or abandoned tables forever."""
+
+    def __init__(
+        self,
+        inactivity_timeout: Optional[float] = 6 * 60 * 60,
+        max_retained_tables: Optional[int] = 32,
+    ):
+        self.inactivity_timeout = inactivity_timeout
+        self.max_retained_tables = max_retained_tables
+        self.last_active: Dict[int, float] = {}
+        # tables evicted while their game may still be running, oldest first;
+        # capped like the tables themselves
+        self.dormant: Dict[int, None] = {}
+
+    def touch(self, table_id: int, now: Optional[float] = None):
+        self.last_active[table_id] = time.time() if now is None else now
+
+    def forget(self, table_id: int, dormant: bool = False):
+        self.last_active.pop(table_id, None)
+        self.dormant.pop(table_id, None)
+        if dormant:
+            self.dormant[table_id] = None
+            if self.max_retained_tables is not None:
+                while len(self.dormant) > self.max_retained_tables:
+                    del self.dormant[next(iter(self.dormant))]
+
+    def wake(self, table_id: int) -> bool:
+        """Whether table_id was evicted while its game was maybe still running,
+        in which case it has to be reloaded now that it is active again."""
+        if table_id not in self.dormant:
+            return False
+        del self.dormant[table_id]
+        return True
+
+    def get_tables_to_evict(self, now: Optional[float] = None) -> Dict[int, str]:
+        """Returns {table_id: reason} for tables that timed out, plus the least
+        recently active tables beyond the retention cap."""
+        now = time.time() if now is None else now
+        result = {}
+        if self.inactivity_timeout is not None:
+            for table_id, last_active in self.last_active.items():
+                if now - last_active > self.inactivity_timeout:
+                    result[table_id] = EVICT_INACTIVE
+
+        if self.max_retained_tables is not None:
+            remaining = sorted(
+                [x for x in self.last_active if x not in result],
+                key=lambda x: self.last_active[x],
+            )
+            num_over = len(remaining) - self.max_retained_tables
+            for table_id in remaining[: max(num_over, 0)]:
+                result[table_id] = EVICT_OVER_CAP
+        return result
+
+
+def get_memory_report(games: Dict[int, object]) -> Dict[int, int]:
+    return {table_id: get_deep_size(state) for table_id, state in games.items()}
+
+
+def format_memory_report(report: Dict[int, int]) -> List[str]:
+    lines = []
+    for table_id, num_bytes in sorted(report.items(), key=lambda x: -x[1]):
+        lines.append(f"table {table_id}: {num_bytes / 1024:.1f} KiB")
+    lines.append(f"total: {sum(report.values()) / 1024:.1f} KiB over {len(report)} table(s)")
+    return lines
@@ -0,0 +1,92 @@
+from typing import Callable, Hashable, Tuple
+
+from constants import MAX_CLUE_NUM
+from game_state import Card, GameState
+from rollout import get_rollout_action
+from zobrist import PositionCache, ZobristHasher
+
+# Good actions that get a card discarded, from most to least sure it is useless
+DISCARD_ACTION_TYPES = [
+    "trash",
+    "dupe_in_own_hand",
+    "dupe_in_other_hand",
+    "dupe_in_other_hand_or_trash",
+]
+
+
+def get_teammate_view(state: GameState, player_index: int) -> GameState:
+    """`state` as player_index sees it: their own cards are hidden and their
+    candidates are the ones we already track for them. Our hand stays unknown,
+    since we can't see it either. Hiding cards only takes information away, so
+    the candidates need no reprocessing."""
+    view = state.fork()
+    view.our_player_index = player_index
+    hand = view.hands[player_index]
+    for i, card in enumerate(hand):
+        hand[i] = Card(card.order, -1, -1)
+    # hands changed behind the handlers' backs
+    view.zobrist_hash = None
+    return view
+
+
+def get_convention_action(state: GameState) -> Tuple:
+    """The move the player whose point of view `state` is takes next under
+    their convention: the lowest playable from get_good_actions, then the
+    safest discard or their chop, and otherwise whatever get_rollout_action picks (queued
+    plays and discards, then get_fallback_action)."""
+    try:
+        good_actions = state.get_good_actions(state.our_player_index)
+    except NotImplementedError:
+        return get_rollout_action(state)
+
+    if len(good_actions["playable"]):
+        return (
+            "play",
+            min(
+                good_actions["playable"],
+                key=lambda order: min([x[1] for x in state.get_candidates(order)]),
+            ),
+        )
+    if state.clue_tokens < MAX_CLUE_NUM:
+        for action_type in DISCARD_ACTION_TYPES:
+            if len(good_actions.get(action_type, [])):
+                return ("discard", good_actions[action_type][0])
+        # chop-moved cards are unclued but not up for discarding
+        if hasattr(state, "get_chop_order"):
+            chop_order = state.get_chop_order(state.our_player_index)
+            if chop_order is not None:
+                return ("discard", chop_order)
+    return get_rollout_action(state)
+
+
+def get_convention_extra(state: GameState, player_index: int) -> Hashable:
+    # convention state a teammate acts on that the Zobrist hash leaves out
+    play_orders = getattr(state, "play_orders", {}).get(player_index, [])
+    discard_orders = getattr(state, "discard_orders", {}).get(player_index, [])
+    chop_order = getattr(state, "ctd_order", {}).get(player_index)
+    return (player_index, tuple(play_orders), tuple(discard_orders), chop_order)
+
+
+class TeammatePredictor:
+    """Answers "what will player X do next?" by running X's convention policy
+    on X's view of the position, i.e. from their candidates rather than ours.
+    Predictions are memoized per position, so a strategy looping over candidate
+    clues, or asking about several teammates, works each one out only once.
+    """
+
+    def __init__(
+        self,
+        variant_name: str,
+        policy: Callable[[GameState], Tuple] = get_convention_action,
+        max_size: int = 1024,
+    ):
+        self.policy = policy
+        self.cache = PositionCache(ZobristHasher(variant_name), max_size)
+
+    def predict(self, state: GameState, player_index: int) -> Tuple:
+        """("play", order), ("discard", order) or ("clue", target_index, clue_type, clue_value)."""
+        return self.cache.get(
+            state,
+            lambda x: self.policy(get_teammate_view(x, player_index)),
+            extra=get_convention_extra(state, player_index),
+        )
@@ -0,0 +1,152 @@
+from belief import BeliefState
+from conventions.h_group import HGroupGameState
+from deadline import get_fallback_action
+from game_state import RANK_CLUE
+from sampler import HandSampler, get_identities, get_remaining_counts
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue, get_deck_from_tuples
+import datetime as dt
+import numpy as np
+
+
+CARD_TUPLES = [
+    (0, 1), (1, 5), (2, 3), (3, 4), (4, 1),
+    (0, 1), (1, 2), (2, 2), (3, 5), (4, 4),
+    (1, 1), (2, 1), (3, 1), (4, 3), (0, 5),
+]
+
+
+def get_states():
+    return create_game_states(3, "No Variant", HGroupGameState, deck=get_deck_from_tuples(CARD_TUPLES))
+
+
+def test_belief_rows_sum_to_one():
+    alice = get_states()[0]
+    belief = BeliefState(alice)
+    probabilities = belief.refresh()
+    check_eq(probabilities.shape, (5, 25))
+    assert np.allclose(probabilities.sum(axis=1), 1)
+    # nothing is known yet, and 11 of the 40 cards Alice can't see are 1s
+    assert np.allclose(belief.get_playable_probabilities(), 11 / 40)
+    assert np.allclose(belief.get_trash_probabilities(), 0)
+
+
+def test_belief_weighted_by_multiplicity():
+    alice = get_states()[0]
+    alice.all_candidates_list[0][0] = {(0, 1), (2, 5)}
+    belief = BeliefState(alice)
+    distribution = belief.get_card_distribution(0)
+    check_eq(set(distribution), {(0, 1), (2, 5)})
+
+    # agrees with the exact sampler
+    identities = get_identities(alice.variant_name)
+    hands = HandSampler(alice).sample(20000, np.random.default_rng(0))
+    frac_red_1 = (hands[:, 0] == identities.index((0, 1))).mean()
+    assert abs(distribution[(0, 1)] - frac_red_1) < 0.03, (distribution, frac_red_1)
+
+
+def test_belief_competing_cards():
+    alice = get_states()[0]
+    # slot 0 is the only blue 5 left, so slot 1 must be the green 5
+    alice.all_candidates_list[0][0] = {(1, 5)}
+    alice.all_candidates_list[0][1] = {(1, 5), (2, 5)}
+    belief = BeliefState(alice)
+    check_eq(belief.get_card_distribution(0), {(1, 5): 1.0})
+    assert belief.get_card_distribution(1)[(2, 5)] > 0.95
+    assert np.isclose(belief.get_critical_probabilities()[1], 1)
+
+
+def test_belief_refresh_is_incremental():
+    states = get_states()
+    alice = states[0]
+    belief = BeliefState(alice)
+    probabilities = belief.refresh()
+    before = dict(belief.mask_cache)
+    assert belief.refresh() is probabilities
+
+    give_clue(states, 1, RANK_CLUE, 1, 0)
+    belief.refresh()
+    # only the rows of cards whose candidate set was replaced are rebuilt
+    for order, (constraint, mask) in belief.mask_cache.items():
+        check_eq(mask is before[order][1], constraint is before[order][0])
+    assert np.isclose(belief.get_playable_probabilities()[0], 1)
+
+
+def test_belief_follows_actions():
+    states = get_states()
+    alice, bob = states[0], states[1]
+    beliefs = {0: BeliefState(alice), 1: BeliefState(bob)}
+    # Alice plays her oldest card (a red 1) and draws the yellow 1, then Bob
+    # discards his (the other red 1)
+    actions = [
+        ("play", 0, alice.hands[0][0].order, (0, 1)),
+        ("draw", 0, 15, (1, 1)),
+        ("discard", 1, bob.hands[1][0].order, (0, 1)),
+        ("draw", 1, 16, (0, 2)),
+    ]
+    for kind, player_index, order, identity in actions:
+        for i, state in states.items():
+            seen = (-1, -1) if kind == "draw" and i == player_index else identity
+            belief = beliefs.get(i)
+            if kind == "play":
+                state.handle_play(player_index, order, *seen)
+            elif kind == "discard":
+                state.handle_discard(player_index, order, *seen)
+            else:
+                state.handle_draw(player_index, order, *seen)
+            if belief is not None:
+                getattr(belief, "handle_" + kind)(player_index, order, *seen)
+
+    for i, belief in beliefs.items():
+        check_eq(list(belief.counts), list(get_remaining_counts(states[i], i)))
+        # refitting from the previous probabilities ends up where a fresh fit does
+        assert np.allclose(belief.refresh(), BeliefState(states[i]).refresh(), atol=0.01)
+
+
+def test_sampler_uses_belief():
+    alice = get_states()[0]
+    # one blue 5 is left for two slots, which the plain proposal ignores
+    alice.all_candidates_list[0][0] = {(1, 5), (2, 5)}
+    alice.all_candidates_list[0][1] = {(1, 5), (4, 5)}
+    identities = get_identities(alice.variant_name)
+    results = []
+    for belief in [None, BeliefState(alice)]:
+        hands, log_weights = HandSampler(alice, belief=belief).sample_weighted(
+            20000, np.random.default_rng(0)
+        )
+        weights = np.exp(log_weights - log_weights.max())
+        weights /= weights.sum()
+        frac_blue_5 = weights[hands[:, 0] == identities.index((1, 5))].sum()
+        results.append((frac_blue_5, 1 / (weights ** 2).sum()))
+    # same distribution (a third of the deals give slot 0 the blue 5), with
+    # more even weights
+    (plain_frac, plain_ess), (belief_frac, belief_ess) = results
+    assert abs(plain_frac - 1 / 3) < 0.02 and abs(belief_frac - 1 / 3) < 0.02, results
+    assert belief_ess > plain_ess, results
+
+
+def test_fallback_discard_uses_belief():
+    alice = get_states()[0]
+    alice.clue_tokens = 7
+    # the oldest card might be the last blue 5, the next one can't be critical
+    alice.all_candidates_list[0][0] = {(1, 5), (1, 4)}
+    alice.all_candidates_list[0][1] = {(0, 2), (1, 2)}
+    check_eq(get_fallback_action(alice), ("discard", 0))
+    check_eq(get_fallback_action(alice, BeliefState(alice)), ("discard", 1))
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_belief_rows_sum_to_one()
+    test_belief_weighted_by_multiplicity()
+    test_belief_competing_cards()
+    test_belief_refresh_is_incremental()
+    test_belief_follows_actions()
+    test_sampler_uses_belief()
+    test_fallback_discard_uses_belief()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
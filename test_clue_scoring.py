@@ -0,0 +1,88 @@
+from clue_scoring import ClueScores, ClueWeights, get_entropies
+from clue_table import ClueTable, get_clue_type_values
+from conventions.ref_sieve import RefSieveGameState
+from game_state import COLOR_CLUE, RANK_CLUE
+from sampler import get_remaining_counts, get_identity_to_index
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue, get_deck_from_tuples
+import datetime as dt
+import numpy as np
+
+
+CARD_TUPLES = [
+    (0, 1), (1, 5), (2, 3), (3, 4), (4, 1),
+    (0, 1), (1, 2), (2, 2), (3, 5), (4, 4),
+    (1, 1), (2, 1), (3, 1), (4, 3), (0, 5),
+]
+
+
+def get_states(cls=RefSieveGameState):
+    return create_game_states(3, "No Variant", cls, deck=get_deck_from_tuples(CARD_TUPLES))
+
+
+def get_entropy(candidates, counts, identity_to_index) -> float:
+    weights = np.array([counts[identity_to_index[x]] for x in candidates], dtype=float)
+    if not weights.sum():
+        return 0.0
+    probs = weights[weights > 0] / weights.sum()
+    return float(-(probs * np.log2(probs)).sum())
+
+
+def test_entropies():
+    check_eq(list(get_entropies(np.array([[1, 1, 1, 1], [2, 0, 0, 0], [0, 0, 0, 0]]))), [2.0, 0.0, 0.0])
+
+
+def test_gains_match_a_card_by_card_count():
+    states = get_states()
+    give_clue(states, 0, RANK_CLUE, 1, 2)
+    alice = states[0]
+    weights = ClueWeights(critical=1.0, playable=1.0, other=1.0, bad_touch=0.0)
+    scores = ClueScores(alice, weights=weights)
+    identity_to_index = get_identity_to_index("No Variant")
+    for target_index in [1, 2]:
+        table = scores.clue_table
+        counts = get_remaining_counts(alice, target_index)
+        candidates_list = alice.all_candidates_list[target_index]
+        for clue_type, clue_value in get_clue_type_values("No Variant"):
+            new_candidates = table.get_new_candidates(clue_type, clue_value, target_index)
+            expected = sum(
+                get_entropy(x, counts, identity_to_index) - get_entropy(y, counts, identity_to_index)
+                for x, y in zip(candidates_list, new_candidates)
+            )
+            assert abs(scores.get_gain(clue_type, clue_value, target_index) - expected) < 1e-9
+
+
+def test_weights():
+    alice = get_states()[0]
+    scores = ClueScores(alice, weights=ClueWeights(critical=0, playable=0, other=0))
+    check_eq(scores.gains[1].any(), False)
+
+    # Bob's 5 is critical, so it is worth more than Bob's 2s
+    scores = ClueScores(alice, weights=ClueWeights(critical=10.0, playable=1.0, other=1.0))
+    assert scores.get_gain(RANK_CLUE, 5, 1) > scores.get_gain(RANK_CLUE, 2, 1)
+
+
+def test_bad_touch():
+    states = get_states()
+    alice = states[0]
+    alice.stacks[0] = 1
+    # red touches Bob's red 1, which is now trash
+    table = ClueTable(alice)
+    lenient = ClueScores(alice, table, ClueWeights(bad_touch=0.0))
+    strict = ClueScores(alice, table, ClueWeights(bad_touch=100.0))
+    check_eq(lenient.get_gain(COLOR_CLUE, 0, 1) - strict.get_gain(COLOR_CLUE, 0, 1), 100.0)
+    check_eq(lenient.get_gain(COLOR_CLUE, 1, 1), strict.get_gain(COLOR_CLUE, 1, 1))
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_entropies()
+    test_gains_match_a_card_by_card_count()
+    test_weights()
+    test_bad_touch()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
@@ -0,0 +1,105 @@
+from clue_table import ClueTable, get_clue_type_values
+from conventions.reactor import ReactorGameState
+from game_state import COLOR_CLUE, RANK_CLUE
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue, get_deck_from_tuples
+import datetime as dt
+
+
+CARD_TUPLES = [
+    (0, 1), (1, 5), (2, 3), (3, 4), (4, 1),
+    (0, 1), (1, 2), (2, 2), (3, 5), (4, 4),
+    (1, 1), (2, 1), (3, 1), (4, 3), (0, 5),
+]
+
+
+def get_states(cls=ReactorGameState):
+    return create_game_states(3, "No Variant", cls, deck=get_deck_from_tuples(CARD_TUPLES))
+
+
+def test_clue_type_values():
+    clue_type_values = get_clue_type_values("No Variant")
+    check_eq(len(clue_type_values), 10)
+    check_eq(clue_type_values[0], (RANK_CLUE, 1))
+    check_eq(clue_type_values[5], (COLOR_CLUE, 0))
+
+
+def test_touched_masks():
+    alice = get_states()[0]
+    table = ClueTable(alice)
+    check_eq(table.target_indices, [1, 2])
+    for target_index in table.target_indices:
+        for clue_type, clue_value in get_clue_type_values("No Variant"):
+            check_eq(
+                table.get_touched_orders(clue_type, clue_value, target_index),
+                alice.get_touched_orders(clue_type, clue_value, target_index),
+            )
+    # Cathy has no 2s or 4s
+    check_eq(len(table.get_clues(2)), 8)
+    check_eq(table.touched_masks[1].shape, (10, 5))
+
+
+def test_new_candidates():
+    states = get_states()
+    give_clue(states, 0, RANK_CLUE, 1, 2)
+    alice = states[0]
+    table = ClueTable(alice, [2])
+    candidates_list = alice.all_candidates_list[2]
+
+    # red touches Cathy's red 5 only
+    new_candidates = table.get_new_candidates(COLOR_CLUE, 0, 2)
+    check_eq(new_candidates[4], candidates_list[4].intersection({(0, x) for x in range(1, 6)}))
+    check_eq(new_candidates[0], candidates_list[0].difference({(0, x) for x in range(1, 6)}))
+
+    # a second 1 clue changes nothing, so every set is shared with the state
+    new_candidates = table.get_new_candidates(RANK_CLUE, 1, 2)
+    assert all(x is y for x, y in zip(new_candidates, candidates_list))
+
+    # the clued 1s are known playable either way, the others only by colour
+    i = table.get_index(COLOR_CLUE, 1)
+    check_eq(list(table.playable_masks[2][i]), [True, True, True, False, False])
+    check_eq(table.trash_masks[2].any(), False)
+
+
+def test_clue_scores():
+    states = get_states()
+    give_clue(states, 0, RANK_CLUE, 1, 2)
+    bob = states[1]
+    table = ClueTable(bob)
+    for target_index in table.target_indices:
+        for clue_type, clue_value in table.get_clues(target_index):
+            check_eq(
+                bob.evaluate_clue_score(clue_type, clue_value, target_index, table),
+                bob.evaluate_clue_score(clue_type, clue_value, target_index),
+            )
+    # Cathy's 1s are all still playable
+    check_eq(table.touches_trash(RANK_CLUE, 1, 2), False)
+    # Alice's first card is a red 1, and so is Bob's
+    give_clue(states, 2, RANK_CLUE, 5, 0)
+    bob.stacks[0] = 1
+    assert ClueTable(bob).touches_trash(COLOR_CLUE, 0, 0)
+
+
+
+def test_reactor_clues_from_shared_table():
+    # the client builds one table over every target and scores clues off it
+    for states in [get_states(), create_game_states(4, "No Variant", ReactorGameState)]:
+        give_clue(states, 0, RANK_CLUE, 1, 2)
+        for state in states.values():
+            table = ClueTable(state)
+            check_eq(state.get_stable_clues(clue_table=table), state.get_stable_clues())
+            check_eq(state.get_reactive_clues(clue_table=table), state.get_reactive_clues())
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_clue_type_values()
+    test_touched_masks()
+    test_new_candidates()
+    test_clue_scores()
+    test_reactor_clues_from_shared_table()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
@@ -0,0 +1,106 @@
+from conventions.h_group import HGroupGameState
+from conventions.encoder import EncoderV1GameState
+from deadline import (
+    Deadline,
+    DeadlineExceeded,
+    DeadlineMetrics,
+    get_fallback_action,
+    get_time_budget,
+)
+from game_state import RANK_CLUE
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue, get_deck_from_tuples
+import datetime as dt
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_time_budget():
+    # untimed games count up with negative numbers
+    check_eq(get_time_budget([-2268, -1015, -1039], 1), None)
+    check_eq(get_time_budget([60000, 60000], 0), 12.0)
+    check_eq(get_time_budget([60000, 60000], 0, time_taken=10000), 10.0)
+    # capped at MAX_BUDGET_SECONDS
+    check_eq(get_time_budget([600000, 600000], 1), 20.0)
+    # nearly out of time, keep the safety margin
+    check_eq(round(get_time_budget([1500], 0), 6), 0.3)
+    check_eq(get_time_budget([800], 0), 0.0)
+
+
+def test_deadline():
+    clock = FakeClock()
+    deadline = Deadline(2.0, clock=clock)
+    assert not deadline.expired()
+    deadline.check()
+    clock.now = 1.5
+    check_eq(deadline.remaining, 0.5)
+    clock.now = 2.5
+    assert deadline.expired()
+    try:
+        deadline.check()
+        assert False
+    except DeadlineExceeded:
+        pass
+
+    unlimited = Deadline(None, clock=clock)
+    clock.now = 1e9
+    assert not unlimited.expired()
+    check_eq(unlimited.remaining, None)
+
+
+def test_deadline_metrics():
+    clock = FakeClock()
+    metrics = DeadlineMetrics()
+    for budget, elapsed, used_fallback in [(1.0, 0.5, False), (1.0, 1.75, True), (None, 9.0, False)]:
+        deadline = Deadline(budget, clock=clock)
+        clock.now += elapsed
+        metrics.record("hgroup", deadline, used_fallback)
+    check_eq(metrics.num_decisions["hgroup"], 2)
+    check_eq(metrics.num_misses["hgroup"], 1)
+    check_eq(metrics.num_fallbacks["hgroup"], 1)
+    check_eq(metrics.max_overrun["hgroup"], 0.75)
+    check_eq(metrics.summary(), "hgroup: 1/2 missed, 1 fallbacks, max overrun 0.75s")
+
+
+def test_fallback_action():
+    card_tuples = [
+        (0, 1), (1, 2), (2, 3), (3, 4), (4, 5),
+        (0, 2), (1, 3), (2, 4), (3, 5), (4, 1),
+        (1, 1), (2, 2), (3, 3), (4, 4), (0, 5),
+    ]
+    states = create_game_states(3, "No Variant", HGroupGameState, deck=get_deck_from_tuples(card_tuples))
+    # no information: discard chop
+    states[0].clue_tokens = 7
+    check_eq(get_fallback_action(states[0]), ("discard", states[0].hands[0][0].order))
+
+    # Alice knows her 1
+    give_clue(states, 1, RANK_CLUE, 1, 0)
+    check_eq(get_fallback_action(states[0]), ("play", 0))
+
+    # with 8 clues and nothing to play, give a rank clue to the next player
+    states = create_game_states(4, "No Variant", EncoderV1GameState)
+    alice = states[0]
+    alice.clue_tokens = 8
+    action = get_fallback_action(alice)
+    check_eq(action[:3], ("clue", 1, RANK_CLUE))
+    assert len(alice.get_touched_orders(RANK_CLUE, action[3], 1))
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_get_time_budget()
+    test_deadline()
+    test_deadline_metrics()
+    test_fallback_action()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
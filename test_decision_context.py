@@ -0,0 +1,83 @@
+from conventions.reactor import ReactorGameState
+from conventions.ref_sieve import RefSieveGameState
+from decision_context import get_decision_context
+from game_state import COLOR_CLUE, RANK_CLUE
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue
+import datetime as dt
+
+
+def test_context_matches_state():
+    states = create_game_states(3, "No Variant", RefSieveGameState, seed=3)
+    give_clue(states, 0, RANK_CLUE, 1, 1)
+    alice = states[0]
+    ctx = get_decision_context(alice)
+    check_eq(ctx.clued_card_orders, frozenset(alice.clued_card_orders))
+    check_eq(ctx.play_orders, frozenset(alice.all_play_orders))
+    check_eq(ctx.playables, frozenset(alice.playables))
+    check_eq(ctx.trash, frozenset(alice.trash))
+
+
+def test_clues_with_and_without_context():
+    # clue meanings the pre-context code gave on this deal
+    expected_stable_clues = {
+        0: {(2, 1, 2): "REF_DISCARD", (3, 1, 2): "LOCK", (4, 1, 2): "REF_DISCARD"},
+        1: {(2, 1, 2): "REF_DISCARD", (3, 1, 2): "LOCK", (4, 1, 2): "REF_DISCARD"},
+        2: {
+            (1, 1, 0): "DIRECT_PLAY", (4, 0, 0): "REF_PLAY",
+            (4, 1, 0): "REF_DISCARD", (5, 1, 0): "REF_DISCARD",
+        },
+    }
+    expected_reactive_clues = {
+        0: {},
+        1: {
+            (0, 0, 0): "1P1D_DISCARD", (1, 0, 0): "1P1D_DISCARD",
+            (3, 0, 0): "1P1D_DISCARD", (4, 0, 0): "1P1D_DISCARD",
+        },
+        2: {(2, 1, 1): "2P0D_FINESSE"},
+    }
+    states = create_game_states(3, "No Variant", ReactorGameState, seed=3)
+    give_clue(states, 0, COLOR_CLUE, 0, 1)
+    for player_index, state in states.items():
+        ctx = get_decision_context(state)
+        check_eq(state.get_stable_clues(ctx), expected_stable_clues[player_index])
+        check_eq(state.get_stable_clues(), expected_stable_clues[player_index])
+        check_eq(state.get_reactive_clues(ctx), expected_reactive_clues[player_index])
+        check_eq(state.get_reactive_clues(), expected_reactive_clues[player_index])
+
+    expected_ref_sieve_clues = {
+        0: {
+            (1, 2, 1): "REF_DISCARD", (1, 2, 2): "REF_DISCARD", (1, 3, 1): "REF_DISCARD",
+            (1, 3, 2): "LOCK", (1, 4, 1): "REF_DISCARD", (1, 4, 2): "REF_DISCARD",
+        },
+        1: {
+            (0, 4, 0): "REF_PLAY", (1, 1, 0): "DIRECT_PLAY", (1, 2, 2): "REF_DISCARD",
+            (1, 3, 2): "LOCK", (1, 4, 0): "REF_DISCARD", (1, 4, 2): "REF_DISCARD",
+            (1, 5, 0): "REF_DISCARD",
+        },
+        2: {
+            (0, 4, 0): "REF_PLAY", (1, 1, 0): "DIRECT_PLAY", (1, 2, 1): "REF_DISCARD",
+            (1, 3, 1): "REF_DISCARD", (1, 4, 0): "REF_DISCARD", (1, 4, 1): "REF_DISCARD",
+            (1, 5, 0): "REF_DISCARD",
+        },
+    }
+    states = create_game_states(3, "No Variant", RefSieveGameState, seed=3)
+    give_clue(states, 0, RANK_CLUE, 1, 1)
+    for player_index, state in states.items():
+        check_eq(
+            state.get_ref_sieve_clues(get_decision_context(state)),
+            expected_ref_sieve_clues[player_index],
+        )
+        check_eq(state.get_ref_sieve_clues(), expected_ref_sieve_clues[player_index])
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_context_matches_state()
+    test_clues_with_and_without_context()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
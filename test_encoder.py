@@ -1,5 +1,13 @@
-from conventions.encoder import BaseEncoderGameState, EncoderV1GameState
-from game_state import RANK_CLUE, COLOR_CLUE, get_all_touched_cards, SUITS, Card
+from conventions.encoder import (
+    BaseEncoderGameState,
+    EncoderV1GameState,
+    EncoderV2GameState,
+    HatClueTable,
+    get_fillin_residue_masks,
+    get_masked_identities,
+    get_residue_masks,
+)
+from game_state import RANK_CLUE, COLOR_CLUE, get_all_cards, get_all_touched_cards, SUITS, Card
 from test_functions import check_eq
 from test_game_state import create_game_states, get_deck_from_tuples, give_clue, play, discard, play_draw, discard_draw
 import datetime as dt
@@ -422,6 +430,80 @@ def test_superposition6():
     check_eq(STATES_5P[4].our_candidates[1], {(0, 4), (3, 5)})
 
 
+def test_residue_masks():
+    for variant_name in ["No Variant", "6 Suits"]:
+        states = create_game_states(5, variant_name, EncoderV2GameState, seed=2)
+        state = states[0]
+        mod_base = state.mod_base
+        residue_masks = get_residue_masks(state.get_residues(), mod_base)
+        fillin_residue_masks = get_fillin_residue_masks(variant_name, mod_base)
+        num_suits = len(SUITS[variant_name])
+        for residue in range(mod_base):
+            check_eq(
+                get_masked_identities(variant_name, residue_masks[residue]),
+                state.residue_to_identities.get(residue, set()),
+            )
+            check_eq(
+                get_masked_identities(variant_name, fillin_residue_masks[residue]),
+                {
+                    (suit_index, rank)
+                    for suit_index, rank in get_all_cards(variant_name)
+                    if (1 + suit_index + (rank - 1) * num_suits) % mod_base == residue
+                },
+            )
+
+        _, residues = state.get_hat_targets([1, 2, 3, 4])
+        expected = [
+            state.identity_to_residue[state.get_leftmost_non_hat_clued_card(i).to_tuple()]
+            for i in [1, 2, 3, 4]
+        ]
+        check_eq(residues.tolist(), expected)
+
+
+def test_hat_clue_table():
+    for variant_name in ["No Variant", "Brown (5 Suits)", "Valentine Mix (5 Suits)"]:
+        states = create_game_states(5, variant_name, EncoderV1GameState, seed=4)
+        alice = states[0]
+        table = HatClueTable(alice)
+        check_eq(table.target_indices, [1, 2, 3, 4])
+        for target_index in table.target_indices:
+            num_clues = 0
+            for raw_residue in range(alice.num_residues_per_player):
+                clues = table.get_clues(target_index, raw_residue)
+                num_clues += len(clues)
+                for (clue_value, clue_type, _), cards_touched in clues.items():
+                    hat_residue = alice.get_hat_residue(
+                        0, target_index, clue_type, clue_value, [x.order for x in cards_touched]
+                    )
+                    check_eq(hat_residue % alice.num_residues_per_player, raw_residue)
+
+                best_clue = table.get_best_clue(target_index, raw_residue)
+                if len(clues):
+                    check_eq(
+                        table.scores[best_clue],
+                        min(alice.evaluate_clue_score(*x) for x in clues),
+                    )
+                else:
+                    check_eq(best_clue, None)
+            assert num_clues > 0
+
+            total = (target_index - 1) * alice.num_residues_per_player
+            check_eq(alice.get_legal_clues_helper(total, table), table.get_clues(target_index, 0))
+
+
+def test_two_and_three_players():
+    for cls in [EncoderV1GameState, EncoderV2GameState]:
+        for num_players in [2, 3]:
+            states = create_game_states(num_players, "No Variant", cls, seed=5)
+            check_eq(states[0].mod_base, 4 * (num_players - 1))
+            for i in range(4):
+                for state in states.values():
+                    state.clue_tokens = 6
+                giver = i % num_players
+                clue_value, clue_type, target_index = give_hat_clue(states, giver)
+                assert target_index != giver
+
+
 def test_all():
     t0 = dt.datetime.now()
     test_evaluate_clue_score()
@@ -431,6 +513,9 @@ def test_all():
     test_superposition4()
     test_superposition5()
     test_superposition6()
+    test_residue_masks()
+    test_hat_clue_table()
+    test_two_and_three_players()
     # bug: https://hanab.live/shared-replay/1027491
     t1 = dt.datetime.now()
     print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
@@ -0,0 +1,185 @@
+from collections import Counter
+from conventions.encoder import EncoderV1GameState, EncoderV2GameState
+from conventions.h_group import HGroupGameState
+from conventions.reactor import ReactorGameState
+from conventions.ref_sieve import RefSieveGameState
+from endgame import (
+    DECK_NOT_EMPTY,
+    EndgameSearch,
+    get_card_id,
+    get_final_round_turns_left,
+    get_progress,
+    solve_endgame,
+)
+from sampler import get_remaining_counts
+from game_state import RANK_CLUE, Card, get_all_cards_with_multiplicity
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue
+import datetime as dt
+import random
+
+
+def get_endgame_states(num_players, stacks, hands, deck_size, seed=0):
+    # everything that is not on the stacks, in a hand or in the deck is discarded
+    pool = Counter(get_all_cards_with_multiplicity("No Variant"))
+    for suit, stack in enumerate(stacks):
+        pool.subtract((suit, rank) for rank in range(1, stack + 1))
+    pool.subtract(hands)
+    rest = list(pool.elements())
+    random.Random(seed).shuffle(rest)
+    discards = Counter(rest[deck_size:])
+
+    states = create_game_states(
+        num_players,
+        "No Variant",
+        HGroupGameState,
+        deck=[Card(0, suit, rank) for suit, rank in hands],
+        stacks=list(stacks),
+    )
+    for state in states.values():
+        state.discards = dict(discards)
+        state.process_visible_cards()
+    return states
+
+
+def test_search_single_suit():
+    # one suit at 3; we hold the 5 and a trash card, our partner holds the 4
+    search = EndgameSearch(2, 1, deck=())
+    node = ((3,), ((4, 0), (3,)), 0, 1, 0, 0, 3)
+    values = search.evaluate_root(node)
+    check_eq(values[("clue",)], 5)
+    check_eq(values[("discard", 1)], 5)
+    # playing the 5 early is a bomb, discarding it loses it
+    check_eq(values[("play", 0)], 4)
+    check_eq(values[("discard", 0)], 4)
+
+    # with no clues and no trash to discard we have to give something up
+    node = ((3,), ((4,), (3,)), 0, 0, 0, 0, 3)
+    check_eq(EndgameSearch(2, 1, deck=()).evaluate_root(node), {("play", 0): 4, ("discard", 0): 4})
+
+
+def test_search_final_round():
+    # the last card is drawn on the first play, then each player gets one turn
+    search = EndgameSearch(2, 1, deck=(4,))
+    node = ((2,), ((2,), (3,)), 0, 0, 0, 0, DECK_NOT_EMPTY)
+    check_eq(search.search(node, -1), 5)
+
+    # if our partner goes first they need a clue token to stall with
+    search = EndgameSearch(2, 1, deck=(4,))
+    node = ((2,), ((2,), (3,)), 0, 1, 0, 1, DECK_NOT_EMPTY)
+    check_eq(search.search(node, -1), 5)
+    search = EndgameSearch(2, 1, deck=(4,))
+    node = ((2,), ((2,), (3,)), 0, 0, 0, 1, DECK_NOT_EMPTY)
+    check_eq(search.search(node, -1), 3)
+
+
+def test_transposition_table():
+    search = EndgameSearch(3, 2, deck=(1, 6, 9))
+    node = ((1, 1), ((2, 7), (1, 3), (8, 0)), 0, 4, 0, 0, DECK_NOT_EMPTY)
+    value = search.search(node, -1)
+    num_nodes = search.num_nodes
+    assert len(search.table)
+    # a second search is answered from the table
+    check_eq(search.search(node, -1), value)
+    check_eq(search.num_nodes, num_nodes + 1)
+
+
+def test_card_ids():
+    states = create_game_states(2, "Reversed (5 Suits)", HGroupGameState)
+    alice = states[0]
+    # the reversed suit is the last one and is played from 5 down to 1
+    check_eq(get_card_id(alice, 4, 5), 4 * 5)
+    check_eq(get_card_id(alice, 4, 1), 4 * 5 + 4)
+    check_eq(get_card_id(alice, 0, 1), 0)
+    alice.stacks = [2, 0, 0, 0, 4]
+    check_eq(get_progress(alice), (2, 0, 0, 0, 2))
+
+
+def test_solve_endgame():
+    hands = [
+        (0, 5), (1, 1), (2, 1), (3, 1), (4, 1),
+        (1, 5), (2, 2), (2, 3), (3, 2), (4, 2),
+    ]
+    states = get_endgame_states(2, [4, 4, 5, 5, 5], hands, deck_size=2)
+    alice = states[0]
+    check_eq(alice.num_cards_in_deck, 2)
+    check_eq(get_remaining_counts(alice).sum(), 7)
+
+    # Alice has been told about her 5, which can only be red
+    give_clue(states, 1, RANK_CLUE, 5, 0)
+    result = solve_endgame(alice, seed=1)
+    check_eq(result.action, ("play", 0))
+    check_eq(result.expected_score, 25)
+    check_eq(result.num_samples, 16)
+
+    # not enough budget to finish a single sample
+    check_eq(solve_endgame(alice, node_budget=3), None)
+
+
+def test_final_round():
+    hands = [
+        (0, 4), (1, 1), (1, 2), (2, 1), (2, 2),
+        (0, 5), (3, 1), (3, 2), (4, 1), (4, 2),
+    ]
+    states = get_endgame_states(2, [3, 5, 5, 5, 5], hands, deck_size=0)
+    give_clue(states, 1, RANK_CLUE, 4, 0)
+    alice = states[0]
+    check_eq(get_final_round_turns_left(alice), 2)
+    # Alice plays her 4 and Bob his 5
+    check_eq(solve_endgame(alice, seed=1).expected_score, 25)
+
+    # the deck ran out a turn ago, so Bob won't get to play his 5
+    alice.final_round_turn = alice.turn - 1
+    check_eq(get_final_round_turns_left(alice), 1)
+    check_eq(solve_endgame(alice, seed=1).expected_score, 24)
+
+
+def test_final_round_turn():
+    hands = [
+        (0, 1), (1, 1), (1, 2), (2, 1), (2, 2),
+        (0, 5), (3, 1), (3, 2), (4, 1), (4, 2),
+    ]
+    for apply in [True, False]:
+        states = get_endgame_states(2, [0, 5, 5, 5, 5], hands, deck_size=1)
+        bob = states[1]
+        bob.turn = bob.current_player_index = 0
+        alice_hand = bob.hands[0]
+        if apply:
+            bob.apply_play(0, alice_hand[0].order, 0, 1)
+            check_eq(bob.final_round_turn, None)
+            bob.apply_draw(0, 10, 0, 2)
+        else:
+            # as the server reports it: the turn only passes after the draw
+            bob.handle_play(0, alice_hand[0].order, 0, 1)
+            bob.handle_draw(0, 10, 0, 2)
+            bob.turn, bob.current_player_index = 1, 1
+        check_eq(bob.num_cards_in_deck, 0)
+        check_eq(bob.final_round_turn, 1)
+        check_eq(get_final_round_turns_left(bob), 2)
+
+
+def test_solver_is_opt_in():
+    # the hat conventions and H-Group read meaning into plays and discards
+    # that an omniscient solver would not respect
+    for cls in [EncoderV1GameState, EncoderV2GameState, HGroupGameState]:
+        check_eq(cls.use_endgame_solver, False)
+    for cls in [ReactorGameState, RefSieveGameState]:
+        check_eq(cls.use_endgame_solver, True)
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_search_single_suit()
+    test_search_final_round()
+    test_transposition_table()
+    test_card_ids()
+    test_solve_endgame()
+    test_final_round()
+    test_final_round_turn()
+    test_solver_is_opt_in()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
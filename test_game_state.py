@@ -1,11 +1,15 @@
 import game_state
-from game_state import COLOR_CLUE, RANK_CLUE, Card, GameState, get_all_cards, get_random_deck, get_all_touched_cards
+from game_state import COLOR_CLUE, RANK_CLUE, Card, GameState, OrderedSet, get_all_cards, get_random_deck, get_all_touched_cards
 from test_functions import all_rank, all_suit, check_eq
 import numpy as np
 import datetime as dt
 from typing import Dict, Optional, List, Tuple, Union
 import requests
 import json
+import copy
+import pickle
+import random
+import time
 
 
 def get_deck_from_tuples(tups: List[Tuple[int, int]]):
@@ -382,6 +386,198 @@ def test_handle_clue():
     check_eq(state.color_clued_card_orders, {5: [5], 9: [5]})
 
 
+FORK_DECK_TUPLES = [
+    (0, 1), (1, 1), (2, 4), (3, 5),
+    (0, 2), (2, 1), (4, 1), (1, 3),
+    (3, 1), (4, 2), (0, 5), (2, 2),
+    (1, 4), (3, 3), (4, 4), (0, 3),
+    (2, 3), (1, 2),
+]
+
+
+def get_fork_summary(state: GameState):
+    return (
+        [[(x.order, x.to_tuple()) for x in hand] for hand in state.hands.values()],
+        state.all_candidates_list,
+        state.all_possibilities_list,
+        state.discards,
+        state.stacks,
+        state.notes,
+        state.rank_clued_card_orders,
+        state.color_clued_card_orders,
+        getattr(state, "play_orders", None),
+        getattr(state, "discard_orders", None),
+    )
+
+
+def test_fork():
+    from conventions.encoder import EncoderV1GameState, EncoderV2GameState
+    from conventions.h_group import HGroupGameState
+    from conventions.reactor import ReactorGameState
+    from conventions.ref_sieve import RefSieveGameState
+
+    for cls in [
+        GameState,
+        HGroupGameState,
+        RefSieveGameState,
+        ReactorGameState,
+        EncoderV1GameState,
+        EncoderV2GameState,
+    ]:
+        deck = get_deck_from_tuples(FORK_DECK_TUPLES)
+        states = create_game_states(4, "No Variant", cls, deck=deck)
+        give_clue(states, 0, RANK_CLUE, 1, 1)
+        before = {i: copy.deepcopy(get_fork_summary(x)) for i, x in states.items()}
+        copies = {i: copy.deepcopy(x) for i, x in states.items()}
+        forks = {i: x.fork() for i, x in states.items()}
+
+        # candidate sets are shared, the lists holding them are not
+        state, fork = states[0], forks[0]
+        assert fork.all_candidates_list[1][0] is state.all_candidates_list[1][0]
+        assert fork.all_candidates_list[1] is not state.all_candidates_list[1]
+        assert fork.hands[1] is not state.hands[1]
+
+        for hypothetical in [copies, forks]:
+            give_clue(hypothetical, 1, COLOR_CLUE, 0, 2)
+            discard_draw(hypothetical, 12, 16, 2, 3)
+            play_draw(hypothetical, 5, 17, 1, 2)
+
+        for i in states:
+            check_eq(get_fork_summary(states[i]), before[i])
+            check_eq(get_fork_summary(forks[i]), get_fork_summary(copies[i]))
+
+
+def test_fork_speed():
+    from conventions.h_group import HGroupGameState
+
+    states = create_game_states(5, "Rainbow (6 Suits)", HGroupGameState)
+    give_clue(states, 0, RANK_CLUE, 1, 1)
+    state = states[0]
+    t0 = time.perf_counter()
+    for _ in range(20):
+        copy.deepcopy(state)
+    t1 = time.perf_counter()
+    for _ in range(20):
+        state.fork()
+    t2 = time.perf_counter()
+    assert (t2 - t1) * 3 < t1 - t0, (t1 - t0, t2 - t1)
+
+
+def apply_random_actions(
+    state: GameState, deck: List[Card], num_actions: int, seed: int, pickles: List[bytes]
+):
+    # plays out random legal actions on one state (whose own cards it can't
+    # see), using the true deck for identities, and pickles the state after each
+    # journal entry
+    rng = random.Random(seed)
+    identities = {card.order: card.to_tuple() for card in deck}
+    next_order = sum(len(hand) for hand in state.hands.values())
+    pickles.append(pickle.dumps(state))
+    for _ in range(num_actions):
+        player_index = state.current_player_index
+        hand = state.hands[player_index]
+        kind = rng.choice(["play", "discard", "clue"] if state.clue_tokens else ["play", "discard"])
+        if kind == "clue":
+            target_index = rng.choice([i for i in range(state.num_players) if i != player_index])
+            card = rng.choice(state.hands[target_index])
+            clue_type = rng.choice([COLOR_CLUE, RANK_CLUE])
+            suit_index, rank = identities[card.order]
+            clue_value = suit_index if clue_type == COLOR_CLUE else rank
+            touched_cards = get_all_touched_cards(clue_type, clue_value, state.variant_name)
+            touched_orders = [
+                x.order for x in state.hands[target_index] if identities[x.order] in touched_cards
+            ]
+            state.apply_clue(player_index, target_index, clue_type, clue_value, touched_orders)
+            pickles.append(pickle.dumps(state))
+            continue
+
+        order = rng.choice(hand).order
+        if kind == "play":
+            state.apply_play(player_index, order, *identities[order])
+        else:
+            state.apply_discard(player_index, order, *identities[order])
+        pickles.append(pickle.dumps(state))
+        if next_order < len(deck):
+            visible = state.our_player_index != player_index
+            draw = identities[next_order] if visible else (-1, -1)
+            state.apply_draw(player_index, next_order, *draw)
+            pickles.append(pickle.dumps(state))
+            next_order += 1
+
+
+def test_apply_undo():
+    from conventions.encoder import EncoderV2GameState
+    from conventions.h_group import HGroupGameState
+    from conventions.reactor import ReactorGameState
+    from conventions.ref_sieve import RefSieveGameState
+
+    for cls in [GameState, HGroupGameState, RefSieveGameState, ReactorGameState, EncoderV2GameState]:
+        for seed in range(3):
+            np.random.seed(seed)
+            deck = get_random_deck("No Variant")
+            states = create_game_states(4, "No Variant", cls, deck=list(deck))
+            state = states[seed]
+            pickles = []
+            try:
+                apply_random_actions(state, deck, 12, seed, pickles)
+            except Exception:
+                # random actions can trip up a convention; a failed action
+                # must leave the state as it was before it
+                check_eq(pickle.dumps(state), pickles[-1])
+
+            check_eq(len(state.journal), len(pickles) - 1)
+            for expected in reversed(pickles[:-1]):
+                state.undo()
+                check_eq(pickle.dumps(state), expected)
+
+
+def test_ordered_set():
+    orders = OrderedSet([7, 3])
+    orders.add(5)
+    orders.add(7)
+    orders.discard(3)
+    orders.discard(4)
+    check_eq(orders, [7, 5])
+    check_eq(orders[0], 7)
+    check_eq(orders[-1], 5)
+    check_eq(orders[1], 5)
+    check_eq(5 in orders, True)
+    check_eq(3 in orders, False)
+    try:
+        OrderedSet()[0]
+        assert False
+    except IndexError:
+        pass
+
+
+def test_changed_cards():
+    from conventions.ref_sieve import RefSieveGameState
+
+    states = create_game_states(3, "No Variant", RefSieveGameState, seed=3)
+    alice = states[0]
+    queues = [alice.play_orders, alice.discard_orders]
+    num_cards = sum(len(hand) for hand in alice.hands.values())
+    check_eq(len(alice.get_changed_cards(queues)), num_cards)
+    alice.mark_cards_checked(queues)
+    check_eq(alice.get_changed_cards(queues), [])
+
+    # a clue only replaces the candidates of the target's cards
+    give_clue(states, 0, RANK_CLUE, alice.hands[1][0].rank, 1)
+    alice.mark_cards_checked(queues)
+    alice.all_candidates_list[2][0] = set(alice.all_candidates_list[2][0])
+    check_eq([card.order for _, card, _ in alice.get_changed_cards(queues)], [alice.hands[2][0].order])
+
+    # so does a card entering a queue behind the deduction's back
+    alice.mark_cards_checked(queues)
+    alice.play_orders[2].add(alice.hands[2][1].order)
+    check_eq([card.order for _, card, _ in alice.get_changed_cards(queues)], [alice.hands[2][1].order])
+
+    # while a stack moving may change any card
+    alice.mark_cards_checked(queues)
+    alice.stacks[0] = 1
+    check_eq(len(alice.get_changed_cards(queues)), num_cards)
+
+
 def test_all():
     t0 = dt.datetime.now()
     test_max_num_cards()
@@ -390,6 +586,11 @@ def test_all():
     test_criticals()
     test_process_visible_cards()
     test_handle_clue()
+    test_fork()
+    test_fork_speed()
+    test_apply_undo()
+    test_ordered_set()
+    test_changed_cards()
     t1 = dt.datetime.now()
     print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
 
@@ -1,4 +1,4 @@
-from conventions.h_group import HGroupGameState, FinesseNode
+from conventions.h_group import HGroupGameState, FinesseNode, ConnectionNode, ConnectionSearch
 from game_state import RANK_CLUE, COLOR_CLUE
 from test_functions import check_eq
 from test_game_state import create_game_states, get_deck_from_tuples
@@ -132,11 +132,55 @@ def test_get_cards_gotten_from_play_clue():
     # state2.print()
     # state2.get_finesse_paths(0, COLOR_CLUE, 4, 12).print()
 
+    # p1's p1 is the only way to p2
+    search = ConnectionSearch(STATES[0], 0)
+    check_eq(search.get_connections(4, 2, 3), [(ConnectionNode("finesse", 1, 7, 4, 1),)])
+    check_eq(search.get_connections(4, 4, 3), [])
+    check_eq(ConnectionSearch(STATES[0], 0, max_nodes=0).get_connections(4, 2, 3), [])
+    check_eq(STATES[0].get_play_clues()[(4, COLOR_CLUE, 3)], {7, 14, 15})
+
+    # Cathy sees the finesse on Bob's p1 too
+    STATES[2].handle_clue(0, 3, COLOR_CLUE, 4, [14, 15])
+    finesse_paths = STATES[2].order_to_finesse_paths[15]
+    check_eq([[(x.player_index, x.order_hierarchy) for x in path] for path in finesse_paths.paths], [[(1, [7])]])
+
+
+def test_clue_candidates():
+    # fmt: off
+    deck = get_deck_from_tuples(
+        [
+            (0, 2), (4, 1), (0, 3), (1, 5), (1, 1),
+            (4, 4), (3, 2), (2, 2), (4, 1), (2, 1),
+            (2, 5), (0, 5), (4, 2), (2, 3), (3, 1),
+        ]
+    )
+    # fmt: on
+    STATES = create_game_states(3, "No Variant", game_state_cls=HGroupGameState, deck=deck)
+    alice: HGroupGameState = STATES[0]
+    # p1: g1 [ 9], p1 [ 8], g2 [ 7], b2 [ 6], p4 [ 5]
+    # p2: b1 [14], g3 [13], p2 [12], r5 [11], g5 [10]
+    candidates = alice.get_clue_candidates()
+    check_eq(candidates[(5, RANK_CLUE, 2)].focus_order, 10)
+    check_eq(candidates[(5, RANK_CLUE, 2)].saved_orders, frozenset({10}))
+    check_eq(candidates[(1, RANK_CLUE, 1)].cards_gotten, frozenset({8, 9}))
+    check_eq(candidates[(1, RANK_CLUE, 1)].bad_touch_orders, frozenset())
+    # only clues that touch something
+    check_eq(len(candidates), 6 + 8)
+
+    # once p1 is trash, 1s to Bob touch it for nothing
+    alice.stacks[4] = 1
+    candidates = alice.get_clue_candidates()
+    check_eq(candidates[(1, RANK_CLUE, 1)].bad_touch_orders, frozenset({8}))
+    legal_clues = alice.get_legal_clues()
+    assert (1, RANK_CLUE, 1) not in legal_clues
+    check_eq(legal_clues[(5, RANK_CLUE, 2)], {(2, 5), (0, 5)})
+
 
 def test_all():
     t0 = dt.datetime.now()
     # test_clue_focus()
     test_get_cards_gotten_from_play_clue()
+    test_clue_candidates()
     t1 = dt.datetime.now()
     print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
 
@@ -0,0 +1,143 @@
+from login import LoginError, LoginManager, get_cookie_expiry, get_session
+from test_functions import check_eq
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
+import datetime as dt
+import os
+import tempfile
+import threading
+
+
+class FakeLoginServer:
+    """Minimal stand-in for the hanab.live /login handler. `responses` is a list
+    of status codes to return before it starts accepting logins."""
+
+    def __init__(self, passwords, responses=None, max_age=3600):
+        self.passwords = passwords
+        self.responses = list(responses or [])
+        self.max_age = max_age
+        self.num_requests = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                fake.num_requests += 1
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode())
+                username = form["username"][0]
+
+                if len(fake.responses):
+                    status = fake.responses.pop(0)
+                elif fake.passwords.get(username) == form["password"][0]:
+                    status = 200
+                else:
+                    status = 401
+
+                body = b"OK" if status == 200 else b"Nope"
+                self.send_response(status)
+                if status == 200:
+                    self.send_header(
+                        "Set-Cookie",
+                        f"hanabi.sid={username}-{fake.num_requests}; Path=/; "
+                        f"Max-Age={fake.max_age}; HttpOnly",
+                    )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/login"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_login_caches_cookie():
+    with FakeLoginServer({"alice": "pw"}) as server, tempfile.TemporaryDirectory() as d:
+        cache_path = os.path.join(d, "cookies.json")
+        cookie = LoginManager(server.url, cache_path).get_cookie("alice", "pw")
+        check_eq(cookie, "hanabi.sid=alice-1")
+
+        # a fresh manager (i.e. a restarted bot) reads the cookie from disk
+        cookie = LoginManager(server.url, cache_path).get_cookie("alice", "pw")
+        check_eq(cookie, "hanabi.sid=alice-1")
+        check_eq(server.num_requests, 1)
+
+        # forcing or invalidating logs in again
+        manager = LoginManager(server.url, cache_path)
+        check_eq(manager.get_cookie("alice", "pw", force=True), "hanabi.sid=alice-2")
+        manager.invalidate("alice")
+        check_eq(manager.get_cookie("alice", "pw"), "hanabi.sid=alice-3")
+        check_eq(server.num_requests, 3)
+
+
+def test_login_cookie_expiry():
+    with FakeLoginServer({"bob": "pw"}, max_age=60) as server, tempfile.TemporaryDirectory() as d:
+        # expires inside the safety margin, so it is never reused
+        manager = LoginManager(server.url, os.path.join(d, "cookies.json"))
+        manager.get_cookie("bob", "pw")
+        manager.get_cookie("bob", "pw")
+        check_eq(server.num_requests, 2)
+
+    check_eq(get_cookie_expiry("a=b; Max-Age=100", 1000.0), 1100.0)
+    check_eq(
+        get_cookie_expiry("a=b; Expires=Thu, 01 Jan 1970 00:10:00 GMT", 0.0), 600.0
+    )
+
+
+def test_login_retries_with_backoff():
+    with FakeLoginServer({"carol": "pw"}, responses=[429, 503]) as server:
+        manager = LoginManager(server.url, base_delay=0.01)
+        check_eq(manager.get_cookie("carol", "pw"), "hanabi.sid=carol-3")
+        check_eq(server.num_requests, 3)
+
+    with FakeLoginServer({"carol": "pw"}, responses=[503] * 3) as server:
+        manager = LoginManager(server.url, max_retries=2, base_delay=0.01)
+        try:
+            manager.get_cookie("carol", "pw")
+            assert False
+        except LoginError:
+            pass
+        check_eq(server.num_requests, 3)
+
+
+def test_login_bad_password():
+    with FakeLoginServer({"dave": "pw"}) as server:
+        manager = LoginManager(server.url, base_delay=0.01)
+        try:
+            manager.get_cookie("dave", "wrong")
+            assert False
+        except LoginError:
+            pass
+        # credentials errors are not retried
+        check_eq(server.num_requests, 1)
+
+
+def test_sessions_share_connection_pool():
+    alice, bob = get_session("alice"), get_session("bob")
+    assert alice is not bob
+    assert alice is get_session("alice")
+    assert alice.get_adapter("https://hanab.live") is bob.get_adapter("https://hanab.live")
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_login_caches_cookie()
+    test_login_cookie_expiry()
+    test_login_retries_with_backoff()
+    test_login_bad_password()
+    test_sessions_share_connection_pool()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
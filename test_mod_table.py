@@ -0,0 +1,58 @@
+from conventions.encoder import get_hand_written_mod_table
+from mod_table import (
+    FIXED_RESIDUES,
+    compile_mod_table,
+    compile_mod_tables,
+    get_all_mod_table_keys,
+    get_mod_table_cost,
+    get_token_groups,
+    load_mod_tables,
+)
+from test_functions import check_eq
+import datetime as dt
+
+
+def test_hand_written_tables():
+    mod_tables = load_mod_tables()
+    num_hand_written = 0
+    for key in get_all_mod_table_keys():
+        hand_written = get_hand_written_mod_table(key)
+        if hand_written is None:
+            continue
+        num_hand_written += 1
+        check_eq(mod_tables[key], hand_written)
+        # the search does at least as well as the hand-written table
+        assert get_mod_table_cost(*key[:3], compile_mod_table(*key)) <= get_mod_table_cost(
+            *key[:3], hand_written
+        ), key
+    assert num_hand_written > 0
+
+
+def test_compiled_tables():
+    mod_tables = load_mod_tables()
+    check_eq(compile_mod_tables(get_hand_written_mod_table), mod_tables)
+    for (style, num_suits, dark_suit_indices, modulus), mod_table in mod_tables.items():
+        check_eq(sorted(mod_table), list(range(modulus)))
+        fixed = FIXED_RESIDUES[style]
+        check_eq([mod_table[i] for i in range(len(fixed))], fixed)
+        tokens = [x for i in range(len(fixed), modulus) for x in mod_table[i]]
+        check_eq(
+            sorted(tokens),
+            sorted(x for group in get_token_groups(style, num_suits, dark_suit_indices) for x in group),
+        )
+
+    # near cards get residues of their own whenever there's room
+    mod_table = mod_tables[("v2", 5, (), 20)]
+    check_eq([mod_table[i] for i in range(1, 6)], [[(i, -1)] for i in range(5)])
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_hand_written_tables()
+    test_compiled_tables()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
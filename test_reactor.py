@@ -1,5 +1,7 @@
-from conventions.reactor import ReactorGameState, get_reactive_playable_human_slot, get_reactive_trash_human_slot
-from test_game_state import create_game_states, give_clue, get_deck_from_tuples, get_game_state_from_replay
+from conventions.reactor import (
+    ReactorGameState, get_finesse_human_slots, get_reactive_playable_human_slot, get_reactive_trash_human_slot
+)
+from test_game_state import create_game_states, give_clue, get_deck_from_tuples, get_game_state_from_replay, play
 from game_state import COLOR_CLUE, RANK_CLUE, Card
 import datetime as dt
 import requests
@@ -19,6 +21,100 @@ def test_rank_1_to_cathy_causing_bomb():
     pslot = ur.get_reactive_playable_human_slot()
     assert pslot == 2
 
+def test_reaction_view_shares_candidates():
+    # hanab.live/shared-replay/1328351
+    card_tuples = [
+        (4,3), (0,1), (1,1), (3,1), (2,4),
+        (4,1), (0,2), (2,2), (3,1), (2,3),
+        (4,3), (3,5), (1,2), (1,1), (1,3)
+    ]
+    GAME_STATES = create_game_states(3, "No Variant", ReactorGameState, deck=get_deck_from_tuples(card_tuples))
+    bob: ReactorGameState = GAME_STATES[1]
+    cathy_candidates = list(bob.all_candidates_list[2])
+    give_clue(GAME_STATES, 0, RANK_CLUE, 1, 2)
+    ur = bob.unresolved_reactions[1]
+    assert ur.view.candidates_list[0] is cathy_candidates[0]
+    assert ur.view.target_hand[0] is bob.hands[2][0]
+
+    # later clues don't reach back into the reaction
+    give_clue(GAME_STATES, 1, COLOR_CLUE, 4, 2)
+    assert ur.view.candidates_list[0] is not bob.all_candidates_list[2][0]
+    assert ur.get_reactive_playable_human_slot() == 2
+
+def test_reactive_clue_to_third_player_in_4p():
+    card_tuples = [
+        (0,2), (1,2), (2,2), (3,4),
+        (2,3), (4,3), (0,4), (1,1),
+        (3,2), (4,2), (0,3), (1,4),
+        (0,1), (3,3), (4,4), (2,5),
+    ]
+    GAME_STATES = create_game_states(4, "No Variant", ReactorGameState, deck=get_deck_from_tuples(card_tuples))
+    alice: ReactorGameState = GAME_STATES[0]
+    assert alice.get_reactive_player_index_ordering() == [1, 2, 3]
+    assert get_finesse_human_slots(4) == [1, 4, 3, 2]
+    # Donald's r1 is slot 4, so 5 to Donald (focus slot 1) asks Bob to play his slot 1 y1
+    reactive_clues = alice.get_reactive_clues()
+    assert reactive_clues[(5, RANK_CLUE, 3)] == '2P0D_PLAY'
+    assert {target_index for _, _, target_index in reactive_clues}.issubset({2, 3})
+
+    give_clue(GAME_STATES, 0, RANK_CLUE, 5, 3)
+    ur = GAME_STATES[1].unresolved_reactions[1]
+    assert ur.target_index == 3
+    assert ur.get_reactive_playable_human_slot() == 4
+
+    # Bob's reaction marks Donald's r1, not a card in Cathy's hand
+    play(GAME_STATES, 7)
+    for state in GAME_STATES.values():
+        assert state.unresolved_reactions[1] is None
+        assert list(state.play_orders[3]) == [12]
+        assert not len(state.play_orders[2])
+
+def test_reactive_clue_to_last_player_in_5p():
+    GAME_STATES = create_game_states(5, "No Variant", ReactorGameState, seed=8)
+    alice: ReactorGameState = GAME_STATES[0]
+    assert alice.get_reactive_player_index_ordering() == [1, 2, 3, 4]
+    assert alice.get_reactive_clues()[(1, RANK_CLUE, 4)] == '2P0D_PLAY'
+
+    # 1 to Emily touches her slots 1, 2 and 4, so the focus is slot 2 and her
+    # slot 1 b1 is what Bob's slot 1 r1 answers for
+    give_clue(GAME_STATES, 0, RANK_CLUE, 1, 4)
+    ur = GAME_STATES[1].unresolved_reactions[1]
+    assert ur.target_index == 4
+    assert ur.focused_slot == 2
+    assert ur.get_reactive_playable_human_slot() == 1
+
+    play(GAME_STATES, 7)
+    for state in GAME_STATES.values():
+        assert state.unresolved_reactions[1] is None
+        assert list(state.play_orders[4]) == [19]
+        assert not any(len(state.play_orders[i]) for i in [2, 3])
+
+def test_reactive_clues_in_4p_and_5p():
+    # pinned so that the reacter/target enumeration for more than three players
+    # doesn't drift
+    expected = {
+        (4, 1): {
+            (1, 1, 2): '2P0D_PLAY', (2, 0, 3): '1P1D_DISCARD', (3, 0, 2): '1P1D_DISCARD',
+            (3, 0, 3): '1P1D_DISCARD', (4, 0, 2): '1P1D_DISCARD', (4, 0, 3): '1P1D_DISCARD',
+        },
+        (4, 7): {
+            (1, 0, 2): '1P1D_DISCARD', (2, 1, 3): '2P0D_FINESSE', (3, 0, 2): '1P1D_DISCARD',
+            (3, 1, 2): '2P0D_PLAY', (4, 0, 2): '1P1D_DISCARD',
+        },
+        (5, 4): {
+            (1, 0, 2): '1P1D_DISCARD', (1, 1, 2): '2P0D_PLAY', (1, 1, 4): '2P0D_PLAY',
+            (2, 0, 2): '1P1D_DISCARD', (2, 0, 4): '1P1D_DISCARD', (2, 1, 4): '2P0D_PLAY',
+            (3, 0, 4): '1P1D_DISCARD', (4, 0, 2): '1P1D_DISCARD', (4, 0, 4): '1P1D_DISCARD',
+        },
+        (5, 8): {
+            (0, 0, 3): '1P1D_DISCARD', (1, 0, 3): '1P1D_DISCARD', (1, 1, 4): '2P0D_PLAY',
+            (3, 0, 4): '1P1D_DISCARD', (3, 1, 3): '2P0D_PLAY', (4, 0, 4): '1P1D_DISCARD',
+        },
+    }
+    for (num_players, seed), reactive_clues in expected.items():
+        GAME_STATES = create_game_states(num_players, "No Variant", ReactorGameState, seed=seed)
+        assert GAME_STATES[0].get_reactive_clues() == reactive_clues
+
 def test_bad_stable_1_clue():
     # hanab.live/shared-replay/1328406
     card_tuples = [
@@ -42,6 +138,10 @@ def test_bad_rank_trash_push_clue():
 def test_all():
     t0 = dt.datetime.now()
     test_rank_1_to_cathy_causing_bomb()
+    test_reaction_view_shares_candidates()
+    test_reactive_clue_to_third_player_in_4p()
+    test_reactive_clue_to_last_player_in_5p()
+    test_reactive_clues_in_4p_and_5p()
     test_bad_stable_1_clue()
     test_bad_rank_trash_push_clue()
     t1 = dt.datetime.now()
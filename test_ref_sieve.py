@@ -0,0 +1,94 @@
+from clue_table import ClueTable
+from conventions.ref_sieve import RefSieveGameState, get_ref_discard_index, get_ref_play_index
+from decision_context import get_decision_context
+from game_state import COLOR_CLUE, RANK_CLUE
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue
+import datetime as dt
+
+
+def test_ref_play_index():
+    # slots are oldest to newest; the newly touched card points to its right
+    check_eq(get_ref_play_index([False, True, False, False, False], [False] * 5), 2)
+    # clued cards are skipped over
+    check_eq(get_ref_play_index([False, True, False, False, False], [False, False, True, False, False]), 3)
+    # the newest card wraps around to the oldest unclued one
+    check_eq(get_ref_play_index([False, False, False, False, True], [True, False, False, False, False]), 1)
+    # with several newly touched cards, the newest target wins
+    check_eq(get_ref_play_index([True, False, True, False, False], [False] * 5), 3)
+
+
+def test_ref_discard_index():
+    check_eq(get_ref_discard_index([False, False, True, False, False], [False] * 5), 1)
+    check_eq(get_ref_discard_index([False, True, True, False, False], [False] * 5), 0)
+    check_eq(get_ref_discard_index([True, False, True, False, False], [False, True, False, False, False]), None)
+    # a touched card that was already clued doesn't count as newly touched
+    check_eq(get_ref_discard_index([False, False, True, False, True], [False, False, False, False, True]), 1)
+
+
+def test_ref_sieve_clues_on_6_suits():
+    for variant_name in ["Rainbow (6 Suits)", "Black (6 Suits)"]:
+        for seed in range(2):
+            states = create_game_states(4, variant_name, RefSieveGameState, seed=seed)
+            give_clue(states, 0, RANK_CLUE, 1, 1)
+            give_clue(states, 1, COLOR_CLUE, 0, 2)
+            for state in states.values():
+                ctx = get_decision_context(state)
+                clues = state.get_ref_sieve_clues(ctx, ClueTable(state, ctx=ctx))
+                for (clue_type, clue_value, target_index), meaning in clues.items():
+                    if meaning == "REF_DISCARD":
+                        assert state.get_index_of_ref_discard_target(target_index, clue_type, clue_value) is not None
+                    elif meaning == "LOCK":
+                        assert state.get_index_of_ref_discard_target(target_index, clue_type, clue_value) is None
+
+
+def test_ref_sieve_clues_match_baseline():
+    # clue meanings the pre-rewrite, per-clue enumeration gave on these deals
+    expected = {
+        ("Rainbow (6 Suits)", 0): {
+            0: {
+                (0, 2, 2): "REF_PLAY", (0, 4, 2): "REF_PLAY", (1, 1, 2): "DIRECT_PLAY",
+                (1, 1, 3): "DIRECT_PLAY", (1, 2, 1): "LOCK", (1, 2, 3): "REF_DISCARD",
+                (1, 4, 1): "REF_DISCARD",
+            },
+            1: {
+                (0, 2, 2): "REF_PLAY", (0, 4, 2): "REF_PLAY", (1, 1, 2): "DIRECT_PLAY",
+                (1, 1, 3): "DIRECT_PLAY", (1, 2, 3): "REF_DISCARD", (1, 3, 0): "LOCK",
+                (1, 4, 0): "REF_DISCARD", (1, 5, 0): "REF_DISCARD",
+            },
+        },
+        ("Black (6 Suits)", 1): {
+            0: {
+                (1, 1, 2): "LOCK", (1, 1, 3): "REF_DISCARD", (1, 2, 3): "REF_DISCARD",
+                (1, 3, 1): "LOCK", (1, 3, 2): "REF_DISCARD", (1, 3, 3): "REF_DISCARD",
+                (1, 4, 1): "REF_DISCARD", (1, 4, 2): "REF_DISCARD", (1, 5, 2): "REF_DISCARD",
+            },
+            1: {
+                (0, 0, 3): "REF_PLAY", (0, 3, 0): "REF_PLAY", (0, 5, 0): "REF_PLAY",
+                (1, 1, 0): "DIRECT_PLAY", (1, 1, 2): "DIRECT_PLAY", (1, 1, 3): "DIRECT_PLAY",
+                (1, 2, 3): "REF_DISCARD", (1, 3, 0): "REF_DISCARD", (1, 3, 2): "REF_DISCARD",
+                (1, 3, 3): "REF_DISCARD", (1, 4, 0): "REF_DISCARD", (1, 4, 2): "REF_DISCARD",
+                (1, 5, 2): "REF_DISCARD",
+            },
+        },
+    }
+    for (variant_name, seed), expected_clues in expected.items():
+        states = create_game_states(4, variant_name, RefSieveGameState, seed=seed)
+        give_clue(states, 0, RANK_CLUE, 1, 1)
+        give_clue(states, 1, COLOR_CLUE, 0, 2)
+        for player_index, clues in expected_clues.items():
+            check_eq(states[player_index].get_ref_sieve_clues(), clues)
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_ref_play_index()
+    test_ref_discard_index()
+    test_ref_sieve_clues_on_6_suits()
+    test_ref_sieve_clues_match_baseline()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
@@ -0,0 +1,133 @@
+from conventions.h_group import HGroupGameState
+from conventions.ref_sieve import RefSieveGameState
+from deadline import Deadline
+from game_state import RANK_CLUE
+from rollout import Rollout, RolloutEvaluator, get_legal_actions, get_rollout_action
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue, get_deck_from_tuples
+import datetime as dt
+import os
+
+
+CARD_TUPLES = [
+    (0, 1), (1, 5), (2, 3), (3, 4), (4, 1),
+    (0, 1), (1, 2), (2, 2), (3, 5), (4, 4),
+    (1, 1), (2, 1), (3, 1), (4, 3), (0, 5),
+]
+
+
+def get_states(cls=HGroupGameState):
+    return create_game_states(3, "No Variant", cls, deck=get_deck_from_tuples(CARD_TUPLES))
+
+
+def test_legal_actions():
+    alice = get_states()[0]
+    actions = get_legal_actions(alice)
+    # 8 clue tokens, so no discards
+    check_eq(len([x for x in actions if x[0] == "play"]), 5)
+    check_eq(len([x for x in actions if x[0] == "discard"]), 0)
+    # Bob has 1, 2, 4, 5 and all five colours, Cathy 1, 3, 5 and five colours
+    check_eq(len([x for x in actions if x[0] == "clue" and x[1] == 1]), 9)
+    check_eq(len([x for x in actions if x[0] == "clue" and x[1] == 2]), 8)
+
+
+def test_rollout_steps():
+    alice = get_states()[0]
+    our_hand = [(0, 1), (1, 5), (2, 3), (3, 4), (4, 1)]
+    rollout = Rollout(alice, our_hand, deck=[(0, 2), (0, 3), (0, 4)])
+    # teammates see our cards, we still don't
+    check_eq(rollout.states[1].hands[0][0].to_tuple(), (0, 1))
+    check_eq(rollout.states[0].hands[0][0].to_tuple(), (-1, -1))
+    check_eq(rollout.states[1].hands[1][0].to_tuple(), (-1, -1))
+
+    rollout.step(0, ("play", 0))
+    rollout.step(1, ("play", 6))
+    for state in rollout.states.values():
+        check_eq(state.stacks[0], 1)
+        check_eq(state.bombs, 1)
+        check_eq(state.discards, {(1, 2): 1})
+        check_eq(state.current_player_index, 2)
+    # both players drew from the top of the deck
+    check_eq(rollout.states[1].hands[0][-1].to_tuple(), (0, 4))
+    check_eq(rollout.states[0].hands[1][-1].to_tuple(), (0, 3))
+    check_eq(rollout.states[1].hands[1][-1].to_tuple(), (-1, -1))
+
+
+def test_rollouts_find_the_play():
+    states = get_states()
+    give_clue(states, 1, RANK_CLUE, 1, 0)
+    alice = states[0]
+    # Alice's clued 1s (her oldest and newest cards) are playable
+    actions = [("play", 0), ("play", 1), ("discard", 1), ("clue", 1, RANK_CLUE, 5)]
+    evaluator = RolloutEvaluator(num_rollouts=8, max_workers=0)
+    result = evaluator.evaluate(alice, actions=actions, seed=0)
+    check_eq(result.num_rollouts + result.num_failed, 8)
+    check_eq(result.action, ("play", 0))
+    assert result.action_values[("play", 0)] > result.action_values[("play", 1)]
+
+
+def test_rollouts_on_a_process_pool():
+    states = get_states(RefSieveGameState)
+    give_clue(states, 1, RANK_CLUE, 1, 0)
+    alice = states[0]
+    actions = [("play", 0), ("play", 2), ("discard", 2)]
+    evaluator = RolloutEvaluator(num_rollouts=8, max_workers=2)
+    try:
+        result = evaluator.evaluate(alice, actions=actions, seed=0)
+    finally:
+        evaluator.close()
+    check_eq(result.num_rollouts + result.num_failed, 8)
+    check_eq(set(result.action_values), set(actions))
+    check_eq(result.action, ("play", 0))
+
+
+def exit_policy(state):
+    # takes the worker process down with it
+    os._exit(1)
+
+
+def test_rollouts_survive_failed_shards():
+    states = get_states(RefSieveGameState)
+    give_clue(states, 1, RANK_CLUE, 1, 0)
+    alice = states[0]
+    actions = [("play", 0), ("discard", 2)]
+
+    # the policy can't be sent to the workers, so every shard fails
+    evaluator = RolloutEvaluator(num_rollouts=4, max_workers=2, policy=lambda state: get_rollout_action(state))
+    try:
+        check_eq(evaluator.evaluate(alice, actions=actions, seed=0), None)
+    finally:
+        evaluator.close()
+
+    # a dead worker breaks the pool, which is replaced on the next evaluation
+    evaluator = RolloutEvaluator(num_rollouts=4, max_workers=2, policy=exit_policy)
+    try:
+        check_eq(evaluator.evaluate(alice, actions=actions, seed=0), None)
+        check_eq(evaluator.executor, None)
+        evaluator.policy = get_rollout_action
+        result = evaluator.evaluate(alice, actions=actions, seed=0)
+        check_eq(result.num_rollouts + result.num_failed, 4)
+    finally:
+        evaluator.close()
+
+
+def test_rollouts_respect_the_deadline():
+    alice = get_states()[0]
+    evaluator = RolloutEvaluator(num_rollouts=16, max_workers=0)
+    check_eq(evaluator.evaluate(alice, deadline=Deadline(0.0)), None)
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_legal_actions()
+    test_rollout_steps()
+    test_rollouts_find_the_play()
+    test_rollouts_on_a_process_pool()
+    test_rollouts_survive_failed_shards()
+    test_rollouts_respect_the_deadline()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
@@ -0,0 +1,97 @@
+from conventions.h_group import HGroupGameState
+from game_state import RANK_CLUE
+from sampler import HandSampler, get_identities, get_remaining_counts
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue, get_deck_from_tuples
+import datetime as dt
+import numpy as np
+import time
+
+
+CARD_TUPLES = [
+    (0, 1), (1, 5), (2, 3), (3, 4), (4, 1),
+    (0, 1), (1, 2), (2, 2), (3, 5), (4, 4),
+    (1, 1), (2, 1), (3, 1), (4, 3), (0, 5),
+]
+
+
+def test_remaining_counts():
+    states = create_game_states(3, "No Variant", HGroupGameState, deck=get_deck_from_tuples(CARD_TUPLES))
+    alice = states[0]
+    counts = get_remaining_counts(alice)
+    identities = get_identities(alice.variant_name)
+    # 50 cards minus the 10 in Bob's and Cathy's hands
+    check_eq(counts.sum(), 40)
+    check_eq(counts[identities.index((0, 1))], 2)
+    check_eq(counts[identities.index((3, 5))], 0)
+    check_eq(counts[identities.index((1, 1))], 2)
+
+    alice.stacks[0] = 1
+    alice.discards[(0, 1)] = 1
+    counts = get_remaining_counts(alice)
+    check_eq(counts[identities.index((0, 1))], 0)
+
+
+def test_samples_respect_constraints():
+    states = create_game_states(3, "No Variant", HGroupGameState, deck=get_deck_from_tuples(CARD_TUPLES))
+    give_clue(states, 1, RANK_CLUE, 5, 0)
+    alice = states[0]
+    sampler = HandSampler(alice)
+    hands = sampler.sample(2000, np.random.default_rng(0))
+    check_eq(hands.shape, (2000, 5))
+
+    identities = get_identities(alice.variant_name)
+    for slot, candidates in enumerate(alice.our_candidates):
+        allowed = {identities.index(x) for x in candidates}
+        assert set(np.unique(hands[:, slot])) <= allowed
+
+    # no sample uses more copies of a card than are left
+    counts = get_remaining_counts(alice)
+    for hand in hands:
+        used = np.bincount(hand, minlength=len(identities))
+        assert (used <= counts).all()
+    assert (sampler.get_deck_counts(hands).sum(axis=1) == counts.sum() - 5).all()
+
+
+def test_samples_weighted_by_multiplicity():
+    states = create_game_states(3, "No Variant", HGroupGameState, deck=get_deck_from_tuples(CARD_TUPLES))
+    alice = states[0]
+    identities = get_identities(alice.variant_name)
+    # Alice's oldest card is known to be a red 1 or a green 5
+    alice.all_candidates_list[0][0] = {(0, 1), (2, 5)}
+    hands = HandSampler(alice).sample(20000, np.random.default_rng(1))
+    # two red 1s are unseen but only one green 5
+    frac_red_1 = (hands[:, 0] == identities.index((0, 1))).mean()
+    assert abs(frac_red_1 - 2 / 3) < 0.02, frac_red_1
+
+    # two slots sharing a single remaining copy can never both hold it
+    alice.all_candidates_list[0][1] = {(1, 5), (2, 5)}
+    alice.all_candidates_list[0][0] = {(1, 5), (2, 5)}
+    hands = HandSampler(alice).sample(5000, np.random.default_rng(2))
+    assert (hands[:, 0] != hands[:, 1]).all()
+    # and both orders are equally likely
+    frac = (hands[:, 0] == identities.index((1, 5))).mean()
+    assert abs(frac - 0.5) < 0.03, frac
+
+
+def test_sampler_speed():
+    states = create_game_states(5, "Rainbow (6 Suits)", HGroupGameState)
+    sampler = HandSampler(states[0])
+    t0 = time.perf_counter()
+    hands = sampler.sample(10000, np.random.default_rng(3))
+    check_eq(hands.shape, (10000, 4))
+    assert time.perf_counter() - t0 < 1.0
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_remaining_counts()
+    test_samples_respect_constraints()
+    test_samples_weighted_by_multiplicity()
+    test_sampler_speed()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
@@ -0,0 +1,120 @@
+from conventions.encoder import EncoderV1GameState
+from conventions.h_group import HGroupGameState
+from conventions.reactor import ReactorGameState
+from conventions.ref_sieve import RefSieveGameState
+from game_state import RANK_CLUE
+from snapshot import SnapshotStore, get_game_id, get_missed_actions, is_same_game
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue, get_deck_from_tuples
+import datetime as dt
+import tempfile
+
+
+def test_snapshot_round_trip():
+    # hanab.live/shared-replay/1328351
+    card_tuples = [
+        (4,3), (0,1), (1,1), (3,1), (2,4),
+        (4,1), (0,2), (2,2), (3,1), (2,3),
+        (4,3), (3,5), (1,2), (1,1), (1,3)
+    ]
+    states = create_game_states(3, "No Variant", ReactorGameState, deck=get_deck_from_tuples(card_tuples))
+    give_clue(states, 0, RANK_CLUE, 1, 2)
+    bob: ReactorGameState = states[1]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(directory)
+        store.save(1234, bob, 17)
+        check_eq(store.get_table_ids(), [1234])
+
+        restored = store.load(1234, ReactorGameState, "No Variant", bob.player_names, 1)
+        assert restored is not None
+        restored_bob, num_actions_handled = restored
+        check_eq(num_actions_handled, 17)
+        check_eq(restored_bob.hands, bob.hands)
+        check_eq(restored_bob.all_candidates_list, bob.all_candidates_list)
+        check_eq(restored_bob.play_orders, bob.play_orders)
+        check_eq(restored_bob.rank_clued_card_orders, bob.rank_clued_card_orders)
+        check_eq(
+            restored_bob.unresolved_reactions[1].get_reactive_playable_human_slot(),
+            bob.unresolved_reactions[1].get_reactive_playable_human_slot(),
+        )
+
+        store.delete(1234)
+        check_eq(store.get_table_ids(), [])
+        check_eq(store.load(1234, ReactorGameState, "No Variant", bob.player_names, 1), None)
+
+
+def test_snapshot_rejects_other_games():
+    states = create_game_states(3, "No Variant", RefSieveGameState)
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(directory)
+        store.save(1, states[0], 15)
+        player_names = states[0].player_names
+        check_eq(store.load(1, ReactorGameState, "No Variant", player_names, 0), None)
+        check_eq(store.load(1, RefSieveGameState, "Rainbow (5 Suits)", player_names, 0), None)
+        check_eq(store.load(1, RefSieveGameState, "No Variant", player_names, 2), None)
+        assert store.load(1, RefSieveGameState, "No Variant", player_names, 0) is not None
+
+
+def test_snapshot_rejects_new_game_at_same_table():
+    # the same players start another game of the same variant at the same table
+    state = create_game_states(3, "No Variant", RefSieveGameState)[0]
+    old_game_id = get_game_id({"seed": "p3v0s1", "datetimeStarted": "2023-07-03T20:36:19Z"})
+    new_game_id = get_game_id({"seed": "p3v0s2", "datetimeStarted": "2023-07-03T21:02:44Z"})
+    state.game_id = old_game_id
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(directory)
+        store.save(1, state, 15)
+        player_names = state.player_names
+        check_eq(store.load(1, RefSieveGameState, "No Variant", player_names, 0, new_game_id), None)
+        assert store.load(1, RefSieveGameState, "No Variant", player_names, 0, old_game_id) is not None
+
+
+def test_snapshot_all_conventions():
+    for game_state_cls, num_players in [
+        (EncoderV1GameState, 4),
+        (HGroupGameState, 3),
+        (RefSieveGameState, 3),
+        (ReactorGameState, 3),
+    ]:
+        state = create_game_states(num_players, "No Variant", game_state_cls)[0]
+        with tempfile.TemporaryDirectory() as directory:
+            store = SnapshotStore(directory)
+            store.save(5, state, 0)
+            restored_state, _ = store.load(5, game_state_cls, "No Variant", state.player_names, 0)
+            check_eq(vars(restored_state).keys(), vars(state).keys())
+            check_eq(restored_state.all_candidates_list, state.all_candidates_list)
+
+
+def test_get_missed_actions():
+    actions = [{"type": "draw"}, {"type": "draw"}, {"type": "turn"}, {"type": "clue"}]
+    check_eq(get_missed_actions(actions, 0), actions)
+    check_eq(get_missed_actions(actions, 3), [{"type": "clue"}])
+    check_eq(get_missed_actions(actions, 4), [])
+
+
+def test_is_same_game():
+    state = create_game_states(3, "No Variant", RefSieveGameState)[1]
+    names = state.player_names
+    assert is_same_game(state, RefSieveGameState, "No Variant", names, 1)
+    assert not is_same_game(state, ReactorGameState, "No Variant", names, 1)
+    assert not is_same_game(state, RefSieveGameState, "Rainbow (5 Suits)", names, 1)
+    assert not is_same_game(state, RefSieveGameState, "No Variant", names[::-1], 1)
+    assert not is_same_game(state, RefSieveGameState, "No Variant", names, 0)
+    assert not is_same_game(state, RefSieveGameState, "No Variant", names, 1, "p3v0s1@2023-07-03")
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_snapshot_round_trip()
+    test_snapshot_rejects_other_games()
+    test_snapshot_rejects_new_game_at_same_table()
+    test_snapshot_all_conventions()
+    test_get_missed_actions()
+    test_is_same_game()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
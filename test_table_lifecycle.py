@@ -0,0 +1,94 @@
+from conventions.ref_sieve import RefSieveGameState
+from game_state import RANK_CLUE
+from table_lifecycle import (
+    EVICT_INACTIVE,
+    EVICT_OVER_CAP,
+    TableLifecycle,
+    format_memory_report,
+    get_deep_size,
+    get_memory_report,
+)
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue
+import datetime as dt
+
+
+def test_inactivity_timeout():
+    lifecycle = TableLifecycle(inactivity_timeout=100, max_retained_tables=None)
+    lifecycle.touch(1, now=0)
+    lifecycle.touch(2, now=50)
+    check_eq(lifecycle.get_tables_to_evict(now=100), {})
+    check_eq(lifecycle.get_tables_to_evict(now=120), {1: EVICT_INACTIVE})
+
+    lifecycle.touch(1, now=120)
+    check_eq(lifecycle.get_tables_to_evict(now=160), {2: EVICT_INACTIVE})
+
+    lifecycle.forget(2)
+    check_eq(lifecycle.get_tables_to_evict(now=160), {})
+
+
+def test_retention_cap():
+    lifecycle = TableLifecycle(inactivity_timeout=None, max_retained_tables=2)
+    for table_id, now in [(10, 3), (11, 1), (12, 2)]:
+        lifecycle.touch(table_id, now=now)
+    # least recently active goes first
+    check_eq(lifecycle.get_tables_to_evict(now=4), {11: EVICT_OVER_CAP})
+
+    # timed out tables count toward the cap being freed
+    lifecycle = TableLifecycle(inactivity_timeout=10, max_retained_tables=2)
+    for table_id, now in [(10, 30), (11, 0), (12, 25), (13, 28)]:
+        lifecycle.touch(table_id, now=now)
+    check_eq(lifecycle.get_tables_to_evict(now=31), {11: EVICT_INACTIVE, 12: EVICT_OVER_CAP})
+
+
+def test_dormant_tables():
+    lifecycle = TableLifecycle(inactivity_timeout=100, max_retained_tables=2)
+    lifecycle.touch(1, now=0)
+    lifecycle.touch(2, now=0)
+    # evicted for inactivity, so the game may still be running
+    lifecycle.forget(1, dormant=True)
+    check_eq(list(lifecycle.dormant), [1])
+    assert lifecycle.wake(1)
+    # only once: the reload is already under way
+    assert not lifecycle.wake(1)
+    # finished games are never reloaded
+    assert not lifecycle.wake(2)
+    lifecycle.forget(2)
+    assert not lifecycle.wake(2)
+
+    # dormant tables are capped like the tables themselves, oldest out first
+    for table_id in [3, 4, 5]:
+        lifecycle.forget(table_id, dormant=True)
+    check_eq(list(lifecycle.dormant), [4, 5])
+    lifecycle.forget(4)
+    check_eq(list(lifecycle.dormant), [5])
+
+
+def test_memory_report():
+    states = create_game_states(3, "No Variant", RefSieveGameState)
+    fresh = create_game_states(3, "No Variant", RefSieveGameState)[0]
+    give_clue(states, 0, RANK_CLUE, 1, 1)
+    give_clue(states, 1, RANK_CLUE, 5, 2)
+
+    report = get_memory_report({1: fresh, 2: states[0]})
+    assert report[1] > 0
+    check_eq(report[1], get_deep_size(fresh))
+    check_eq(len(format_memory_report(report)), 3)
+
+    # shared objects are only counted once
+    xs = [1, 2, 3]
+    check_eq(get_deep_size([xs, xs]), get_deep_size([xs]) + 8)
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_inactivity_timeout()
+    test_retention_cap()
+    test_dormant_tables()
+    test_memory_report()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
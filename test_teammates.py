@@ -0,0 +1,104 @@
+from conventions.h_group import HGroupGameState
+from conventions.ref_sieve import RefSieveGameState
+from game_state import COLOR_CLUE, RANK_CLUE
+from teammates import TeammatePredictor, get_teammate_view
+from test_functions import check_eq
+from test_game_state import create_game_states, give_clue, get_deck_from_tuples
+import datetime as dt
+
+
+CARD_TUPLES = [
+    (0, 1), (1, 5), (2, 3), (3, 4), (4, 1),
+    (0, 1), (1, 2), (2, 2), (3, 5), (4, 4),
+    (1, 1), (2, 1), (3, 1), (4, 3), (0, 5),
+]
+
+
+def get_states(cls=HGroupGameState):
+    return create_game_states(3, "No Variant", cls, deck=get_deck_from_tuples(CARD_TUPLES))
+
+
+def test_teammate_view():
+    alice = get_states()[0]
+    view = get_teammate_view(alice, 1)
+    check_eq(view.our_player_index, 1)
+    check_eq([card.to_tuple() for card in view.hands[1]], [(-1, -1)] * 5)
+    check_eq(view.hands[2][0].to_tuple(), (1, 1))
+    # Bob sees our cards, but we don't
+    check_eq(view.hands[0][0].to_tuple(), (-1, -1))
+    check_eq(view.all_candidates_list[1], alice.all_candidates_list[1])
+    # Alice's own state is untouched
+    check_eq(alice.hands[1][0].to_tuple(), (0, 1))
+    check_eq(alice.our_player_index, 0)
+
+
+def test_predict_from_teammates_information():
+    predictor = TeammatePredictor("No Variant")
+    # 8 clue tokens and nothing known, so Bob has to clue
+    check_eq(predictor.predict(get_states()[0], 1)[0], "clue")
+
+    # Bob can't see his own playable 1, so he discards his chop...
+    states = get_states()
+    give_clue(states, 0, COLOR_CLUE, 1, 2)
+    check_eq(predictor.predict(states[0], 1), ("discard", 5))
+
+    # ...until it is clued
+    states = get_states()
+    give_clue(states, 0, RANK_CLUE, 1, 1)
+    check_eq(predictor.predict(states[0], 1), ("play", 5))
+
+
+def test_predictions_are_memoized():
+    predictor = TeammatePredictor("No Variant")
+    states = get_states()
+    give_clue(states, 0, RANK_CLUE, 1, 1)
+    alice = states[0]
+    action = predictor.predict(alice, 1)
+    check_eq(predictor.predict(alice.fork(), 1), action)
+    check_eq((predictor.cache.num_hits, predictor.cache.num_misses), (1, 1))
+
+    # other teammates and later positions are worked out afresh
+    predictor.predict(alice, 2)
+    give_clue(states, 1, RANK_CLUE, 5, 2)
+    predictor.predict(alice, 1)
+    check_eq((predictor.cache.num_hits, predictor.cache.num_misses), (1, 3))
+
+
+def test_dupe_in_other_hand_is_a_safe_discard():
+    card_tuples = [
+        (0, 3), (2, 4), (3, 3), (4, 4), (0, 4),
+        (1, 2), (2, 3), (3, 4), (4, 3), (0, 5),
+        (1, 2), (2, 2), (3, 2), (4, 2), (1, 4),
+    ]
+    states = create_game_states(3, "No Variant", HGroupGameState, deck=get_deck_from_tuples(card_tuples))
+    give_clue(states, 0, COLOR_CLUE, 1, 2)
+    give_clue(states, 2, RANK_CLUE, 2, 1)
+    give_clue(states, 0, COLOR_CLUE, 1, 1)
+    alice = states[0]
+    # Bob knows his y2 and sees Cathy's clued y2, so he discards it rather
+    # than his chop
+    check_eq(alice.get_chop_order(1), 6)
+    check_eq(TeammatePredictor("No Variant").predict(alice, 1), ("discard", 5))
+
+
+def test_queued_actions():
+    states = get_states(RefSieveGameState)
+    give_clue(states, 0, RANK_CLUE, 1, 1)
+    alice = states[0]
+    check_eq(alice.play_orders[1], [5])
+    check_eq(TeammatePredictor("No Variant").predict(alice, 1), ("play", 5))
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_teammate_view()
+    test_predict_from_teammates_information()
+    test_predictions_are_memoized()
+    test_dupe_in_other_hand_is_a_safe_discard()
+    test_queued_actions()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
@@ -0,0 +1,197 @@
+from conventions.encoder import EncoderV1GameState, EncoderV2GameState
+from conventions.h_group import HGroupGameState
+from conventions.reactor import ReactorGameState
+from conventions.ref_sieve import RefSieveGameState
+from game_state import COLOR_CLUE, RANK_CLUE, GameState, get_random_deck
+from test_encoder import construct_test_state, give_hat_clue
+from test_functions import check_eq
+from test_game_state import (
+    apply_random_actions,
+    create_game_states,
+    discard,
+    discard_draw,
+    give_clue,
+    get_deck_from_tuples,
+    play,
+    play_draw,
+)
+from zobrist import PositionCache, ZobristHasher, get_zobrist_keys
+import datetime as dt
+import numpy as np
+
+
+CARD_TUPLES = [
+    (0, 1), (1, 5), (2, 3), (3, 4), (4, 1),
+    (0, 1), (1, 2), (2, 2), (3, 5), (4, 4),
+    (1, 1), (2, 1), (3, 1), (4, 3), (0, 5),
+]
+
+
+def get_states(cls=GameState):
+    return create_game_states(3, "No Variant", cls, deck=get_deck_from_tuples(CARD_TUPLES))
+
+
+def test_hash_is_deterministic():
+    alice = get_states()[0]
+    check_eq(ZobristHasher("No Variant").hash(alice), ZobristHasher("No Variant").hash(alice))
+    # a different point of view of the same deal
+    bob = get_states()[1]
+    assert ZobristHasher("No Variant").hash(alice) != ZobristHasher("No Variant").hash(bob)
+
+
+def test_hash_covers_public_state():
+    hasher = ZobristHasher("No Variant")
+    alice = get_states()[0]
+    # all changed before anything is hashed, since stacks and discards are
+    # otherwise only followed through the handlers
+    states = [alice]
+    for attr, value in [("clue_tokens", 7), ("bombs", 1), ("current_player_index", 1)]:
+        state = alice.fork()
+        setattr(state, attr, value)
+        states.append(state)
+    state = alice.fork()
+    state.stacks[0] = 1
+    states.append(state)
+    state = alice.fork()
+    state.discards[(0, 1)] = 1
+    states.append(state)
+    check_eq(len({hasher.hash(state) for state in states}), 6)
+
+
+def test_transpositions_hash_equal():
+    hasher = ZobristHasher("No Variant")
+    # the same two clues in either order
+    states = get_states()
+    give_clue(states, 0, RANK_CLUE, 5, 2)
+    give_clue(states, 0, COLOR_CLUE, 1, 1)
+    other_states = get_states()
+    give_clue(other_states, 0, COLOR_CLUE, 1, 1)
+    give_clue(other_states, 0, RANK_CLUE, 5, 2)
+    check_eq(hasher.hash(states[0]), hasher.hash(other_states[0]))
+
+    # but not some other clue
+    third_states = get_states()
+    give_clue(third_states, 0, COLOR_CLUE, 1, 1)
+    give_clue(third_states, 0, RANK_CLUE, 1, 2)
+    third_states[0].turn = states[0].turn
+    assert hasher.hash(third_states[0]) != hasher.hash(states[0])
+
+
+def get_full_hash(hasher: ZobristHasher, state: GameState) -> int:
+    fresh = state.fork()
+    fresh.zobrist_hash = None
+    return hasher.hash(fresh)
+
+
+def test_handlers_keep_hash_up_to_date():
+    hasher = ZobristHasher("No Variant")
+    states = get_states()
+    alice = states[0]
+    before = hasher.hash(alice)
+    check_eq(hasher.num_full_hashes, 1)
+
+    # a 5 clue to Cathy, a play and a discard are folded in by the handlers,
+    # and agree with hashing the result from scratch
+    give_clue(states, 0, RANK_CLUE, 5, 2)
+    play_draw(states, 10, 15, 0, 2)
+    discard_draw(states, 4, 16, 1, 3)
+    after = hasher.hash(alice)
+    assert after != before
+    check_eq(hasher.num_full_hashes, 1)
+    check_eq(get_full_hash(hasher, alice), after)
+
+    # forks carry the running hash along, and undo puts it back
+    fork = alice.fork()
+    check_eq(hasher.hash(fork), after)
+    fork.apply_clue(1, 2, COLOR_CLUE, 2, [fork.hands[2][0].order])
+    check_eq(hasher.hash(fork), get_full_hash(hasher, fork))
+    fork.undo()
+    check_eq(hasher.hash(fork), after)
+    check_eq(hasher.num_full_hashes, 3)
+
+
+def test_hash_follows_apply_and_undo():
+    keys = get_zobrist_keys("No Variant")
+    for cls in [
+        GameState,
+        HGroupGameState,
+        RefSieveGameState,
+        ReactorGameState,
+        EncoderV1GameState,
+        EncoderV2GameState,
+    ]:
+        np.random.seed(0)
+        deck = get_random_deck("No Variant")
+        state = create_game_states(3, "No Variant", cls, deck=list(deck))[1]
+        ZobristHasher("No Variant").hash(state)
+        try:
+            apply_random_actions(state, deck, 12, 0, [])
+        except Exception:
+            pass
+        check_eq(state.zobrist_hash, keys.get_running_hash(state))
+        while len(state.journal):
+            state.undo()
+            check_eq(state.zobrist_hash, keys.get_running_hash(state))
+
+
+
+def test_hash_follows_superpositions():
+    # Encoder V1 rewrites our candidates when a card a superposition waits on
+    # is discarded or played
+    variant_name = "Omni (5 Suits)"
+    hand_strs = [
+        ["r2", "y2", "g2", "o2"],
+        ["r3", "y3", "g3", "o3"],
+        ["r4", "y4", "g4", "o4"],
+        ["r1", "y1", "g1", "o5"],
+        ["r1", "g1", "y1", "o1"],
+    ]
+    states = construct_test_state(variant_name, hand_strs, EncoderV1GameState)
+    hasher = ZobristHasher(variant_name)
+    for state in states.values():
+        hasher.hash(state)
+    give_hat_clue(states, 0)
+    give_hat_clue(states, 1)
+    give_hat_clue(states, 2)
+    keys = get_zobrist_keys(variant_name)
+    discard(states, 15)
+    check_eq(states[4].superpositions[19].unexpected_trash, 1)
+    play(states, 14)
+    check_eq(states[3].superpositions[13].unexpected_trash, 1)
+    for state in states.values():
+        check_eq(state.zobrist_hash, keys.get_running_hash(state))
+
+
+def test_position_cache():
+    states = create_game_states(4, "No Variant", EncoderV2GameState)
+    alice = states[0]
+    cache = PositionCache(ZobristHasher("No Variant"), max_size=2)
+    legal_clues = cache.get(alice, lambda x: x.get_legal_clues())
+    check_eq(cache.get(alice.fork(), lambda x: x.get_legal_clues()), legal_clues)
+    check_eq((cache.num_hits, cache.num_misses), (1, 1))
+
+    # convention state outside the hash keeps results apart
+    cache.get(alice, lambda x: x.get_legal_clues(), extra="other")
+    check_eq((cache.num_hits, cache.num_misses), (1, 2))
+
+    # least recently used entries are dropped
+    give_clue(states, 1, RANK_CLUE, 1, 2)
+    cache.get(alice, lambda x: x.get_legal_clues())
+    check_eq(len(cache.entries), 2)
+
+
+def test_all():
+    t0 = dt.datetime.now()
+    test_hash_is_deterministic()
+    test_hash_covers_public_state()
+    test_transpositions_hash_equal()
+    test_handlers_keep_hash_up_to_date()
+    test_hash_follows_apply_and_undo()
+    test_hash_follows_superpositions()
+    test_position_cache()
+    t1 = dt.datetime.now()
+    print(f"All tests passed in {(t1 - t0).total_seconds():.2f}s!")
+
+
+if __name__ == "__main__":
+    test_all()
@@ -0,0 +1,153 @@
+from collections import OrderedDict
+import functools
+from typing import Callable, Hashable, List, Set, Tuple, TypeVar
+
+import numpy as np
+
+from constants import MAX_CLUE_NUM
+from game_state import Card, GameState, get_all_cards_with_multiplicity
+from sampler import get_identities, get_identity_to_index
+
+# Same seed everywhere, so hashes of one variant agree between hashers
+ZOBRIST_SEED = 20000
+MAX_PLAYERS = 6
+MAX_BOMBS = 3
+# kinds of per-card sets, for ZobristKeys.candidate_keys
+CANDIDATES = 0
+POSSIBILITIES = 1
+
+T = TypeVar("T")
+
+
+def get_keys(rng: np.random.Generator, *shape: int) -> List:
+    return rng.integers(0, 2**64, size=shape, dtype=np.uint64).tolist()
+
+
+class ZobristKeys:
+    """The random keys of one variant, and the hashes of the pieces of a
+    GameState built from them. GameState folds these pieces into its running
+    hash as its handlers change them."""
+
+    def __init__(self, variant_name: str):
+        self.identity_to_index = get_identity_to_index(variant_name)
+        num_identities = len(get_identities(variant_name))
+        num_suits = len({suit for suit, _ in self.identity_to_index})
+        num_orders = len(get_all_cards_with_multiplicity(variant_name))
+        max_copies = max(
+            get_all_cards_with_multiplicity(variant_name).count(x) for x in self.identity_to_index
+        )
+
+        rng = np.random.default_rng(ZOBRIST_SEED)
+        self.stack_keys = get_keys(rng, num_suits, 7)
+        self.discard_keys = get_keys(rng, num_identities, max_copies + 1)
+        self.clue_token_keys = get_keys(rng, MAX_CLUE_NUM + 1)
+        self.bomb_keys = get_keys(rng, MAX_BOMBS + 1)
+        self.player_keys = get_keys(rng, 2, MAX_PLAYERS)
+        # the last identity index stands for a card we can't see
+        self.card_keys = get_keys(rng, MAX_PLAYERS, num_orders, num_identities + 1)
+        self.candidate_keys = get_keys(rng, 2, num_orders, num_identities)
+        self.clued_keys = get_keys(rng, num_orders)
+
+    def get_set_hash(self, kind: int, order: int, identities: Set[Tuple[int, int]]) -> int:
+        keys = self.candidate_keys[kind][order]
+        value = 0
+        for identity in identities:
+            value ^= keys[self.identity_to_index[identity]]
+        return value
+
+    def get_discard_hash(self, identity: Tuple[int, int], num: int) -> int:
+        return self.discard_keys[self.identity_to_index[identity]][num] if num else 0
+
+    def get_card_hash(self, state: GameState, player_index: int, i: int) -> int:
+        """The i-th card of player_index's hand: what it is as far as the state
+        can see, whether it is clued, and its candidates and possibilities."""
+        card: Card = state.hands[player_index][i]
+        if card.suit_index == -1:
+            value = self.card_keys[player_index][card.order][len(self.identity_to_index)]
+        else:
+            value = self.card_keys[player_index][card.order][self.identity_to_index[card.to_tuple()]]
+        if state.is_clued(card.order):
+            value ^= self.clued_keys[card.order]
+        value ^= self.get_set_hash(CANDIDATES, card.order, state.all_candidates_list[player_index][i])
+        value ^= self.get_set_hash(POSSIBILITIES, card.order, state.all_possibilities_list[player_index][i])
+        return value
+
+    def get_running_hash(self, state: GameState) -> int:
+        """What GameState.zobrist_hash holds: the stacks, discards and every
+        card in every hand."""
+        value = 0
+        for suit, stack in enumerate(state.stacks):
+            value ^= self.stack_keys[suit][stack]
+        for identity, num in state.discards.items():
+            value ^= self.get_discard_hash(identity, num)
+        for player_index, hand in state.hands.items():
+            for i in range(len(hand)):
+                value ^= self.get_card_hash(state, player_index, i)
+        return value
+
+
+@functools.lru_cache(maxsize=None)
+def get_zobrist_keys(variant_name: str) -> ZobristKeys:
+    return ZobristKeys(variant_name)
+
+
+class ZobristHasher:
+    """64-bit Zobrist hashes of GameStates of one variant: stacks, discards,
+    clue tokens, strikes, whose turn it is, hand contents (as seen from the
+    state's point of view), which cards are clued and the candidates and
+    possibilities of every card.
+
+    The first hash of a state works out everything but the clue tokens,
+    strikes and seats over the whole state and stores it as the state's
+    running hash (GameState.zobrist_hash). From then on the handlers XOR in
+    whatever they change, undo() puts back the value from before the action,
+    and forks carry it along, so hashing is constant time. The rest is folded
+    in on each call, since the client assigns clue tokens and strikes straight
+    from the server's messages.
+    """
+
+    def __init__(self, variant_name: str):
+        self.variant_name = variant_name
+        self.keys = get_zobrist_keys(variant_name)
+        self.num_full_hashes = 0
+
+    def get_public_hash(self, state: GameState) -> int:
+        keys = self.keys
+        value = keys.clue_token_keys[state.clue_tokens] ^ keys.bomb_keys[min(state.bombs, MAX_BOMBS)]
+        value ^= keys.player_keys[0][state.current_player_index]
+        value ^= keys.player_keys[1][state.our_player_index]
+        return value
+
+    def hash(self, state: GameState) -> int:
+        if state.zobrist_hash is None:
+            state.zobrist_hash = self.keys.get_running_hash(state)
+            self.num_full_hashes += 1
+        return state.zobrist_hash ^ self.get_public_hash(state)
+
+
+class PositionCache:
+    """Results of an expensive query memoized by position, for positions that
+    recur in search and self-play. Queries that depend on convention state the
+    hash does not cover (queues, hat clued orders, ...) must pass it in as
+    `extra`. Least recently used entries go first."""
+
+    def __init__(self, hasher: ZobristHasher, max_size: int = 4096):
+        self.hasher = hasher
+        self.max_size = max_size
+        self.entries: "OrderedDict[Tuple[int, Hashable], object]" = OrderedDict()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def get(self, state: GameState, compute: Callable[[GameState], T], extra: Hashable = None) -> T:
+        key = (self.hasher.hash(state), extra)
+        if key in self.entries:
+            self.num_hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.num_misses += 1
+        result = compute(state)
+        self.entries[key] = result
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return result